@@ -0,0 +1,146 @@
+"""Remembers where images that were uploaded to Discord ended up, so that they can be shown again without uploading them again."""
+from typing import Awaitable, Callable, Optional, Union
+from pathlib import Path
+import collections
+import io
+import os
+import time
+import urllib.parse
+import logging, coloredlogs
+import discord
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+ImageData = Union[bytes, Path]
+
+
+def url_expiry(url: str) -> Optional[float]:
+	"""Get the time that a Discord CDN URL expires at, from its signed `ex` parameter.
+
+	:returns: The expiry as a unix timestamp, or `None` if the URL doesn't say.
+	"""
+	ex = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get("ex")
+	try:
+		return float(int(ex[0], 16)) if ex else None
+	except ValueError:
+		return None
+
+
+class AttachmentCache:
+	"""The CDN URLs of images that have been uploaded as attachments, by a key that identifies the image.
+
+	The image of an embed can point at an attachment of an earlier message, so an image that was uploaded once doesn't have to be uploaded again. URLs are dropped once they are about to expire, which is either when their signature says they do, or `max_age` seconds after they were uploaded. The image is then uploaded again, and its new URL is remembered.
+
+	:param max_age: The longest time that a URL is used for, in seconds.
+	:param max_entries: The most URLs to remember. The least recently used ones are forgotten first.
+	:param registry: The registry to count cache hits and uploads in.
+	"""
+
+	# refresh URLs this many seconds before they expire, so they don't expire while a message is being sent
+	refresh_margin = 600
+
+	def __init__(
+		self,
+		max_age: float = config.ATTACHMENT_URL_MAX_AGE,
+		max_entries: int = 4096,
+		registry: metrics.Registry = metrics.registry
+	):
+		self.max_age = max_age
+		self.max_entries = max_entries
+		self._urls: collections.OrderedDict[str,
+											tuple[str, float]] = collections.OrderedDict()
+		self.hits = registry.counter(
+			"attachment_cache_total",
+			"Images shown in embeds, by whether an earlier upload could be reused.",
+			result="hit"
+		)
+		self.misses = registry.counter(
+			"attachment_cache_total",
+			"Images shown in embeds, by whether an earlier upload could be reused.",
+			result="miss"
+		)
+		self.expired = registry.counter(
+			"attachment_cache_expired_total", "Uploaded images whose URL expired."
+		)
+		self.uploaded_bytes = registry.counter(
+			"attachment_uploaded_bytes_total", "Bytes of images uploaded to Discord."
+		)
+
+	def __len__(self) -> int:
+		return len(self._urls)
+
+	def get(self, key: str) -> Optional[str]:
+		"""Get the URL of an image, if it was uploaded before and the URL is still valid."""
+		entry = self._urls.get(key)
+		if entry is None:
+			return None
+		url, expires_at = entry
+		if time.time() > expires_at - self.refresh_margin:
+			self.expired.inc()
+			del self._urls[key]
+			return None
+		self._urls.move_to_end(key)
+		return url
+
+	def put(self, key: str, url: str):
+		"""Remember the URL that an image was uploaded to."""
+		expires_at = time.time() + self.max_age
+		signed_expiry = url_expiry(url)
+		if signed_expiry is not None:
+			expires_at = min(expires_at, signed_expiry)
+		self._urls[key] = (url, expires_at)
+		self._urls.move_to_end(key)
+		while len(self._urls) > self.max_entries:
+			self._urls.popitem(last=False)
+
+	def forget(self, key: str):
+		"""Forget the URL of an image, so that it is uploaded again the next time it is sent."""
+		self._urls.pop(key, None)
+
+	async def send(
+		self,
+		channel: discord.abc.Messageable,
+		key: str,
+		image: Union[ImageData, Callable[[], Awaitable[ImageData]]],
+		filename: str,
+		embed: discord.Embed,
+		content: Optional[str] = None
+	) -> discord.Message:
+		"""Send a message with an image as the image of its embed, uploading the image only if it hasn't been uploaded before.
+
+		Discord accepts any URL as the image of an embed, so sending can't tell whether a reused URL still works. That is why URLs are only reused until they expire, see :meth:`get`.
+
+		:param key: Identifies the image. Images with the same key must look the same.
+		:param image: The image, as the path to a file or its encoded bytes. It can also be an async function that returns one of those, which is only called if the image needs to be uploaded.
+		:param filename: The name to upload the image as.
+		"""
+		url = self.get(key)
+		if url is not None:
+			self.hits.inc()
+			embed.set_image(url=url)
+			return await channel.send(content, embed=embed)
+		self.misses.inc()
+		if callable(image):
+			image = await image()
+		if isinstance(image, bytes):
+			size = len(image)
+			file = discord.File(io.BytesIO(image), filename=filename)
+		else:
+			size = os.path.getsize(image)
+			file = discord.File(image, filename=filename)
+		embed.set_image(url=f"attachment://{filename}")
+		message = await channel.send(content, embed=embed, file=file)
+		self.uploaded_bytes.inc(size)
+		if message.attachments:
+			self.put(key, message.attachments[0].url)
+		return message
+
+
+cache = AttachmentCache()
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -1,21 +1,503 @@
-from typing import Generator, Iterable, Sequence, Union, Optional, Any
+from typing import Awaitable, Callable, Generator, Iterable, Sequence, Union, Optional, Any
 from pkmntypes import *
+import asyncio
+import random
+import time
 import aiohttp
-import jsonpickle
 from pkmntypes import *
 from turns import *
 import os
+import codec
 import config
+import metrics
 import logging, coloredlogs
 
 log = logging.getLogger(__name__)
 coloredlogs.install(level='DEBUG', logger=log)
 
 BASE_URL = config.BATTLE_API_BASE_URL
+BASE_URLS = config.BATTLE_API_BASE_URLS
 
 __exclude_exports__ = set(dir())
 
 
+class BattleApiError(Exception):
+	"""A request to the battle API failed.
+
+	:param message: What went wrong.
+	:param status: The HTTP status of the response, if there was one.
+	:param retryable: Whether sending the request again might succeed.
+	:param sent: Whether the request might have reached the battle API. Requests that weren't sent can always be sent again, even if they aren't idempotent.
+	"""
+
+	def __init__(
+		self,
+		message: str,
+		status: Optional[int] = None,
+		retryable: bool = False,
+		sent: bool = True
+	):
+		super().__init__(message)
+		self.status = status
+		self.retryable = retryable
+		self.sent = sent
+
+
+class CircuitBreaker:
+	"""Stops placing new work on a backend that keeps failing, so that it doesn't pile up there.
+
+	After `threshold` failures in a row, the breaker opens for `cooldown` seconds. While it's open, new battles and other requests that aren't pinned to the backend are sent to other backends, see :meth:`BattleApiClient.least_loaded`. The first success closes the breaker, and any failure opens it for another cooldown.
+
+	:param threshold: The number of consecutive failures that open the breaker.
+	:param cooldown: How long the breaker stays open, in seconds.
+	"""
+
+	def __init__(
+		self,
+		threshold: int = config.BATTLE_API_BREAKER_THRESHOLD,
+		cooldown: float = config.BATTLE_API_BREAKER_COOLDOWN
+	):
+		self.threshold = threshold
+		self.cooldown = cooldown
+		self.failures = 0
+		self.opened_at: Optional[float] = None
+
+	@property
+	def is_open(self) -> bool:
+		"""Whether new work is currently kept away from the backend."""
+		return self.opened_at is not None and time.monotonic(
+		) - self.opened_at < self.cooldown
+
+	def record_success(self):
+		"""Record a successful request."""
+		self.failures = 0
+		self.opened_at = None
+
+	def record_failure(self):
+		"""Record a failed request, opening the breaker if there have been too many."""
+		self.failures += 1
+		if self.failures >= self.threshold:
+			if self.opened_at is None:
+				log.warning(f"opening circuit breaker after {self.failures} failures")
+			self.opened_at = time.monotonic()
+
+
+class Backend:
+	"""A single battle API server that battles can be placed on.
+
+	:param url: The URL that the battle API server is located at.
+	"""
+
+	def __init__(self, url: str):
+		self.url = url
+		self.in_flight = 0
+		self.breaker = CircuitBreaker()
+
+	def __repr__(self) -> str:
+		return f"Backend<{self.url} in_flight={self.in_flight}>"
+
+
+class EndpointMetrics:
+	"""The metrics that are recorded for a single battle API endpoint.
+
+	They are labeled with the endpoint's path, and live in :data:`metrics.registry` by default, so they are exported along with everything else.
+
+	:param path: The path of the endpoint, eg. `/battle/context`.
+	:param registry: The registry to record the metrics in.
+	"""
+
+	def __init__(self, path: str, registry: metrics.Registry = metrics.registry):
+		self.path = path
+		self.requests = registry.counter(
+			"battleapi_requests_total", "Requests sent to the battle API.", endpoint=path
+		)
+		self.errors = registry.counter(
+			"battleapi_errors_total",
+			"Battle API requests that failed or got an error status.",
+			endpoint=path
+		)
+		self.latency = registry.histogram(
+			"battleapi_request_seconds", "Battle API request latency.", endpoint=path
+		)
+		self.sent_bytes = registry.counter(
+			"battleapi_sent_bytes_total",
+			"Request body bytes sent to the battle API.",
+			endpoint=path
+		)
+		self.received_bytes = registry.counter(
+			"battleapi_received_bytes_total",
+			"Response body bytes received from the battle API.",
+			endpoint=path
+		)
+		self.in_flight = registry.gauge(
+			"battleapi_in_flight",
+			"Battle API requests waiting for a response.",
+			endpoint=path
+		)
+		self.timeouts = registry.counter(
+			"battleapi_timeouts_total",
+			"Battle API requests that timed out.",
+			endpoint=path
+		)
+		self.hedges = registry.counter(
+			"battleapi_hedges_total",
+			"Extra battle API requests sent because the first one was slow.",
+			endpoint=path
+		)
+		self.retries = registry.counter(
+			"battleapi_retries_total",
+			"Battle API requests sent again after failing.",
+			endpoint=path
+		)
+
+	def summary(self) -> dict[str, Any]:
+		"""Get the current values of the metrics."""
+		return {
+			"requests": self.requests.value,
+			"errors": self.errors.value,
+			"timeouts": self.timeouts.value,
+			"hedges": self.hedges.value,
+			"retries": self.retries.value,
+			"in_flight": self.in_flight.value,
+			"sent_bytes": self.sent_bytes.value,
+			"received_bytes": self.received_bytes.value,
+			"p50": self.latency.quantile(0.5),
+			"p95": self.latency.quantile(0.95),
+			"p99": self.latency.quantile(0.99),
+		}
+
+
+class ContextCache:
+	"""Single-flight cache of battle contexts.
+
+	A battle's contexts don't change until the next round is simulated, so every request for the same target in the same round can share one HTTP call and one parsed :class:`BattleContext`. Requests that arrive while the context is still being fetched wait for that fetch instead of starting another. The cached contexts are shared between callers, so they must not be modified.
+
+	:param registry: The registry to count cache hits and misses in.
+	"""
+
+	def __init__(self, registry: metrics.Registry = metrics.registry):
+		self._rounds: dict[int, int] = {}
+		self._entries: dict[tuple[int, int, int], asyncio.Future[BattleContext]] = {}
+		self.hits = registry.counter(
+			"battleapi_context_cache_total",
+			"Battle context lookups, by whether they were served from the cache.",
+			result="hit"
+		)
+		self.misses = registry.counter(
+			"battleapi_context_cache_total",
+			"Battle context lookups, by whether they were served from the cache.",
+			result="miss"
+		)
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def round(self, battle_id: int) -> int:
+		"""Get the number of rounds that have been simulated in the battle so far."""
+		return self._rounds.get(battle_id, 0)
+
+	async def get(
+		self, battle_id: int, target: int, fetch: Callable[[], Awaitable[BattleContext]]
+	) -> BattleContext:
+		"""Get the context for `target` in the current round of the battle.
+
+		:param fetch: Fetches the context from the battle API, if it isn't cached yet.
+		"""
+		key = (battle_id, target, self.round(battle_id))
+		entry = self._entries.get(key)
+		if entry is None or entry.get_loop() is not asyncio.get_event_loop():
+			self.misses.inc()
+			entry = asyncio.ensure_future(fetch())
+			entry.add_done_callback(lambda f: self._discard_failed(key, f))
+			self._entries[key] = entry
+		else:
+			self.hits.inc()
+		# shielded, so that a caller giving up doesn't cancel the fetch for everyone else
+		return await asyncio.shield(entry)
+
+	def _discard_failed(
+		self, key: tuple[int, int, int], entry: asyncio.Future[BattleContext]
+	):
+		if (entry.cancelled()
+			or entry.exception() is not None) and self._entries.get(key) is entry:
+			del self._entries[key]
+
+	def advance(self, battle_id: int):
+		"""Invalidate the battle's contexts, because a round has been simulated."""
+		self._rounds[battle_id] = self.round(battle_id) + 1
+		self._drop(battle_id)
+
+	def forget(self, battle_id: int):
+		"""Drop everything that is known about the battle."""
+		self._rounds.pop(battle_id, None)
+		self._drop(battle_id)
+
+	def _drop(self, battle_id: int):
+		for key in [k for k in self._entries if k[0] == battle_id]:
+			del self._entries[key]
+
+
+class BattleApiClient:
+	"""A long-lived HTTP client for the battle API.
+
+	Connections to the battle API are pooled and kept alive between requests, so that each round of a battle doesn't have to pay for connection setup.
+
+	The battle API can be sharded over several backends. New battles are placed on the backend with the fewest requests in flight, and stay pinned to it for the rest of the battle. The backend is encoded in the battle ID that the client hands out, `backend_battle_id * len(backends) + backend_index`, so no extra bookkeeping is needed to route requests. With a single backend, battle IDs are the same as the ones the battle API uses.
+
+	Battle contexts are cached for the rest of the round they were fetched in, see :class:`ContextCache`.
+
+	Latency, errors, bytes sent and received, and requests in flight are recorded for each endpoint, see :meth:`stats` and :mod:`metrics`.
+
+	The recorded latencies are used to keep the tail of slow requests short:
+
+	- Each idempotent request times out after a multiple of its endpoint's p99 latency, see :meth:`timeout`. Other requests can't be retried once they were sent, so they get `max_timeout` instead of failing a battle because of one slow response.
+	- Idempotent requests are hedged. If there is no response after the endpoint's p95 latency, the same request is sent again, and whichever response arrives first is used.
+	- Failed idempotent requests are retried with jittered exponential backoff. Other requests are only retried if they were never sent, because every circuit breaker was open or no connection could be made. They are never retried after a timeout or an error response, because the battle API might have acted on them already.
+	- Each backend has a :class:`CircuitBreaker`, so new battles aren't placed on a backend that keeps failing. Requests about battles that are already pinned to it are still sent there, since no other backend knows the battle. Requests that aren't pinned fail fast only if every backend's breaker is open.
+
+	:param base_urls: The URLs that the battle API backends are located at.
+	:param limit_per_host: The maximum number of simultaneous connections to each backend. 0 means no limit.
+	:param registry: The registry to record metrics in. The timeouts and hedging adapt to the latencies recorded in it.
+	"""
+
+	def __init__(
+		self,
+		base_urls: list[str],
+		limit_per_host: int = 0,
+		registry: metrics.Registry = metrics.registry
+	):
+		assert len(base_urls) > 0, "at least 1 battle api backend is required"
+		self.backends = [Backend(url) for url in base_urls]
+		self.limit_per_host = limit_per_host
+		self.registry = registry
+		self._session: Optional[aiohttp.ClientSession] = None
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._next_backend = 0
+		self._endpoint_metrics: dict[str, EndpointMetrics] = {}
+		self.min_timeout = config.BATTLE_API_TIMEOUT_MIN
+		self.max_timeout = config.BATTLE_API_TIMEOUT_MAX
+		self.timeout_multiplier = config.BATTLE_API_TIMEOUT_MULTIPLIER
+		self.retries = config.BATTLE_API_RETRIES
+		self.retry_backoff = config.BATTLE_API_RETRY_BACKOFF
+		# the number of latency samples needed before the timeout and hedging adapt to them
+		self.min_samples = 20
+		self.contexts = ContextCache(registry)
+
+	def session(self) -> aiohttp.ClientSession:
+		"""Get the underlying session, creating it if it's not open yet.
+
+		A session is bound to the event loop it was created in, so a new one is created if the running loop has changed.
+		"""
+		loop = asyncio.get_event_loop()
+		if self._session is None or self._session.closed or self._loop is not loop:
+			log.debug(f"opening battle api session: {self.backends}")
+			connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host)
+			self._session = aiohttp.ClientSession(connector=connector)
+			self._loop = loop
+		return self._session
+
+	async def open(self):
+		"""Open the session ahead of time, so the first battle doesn't have to."""
+		self.session()
+
+	async def close(self):
+		"""Close the session and all of its pooled connections."""
+		if self._session is not None and not self._session.closed:
+			log.debug("closing battle api session")
+			await self._session.close()
+		self._session = None
+		self._loop = None
+
+	def least_loaded(self) -> Backend:
+		"""Get the backend with the fewest requests in flight. Ties are broken round robin. Backends with an open circuit breaker are avoided, unless all of them are open."""
+		n = len(self.backends)
+		rotated = [self.backends[(self._next_backend + i) % n] for i in range(n)]
+		healthy = [b for b in rotated if not b.breaker.is_open]
+		backend = min(healthy or rotated, key=lambda b: b.in_flight)
+		self._next_backend = (self.backends.index(backend) + 1) % n
+		return backend
+
+	def battle_id(self, backend: Backend, backend_battle_id: int) -> int:
+		"""Get the battle ID to hand out for a battle that was created on `backend`."""
+		return backend_battle_id * len(self.backends) + self.backends.index(backend)
+
+	def route(self, battle_id: int) -> tuple[Backend, int]:
+		"""Get the backend that a battle is pinned to.
+
+		:returns: The backend, and the ID that the backend knows the battle by.
+		"""
+		n = len(self.backends)
+		return self.backends[battle_id % n], battle_id // n
+
+	def endpoint_metrics(self, path: str) -> EndpointMetrics:
+		"""Get the metrics that are recorded for requests to the endpoint at `path`."""
+		if path not in self._endpoint_metrics:
+			self._endpoint_metrics[path] = EndpointMetrics(path, self.registry)
+		return self._endpoint_metrics[path]
+
+	def stats(self) -> dict[str, dict[str, Any]]:
+		"""Get a summary of the requests that have been made to each endpoint so far."""
+		return {path: m.summary() for path, m in self._endpoint_metrics.items()}
+
+	def timeout(self, path: str) -> float:
+		"""Get how long to wait for a response from the endpoint at `path`, in seconds.
+
+		This is a multiple of the endpoint's p99 latency, clamped between `min_timeout` and `max_timeout`. Until enough requests have been made to know the endpoint's latency, `max_timeout` is used. Only idempotent requests use it, see :meth:`request`.
+		"""
+		latency = self.endpoint_metrics(path).latency
+		p99 = latency.quantile(0.99)
+		if p99 is None or len(latency.recent) < self.min_samples:
+			return self.max_timeout
+		return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+	def hedge_delay(self, path: str) -> Optional[float]:
+		"""Get how long to wait for a response from the endpoint at `path` before sending a hedged request, in seconds.
+
+		:returns: The endpoint's p95 latency, or `None` if not enough requests have been made to know it yet.
+		"""
+		latency = self.endpoint_metrics(path).latency
+		if len(latency.recent) < self.min_samples:
+			return None
+		return latency.quantile(0.95)
+
+	async def request(
+		self,
+		method: str,
+		path: str,
+		params: Optional[dict[str, Any]] = None,
+		data: Optional[Union[str, bytes]] = None,
+		battle_id: Optional[int] = None,
+		backend: Optional[Backend] = None,
+		idempotent: bool = False
+	) -> Any:
+		"""Send a request to the battle API.
+
+		:param method: The HTTP method to use.
+		:param path: The path of the endpoint, eg. `/battle/new`.
+		:param battle_id: The battle that this request is about. The request is sent to the battle's backend, with the battle's `id` added to the query parameters.
+		:param backend: The backend to send the request to. By default, the least loaded backend is used.
+		:param data: The request body. Use :func:`codec.dumps` to encode it.
+		:param idempotent: Whether sending the request more than once is harmless. Idempotent requests are hedged, retried, and time out after :meth:`timeout`. Other requests are only retried if they were never sent, and wait up to `max_timeout`.
+		:returns: The decoded JSON response body, or `None` if the body is empty.
+		:raises BattleApiError: If the request failed, even after retrying.
+		"""
+		if battle_id is not None:
+			backend, backend_battle_id = self.route(battle_id)
+			params = {"id": backend_battle_id, **(params or {})}
+		pinned = backend
+		timeout = self.timeout(path) if idempotent else self.max_timeout
+
+		async def _send() -> Any:
+			if pinned is not None:
+				return await self._send(method, path, params, data, pinned, timeout)
+			target = self.least_loaded()
+			if target.breaker.is_open:
+				# least_loaded only picks an open breaker when all of them are open
+				raise BattleApiError(
+					f"{method} {target.url}{path}: every circuit breaker is open",
+					retryable=True,
+					sent=False
+				)
+			return await self._send(method, path, params, data, target, timeout)
+
+		attempts = 1 + self.retries
+		for attempt in range(attempts):
+			try:
+				if idempotent:
+					return await self._hedged(_send, path)
+				return await _send()
+			except BattleApiError as e:
+				# the battle api might have acted on a request that was sent, so only idempotent requests can be sent again
+				safe = idempotent or not e.sent
+				if not (e.retryable and safe) or attempt == attempts - 1:
+					raise
+				delay = random.uniform(0, self.retry_backoff * 2**attempt)
+				log.warning(f"retrying {method} {path} in {delay:.2f}s: {e}")
+				self.endpoint_metrics(path).retries.inc()
+				await asyncio.sleep(delay)
+
+	async def _hedged(self, send: Callable[[], Awaitable[Any]], path: str) -> Any:
+		pending = {asyncio.ensure_future(send())}
+		try:
+			done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(path))
+			if len(done) == 0:
+				self.endpoint_metrics(path).hedges.inc()
+				pending.add(asyncio.ensure_future(send()))
+			while True:
+				# the first success wins, and a failure only counts once there's nothing left to wait for
+				for task in done:
+					if task.exception() is None or len(pending) == 0:
+						return task.result()
+				done, pending = await asyncio.wait(
+					pending, return_when=asyncio.FIRST_COMPLETED
+				)
+		finally:
+			for task in pending:
+				task.cancel()
+
+	async def _send(
+		self,
+		method: str,
+		path: str,
+		params: Optional[dict[str, Any]],
+		data: Optional[Union[str, bytes]],
+		backend: Backend,
+		timeout_seconds: float,
+	) -> Any:
+		url = f"{backend.url}{path}"
+		stats = self.endpoint_metrics(path)
+		stats.requests.inc()
+		if data is not None:
+			stats.sent_bytes.inc(len(data if isinstance(data, bytes) else data.encode()))
+		timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+		backend.in_flight += 1
+		stats.in_flight.inc()
+		start = time.perf_counter()
+		try:
+			async with self.session().request(
+				method, url, params=params, data=data, timeout=timeout
+			) as resp:
+				body = await resp.read()
+				log.debug(f"{method} {url}: {resp.status}")
+			stats.latency.observe(time.perf_counter() - start)
+		except asyncio.TimeoutError as e:
+			stats.latency.observe(time.perf_counter() - start)
+			stats.errors.inc()
+			stats.timeouts.inc()
+			backend.breaker.record_failure()
+			raise BattleApiError(
+				f"{method} {url}: timed out after {timeout.total:.2f}s", retryable=True
+			) from e
+		except aiohttp.ClientError as e:
+			stats.errors.inc()
+			backend.breaker.record_failure()
+			# a request that couldn't connect never reached the battle api, so it's always safe to send again
+			raise BattleApiError(
+				f"{method} {url}: {e}",
+				retryable=True,
+				sent=not isinstance(e, aiohttp.ClientConnectorError)
+			) from e
+		finally:
+			stats.in_flight.dec()
+			backend.in_flight -= 1
+		stats.received_bytes.inc(len(body))
+		if resp.status >= 400:
+			stats.errors.inc()
+			if resp.status >= 500:
+				backend.breaker.record_failure()
+			else:
+				backend.breaker.record_success()
+			raise BattleApiError(
+				f"{method} {url}: {resp.status} {body[:200]!r}",
+				status=resp.status,
+				retryable=resp.status >= 500
+			)
+		backend.breaker.record_success()
+		if not body:
+			return None
+		return codec.loads(body)
+
+
 class BattleRoundResults:
 	"""Results of a single round of battle."""
 
@@ -39,11 +521,29 @@ async def generate_pokemon(
 		params["level"] = level
 	if moves:
 		params["moves"] = ','.join([str(m) for m in moves])
-	async with aiohttp.ClientSession() as session:
-		url = f"{BASE_URL}/pokedex/generate"
-		async with session.get(url, params=params) as resp:
-			result = await resp.json()
-			return Pokemon(**result)
+	result = await client.request(
+		"GET", "/pokedex/generate", params=params, idempotent=True
+	)
+	return Pokemon(**result)
+
+
+async def generate_many(
+	specs: Iterable[dict[str, Any]],
+	limit: int = config.BATTLE_API_GENERATE_CONCURRENCY
+) -> list[Pokemon]:
+	"""Get several randomly generated pokemon from the API concurrently.
+
+	:param specs: The keyword arguments to give :func:`generate_pokemon` for each pokemon.
+	:param limit: The maximum number of pokemon to generate at the same time.
+	:returns: The generated pokemon, in the same order as `specs`.
+	"""
+	semaphore = asyncio.Semaphore(limit)
+
+	async def _do(spec: dict[str, Any]) -> Pokemon:
+		async with semaphore:
+			return await generate_pokemon(**spec)
+
+	return list(await asyncio.gather(*[_do(spec) for spec in specs]))
 
 
 async def create_battle(teams: list[Team]) -> dict[str, Any]:
@@ -56,41 +556,54 @@ async def create_battle(teams: list[Team]) -> dict[str, Any]:
 	for team in teams:
 		assert isinstance(team, Team), f"each team must be type `Team`, not {type(team)}"
 	log.debug("creating battle")
-	async with aiohttp.ClientSession() as session:
-		async with session.post(
-			f"{BASE_URL}/battle/new",
-			data=jsonpickle.encode({"teams": teams}, unpicklable=False)
-		) as resp:
-			log.debug(f"battle created: {resp.status}")
-			result = await resp.json(content_type=None)
-			return {
-				"bid": result["BattleId"],
-				"active_pokemon": result["ActivePokemon"],
-			}
+	backend = client.least_loaded()
+	result = await client.request(
+		"POST",
+		"/battle/new",
+		data=codec.dumps({"teams": [codec.encode_team(team) for team in teams]}),
+		backend=backend
+	)
+	bid = client.battle_id(backend, result["BattleId"])
+	# the battle API may have reused the ID of a battle that we still remember
+	client.contexts.forget(bid)
+	return {
+		"bid": bid,
+		"active_pokemon": result["ActivePokemon"],
+	}
 
 
 async def get_battle_context(battle_id: int, target: int) -> BattleContext:
 	"""Get the battle context for a given target.
 
-	:returns: The battle context.
+	Contexts are cached until the next round is simulated, and concurrent requests for the same context share a single request to the battle API.
+
+	:returns: The battle context. It may be shared with other callers, so it must not be modified.
 	"""
-	log.debug(f"getting battle context: battle={battle_id} target={target}")
-	async with aiohttp.ClientSession() as session:
-		async with session.get(
-			f"{BASE_URL}/battle/context?id={battle_id}&target={target}"
-		) as resp:
-			result = await resp.json()
-	return BattleContext(**result)
+
+	async def _fetch() -> BattleContext:
+		log.debug(f"getting battle context: battle={battle_id} target={target}")
+		result = await client.request(
+			"GET",
+			"/battle/context",
+			params={"target": target},
+			battle_id=battle_id,
+			idempotent=True
+		)
+		return BattleContext(**result)
+
+	return await client.contexts.get(battle_id, target, _fetch)
 
 
 async def submit_turn(battle_id: int, target: int, turn: Turn):
 	"""Submit a turn for the given target."""
 	log.debug(f"submitting turn: battle={battle_id} target={target} turn={type(turn)}")
-	async with aiohttp.ClientSession() as session:
-		async with session.post(
-			f"{BASE_URL}/battle/act?id={battle_id}&target={target}", data=turn.toJSON()
-		) as resp:
-			pass
+	await client.request(
+		"POST",
+		"/battle/act",
+		params={"target": target},
+		data=turn.toJSON(),
+		battle_id=battle_id
+	)
 
 
 async def simulate(battle_id: int) -> BattleRoundResults:
@@ -99,9 +612,8 @@ async def simulate(battle_id: int) -> BattleRoundResults:
 	:returns: The results of the round.
 	"""
 	log.debug(f"simulating round: battle={battle_id}")
-	async with aiohttp.ClientSession() as session:
-		async with session.get(f"{BASE_URL}/battle/simulate?id={battle_id}") as resp:
-			result = await resp.json()
+	result = await client.request("GET", "/battle/simulate", battle_id=battle_id)
+	client.contexts.advance(battle_id)
 	return BattleRoundResults(**result)
 
 
@@ -118,11 +630,13 @@ class BattleResults:
 
 async def get_results(battle_id: int) -> BattleResults:
 	"""Get the results of a battle that has finished."""
-	async with aiohttp.ClientSession() as session:
-		async with session.get(f"{BASE_URL}/battle/results?id={battle_id}") as resp:
-			log.debug(f"battle results: {resp.status}")
-			result = await resp.json()
+	result = await client.request(
+		"GET", "/battle/results", battle_id=battle_id, idempotent=True
+	)
+	client.contexts.forget(battle_id)
 	return BattleResults(result["Winner"], result["Parties"])
 
 
+client = BattleApiClient(BASE_URLS, config.BATTLE_API_MAX_CONNECTIONS_PER_HOST)
+
 __all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
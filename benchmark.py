@@ -0,0 +1,353 @@
+"""Benchmarks for rendering battle images, so that changes to the renderer can be compared commit to commit.
+
+Every benchmark renders the same corpus of synthetic battle contexts, generated from a seed with :mod:`fakeapi`, and reports the mean and 95th percentile time per render, the peak memory, and the size of what was rendered. Each benchmark runs in its own process, forked from this one, so that every benchmark starts with the same caches, and so that the peak memory of each one is measured on its own.
+
+Save the results of one commit with `python benchmark.py --json > before.json`, and compare another commit against them with `python benchmark.py --baseline before.json`.
+"""
+from typing import Any, Callable, Optional, Sequence, Union
+from dataclasses import dataclass
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import time
+import logging, coloredlogs
+import PIL
+from PIL import Image
+from pkmntypes import BattleContext, StatusCondition
+import fakeapi
+import silhouettes
+import util
+import visualize
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+Output = Union[bytes, Image.Image]
+
+
+@dataclass(frozen=True)
+class Benchmark:
+	"""Something to render for every battle in the corpus.
+
+	:param inputs: Get the inputs to render from the corpus. Called in the benchmark's process, before anything is timed.
+	:param run: Render one input.
+	"""
+
+	inputs: Callable[[list[BattleContext]], list[Any]]
+	run: Callable[[Any], Output]
+
+
+@dataclass
+class BenchmarkResult:
+	"""How long rendering took, and how much it rendered.
+
+	:param name: The name of the benchmark.
+	:param runs: The number of renders that were timed.
+	:param mean: The mean time per render, in seconds.
+	:param p95: The 95th percentile time per render, in seconds.
+	:param peak_memory: How much the peak resident memory grew while the benchmark ran, in bytes.
+	:param output_bytes: The mean size of what was rendered, in bytes. Images count their decoded size, and encoded images count their encoded size.
+	"""
+
+	name: str
+	runs: int
+	mean: float
+	p95: float
+	peak_memory: int
+	output_bytes: float
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Get the result, suitable for serializing to JSON."""
+		return {
+			"name": self.name,
+			"runs": self.runs,
+			"mean": self.mean,
+			"p95": self.p95,
+			"peak_memory": self.peak_memory,
+			"output_bytes": self.output_bytes,
+		}
+
+
+def make_corpus(size: int = 50, seed: int = 0) -> list[BattleContext]:
+	"""Generate battle contexts to render. The same seed always generates the same contexts.
+
+	Pokemon are picked from the ones that have sprites, with random levels, HP and status conditions.
+	"""
+	rng = random.Random(seed)
+	natdexes = silhouettes.all_natdexes()
+	corpus = []
+	for _ in range(size):
+		teams = [
+			{
+				"parties":
+				[{
+					"pokemon": [fakeapi.generate_pokemon(rng, rng.choice(natdexes))]
+				}]
+			} for _ in range(2)
+		]
+		battle = fakeapi.FakeBattle(teams, rng)
+		for party in battle.parties:
+			pkmn = party[0]
+			pkmn["CurrentHP"] = rng.randint(0, pkmn["Stats"][0])
+			pkmn["StatusEffects"] = int(rng.choice(list(StatusCondition.NonVolatile)))
+		corpus.append(BattleContext(**battle.context(0)))
+	return corpus
+
+
+def _pokemon(corpus: list[BattleContext]) -> list[tuple[visualize.PokemonSnapshot, bool]]:
+	return [
+		(visualize.PokemonSnapshot.from_pokemon(pkmn), is_opponent) for ctx in corpus
+		for pkmn, is_opponent in ((ctx.pokemon, False), (ctx.opponents[0].pokemon, True))
+	]
+
+
+def _encode_png(im: Image.Image) -> bytes:
+	with io.BytesIO() as data:
+		im.save(data, "PNG")
+		return data.getvalue()
+
+
+benchmarks = {
+	"render_info_box":
+	Benchmark(
+		_pokemon,
+		lambda p: visualize.render_info_box(p[0], p[1], size=visualize.info_box_scale)
+	),
+	"visualize_battle":
+	Benchmark(lambda corpus: corpus, visualize.visualize_battle),
+	# every layer is drawn for every frame, like before frames were built out of cached layers
+	"visualize_battle_uncached":
+	Benchmark(
+		lambda corpus: corpus,
+		lambda ctx: visualize.visualize_battle(ctx, visualize.ImageCache(0))
+	),
+	"get_element_type_img":
+	Benchmark(
+		lambda corpus: [
+			t for ctx in corpus for pkmn in (ctx.pokemon, ctx.opponents[0].pokemon)
+			for t in sorted(util.type_to_string(pkmn.Type))
+		], visualize.get_element_type_img
+	),
+	"get_status_condition_img":
+	Benchmark(
+		lambda corpus: [
+			pkmn.StatusEffects for ctx in corpus
+			for pkmn in (ctx.pokemon, ctx.opponents[0].pokemon)
+			if pkmn.StatusEffects.non_volatile != StatusCondition.NonVolatile.none
+		], visualize.get_status_condition_img
+	),
+	# rendered and encoded like silhouettes.build does, without writing to the silhouette cache
+	"silhouette":
+	Benchmark(
+		lambda corpus: [ctx.pokemon.NatDex for ctx in corpus],
+		lambda natdex: _encode_png(silhouettes.render(natdex))
+	),
+	**{
+		f"encode_{name}":
+		Benchmark(
+			lambda corpus: [visualize.visualize_battle(ctx) for ctx in corpus], profile.encode
+		)
+		for name, profile in visualize.output_profiles.items()
+	},
+}
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+	"""Get the `q`th percentile of `samples`, with the nearest-rank method."""
+	ordered = sorted(samples)
+	if not ordered:
+		return 0
+	return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def output_size(output: Output) -> int:
+	"""Get the size of what a benchmark rendered, in bytes."""
+	if isinstance(output, bytes):
+		return len(output)
+	return output.width * output.height * len(output.getbands())
+
+
+def _max_rss() -> int:
+	# in KiB on Linux
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure(
+	benchmark: Benchmark, corpus: list[BattleContext], repeat: int, warmup: int, conn
+):
+	# a forked process starts with a peak equal to the memory it was forked with
+	start_rss = _max_rss()
+	inputs = benchmark.inputs(corpus)
+	times = []
+	sizes = []
+	# each input is rendered several times in a row, like the frames of one battle
+	for x in inputs:
+		for _ in range(warmup):
+			benchmark.run(x)
+		for _ in range(repeat):
+			start = time.perf_counter()
+			output = benchmark.run(x)
+			times.append(time.perf_counter() - start)
+			sizes.append(output_size(output))
+	conn.send((times, sizes, _max_rss() - start_rss))
+	conn.close()
+
+
+def run_benchmark(
+	name: str,
+	corpus: list[BattleContext],
+	repeat: int = 3,
+	warmup: int = 1
+) -> BenchmarkResult:
+	"""Run one benchmark, in a process of its own.
+
+	:param repeat: The number of times to render each input while timing.
+	:param warmup: The number of times to render each input before timing it, to fill caches.
+	"""
+	ctx = multiprocessing.get_context("fork")
+	receiver, sender = ctx.Pipe(duplex=False)
+	process = ctx.Process(
+		target=_measure, args=(benchmarks[name], corpus, repeat, warmup, sender)
+	)
+	process.start()
+	sender.close()
+	try:
+		times, sizes, peak_memory = receiver.recv()
+	except EOFError:
+		raise RuntimeError(f"benchmark {name} failed, see above") from None
+	finally:
+		process.join()
+	return BenchmarkResult(
+		name=name,
+		runs=len(times),
+		mean=sum(times) / len(times) if times else 0,
+		p95=percentile(times, 95),
+		peak_memory=peak_memory,
+		output_bytes=sum(sizes) / len(sizes) if sizes else 0,
+	)
+
+
+def run(
+	names: Optional[Sequence[str]] = None,
+	corpus_size: int = 50,
+	seed: int = 0,
+	repeat: int = 3,
+	warmup: int = 1
+) -> dict[str, Any]:
+	"""Run benchmarks over a corpus, see :func:`make_corpus`.
+
+	:param names: The benchmarks to run. Defaults to all of them.
+	:returns: The results, and everything needed to tell whether two results can be compared, suitable for serializing to JSON.
+	"""
+	corpus = make_corpus(corpus_size, seed)
+	results = []
+	for name in names or benchmarks:
+		log.info(f"running {name}")
+		results.append(run_benchmark(name, corpus, repeat, warmup))
+	return {
+		"commit": _commit(),
+		"python": platform.python_version(),
+		"pillow": PIL.__version__,
+		"corpus_size": corpus_size,
+		"seed": seed,
+		"repeat": repeat,
+		"warmup": warmup,
+		"benchmarks": [r.to_dict() for r in results],
+	}
+
+
+def _commit() -> Optional[str]:
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"],
+			capture_output=True,
+			text=True,
+			check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def format_table(
+	report: dict[str, Any], baseline: Optional[dict[str, Any]] = None
+) -> str:
+	"""Format the results of :func:`run` as a table.
+
+	:param baseline: Earlier results to compare against. Adds how much the mean time changed.
+	"""
+	before = {b["name"]: b for b in baseline["benchmarks"]} if baseline else {}
+	lines = [
+		f"{'benchmark':<26} {'mean ms':>9} {'p95 ms':>9} {'peak MiB':>9} {'output KiB':>11}"
+		+ (f" {'vs ' + str(baseline.get('commit')):>12}" if baseline else "")
+	]
+	for b in report["benchmarks"]:
+		line = f"{b['name']:<26} {b['mean'] * 1000:>9.2f} {b['p95'] * 1000:>9.2f} {b['peak_memory'] / 2**20:>9.1f} {b['output_bytes'] / 1024:>11.1f}"
+		if baseline:
+			old = before.get(b["name"])
+			change = f"{(b['mean'] / old['mean'] - 1) * 100:+.1f}%" if old and old[
+				"mean"] else "-"
+			line += f" {change:>12}"
+		lines += [line]
+	return "\n".join(lines)
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument(
+		"benchmarks",
+		nargs="*",
+		metavar="BENCHMARK",
+		help="The benchmarks to run. Defaults to all of them: " + ", ".join(benchmarks)
+	)
+	parser.add_argument(
+		"-n",
+		"--corpus-size",
+		type=int,
+		default=50,
+		help="Number of battle contexts in the corpus."
+	)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument(
+		"-r",
+		"--repeat",
+		type=int,
+		default=3,
+		help="Number of times to render each input while timing."
+	)
+	parser.add_argument(
+		"--warmup",
+		type=int,
+		default=1,
+		help="Number of times to render each input before timing it, to fill caches."
+	)
+	parser.add_argument(
+		"--baseline", help="JSON results of an earlier run to compare against."
+	)
+	parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+	parser.add_argument("-v", "--verbose", action="store_true")
+	args = parser.parse_args()
+	if not args.verbose:
+		for name in ["visualize", "benchmark"]:
+			logging.getLogger(name).setLevel(logging.WARNING)
+	for name in args.benchmarks:
+		if name not in benchmarks:
+			parser.error(f"invalid benchmark: {name}")
+	report = run(args.benchmarks, args.corpus_size, args.seed, args.repeat, args.warmup)
+	if args.json:
+		print(json.dumps(report, indent=2))
+	else:
+		baseline = None
+		if args.baseline:
+			with open(args.baseline) as f:
+				baseline = json.load(f)
+		print(format_table(report, baseline))
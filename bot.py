@@ -2,6 +2,7 @@ from typing import Callable, Union, Any, Optional
 import asyncio
 import io
 import json
+from pathlib import Path
 import aiohttp
 import logging, time
 import discord
@@ -12,6 +13,10 @@ import serve, coordinator
 from pkmntypes import *
 import util
 import battleapi
+import reservoir
+import attachments
+import render
+import silhouettes
 import coloredlogs
 import userprofile
 import Levenshtein
@@ -36,6 +41,12 @@ class DiscordBrock(commands.Bot):
 		if ctx.valid:
 			await self.invoke(ctx)
 
+	async def close(self): # noqa: D102
+		await reservoir.pokemon.stop()
+		await battleapi.client.close()
+		render.renderer.close()
+		await super().close()
+
 
 bot = DiscordBrock(command_prefix='p!')
 
@@ -93,7 +104,7 @@ async def challenge(
 		)
 	log.debug(f"Setting up battle: {ctx.author} challenging {opponent}")
 	start_time = time.time()
-	pkmn = [await battleapi.generate_pokemon(level=level) for _ in range(party_size * 2)]
+	pkmn = await reservoir.pokemon.take_many([{"level": level}] * (party_size * 2))
 
 	teams = util.build_teams_single(pkmn[:party_size], pkmn[party_size:])
 	battle = coordinator.Battle(teams=teams, original_channel=ctx.channel)
@@ -113,8 +124,6 @@ async def challenge(
 				f"{opponent} is not a valid battle bot. See `p!battlebots`."
 			)
 		battle.add_bot(opponent)
-	async with coordinator.battles_lock:
-		coordinator.battles += [battle]
 	duration = time.time() - start_time
 	log.info(f"Battle setup took {duration} seconds. Starting battle...")
 	await battle.start()
@@ -153,19 +162,21 @@ async def simulate(
 		)
 	log.debug(f"Setting up battle: {bot1} challenging {bot2}")
 	start_time = time.time()
-	pkmn = [await battleapi.generate_pokemon(level=level) for _ in range(party_size * 2)]
+	pkmn = await reservoir.pokemon.take_many([{"level": level}] * (party_size * 2))
 
 	teams = util.build_teams_single(pkmn[:party_size], pkmn[party_size:])
 	battle = coordinator.Battle(teams=teams, original_channel=ctx.channel)
 	battle.add_bot(bot1)
 	battle.add_bot(bot2)
-	async with coordinator.battles_lock:
-		coordinator.battles += [battle]
 	duration = time.time() - start_time
 	log.info(f"Battle setup took {duration} seconds. Starting battle...")
 	await battle.start()
 
 
+STARTER_DEXNUMS = [1, 4, 7, 25, 152, 155, 158, 252, 255, 258, 387, 390, 393]
+starters = reservoir.StarterCatalogue(STARTER_DEXNUMS, level=5)
+
+
 @bot.command(help='Create a profile and choose your starter Pokemon.')
 @commands.max_concurrency(1, per=BucketType.user, wait=False)
 async def begin(ctx: commands.Context): # noqa: D103
@@ -176,12 +187,7 @@ async def begin(ctx: commands.Context): # noqa: D103
 	log.debug(f"{ctx.author} creating new profile.")
 	profile = userprofile.UserProfile()
 	profile.user_id = ctx.author.id
-	starter_dexnums = [1, 4, 7, 25, 152, 155, 158, 252, 255, 258, 387, 390, 393]
-	starters = [
-		await battleapi.generate_pokemon(natdex=natdex, level=5)
-		for natdex in starter_dexnums
-	]
-	items = [pkmn.Name for pkmn in starters]
+	items = [pkmn.Name for pkmn in await starters.load()]
 	try:
 		selection = await asyncio.wait_for(
 			util.prompt_menu(
@@ -200,7 +206,7 @@ async def begin(ctx: commands.Context): # noqa: D103
 			"`begin`: You took too long to respond. You'll have to run the command again."
 		)
 		return
-	selected_pokemon = starters[selection]
+	selected_pokemon = await starters.roll(selection)
 	log.debug(f"{ctx.author} selected {selected_pokemon.Name}")
 	await selected_pokemon.save()
 	profile.add_pokemon(selected_pokemon)
@@ -261,7 +267,7 @@ async def minigame(
 	"""
 
 	if pokemon is None:
-		pokemon = await battleapi.generate_pokemon()
+		pokemon = await reservoir.pokemon.take()
 
 	name = pokemon.Name
 
@@ -271,11 +277,15 @@ async def minigame(
 		color=0x00ff00
 	)
 
-	file = discord.File(pokemon.get_silhouette(), filename="whosthatpokemon.png")
-	embed.set_image(url="attachment://whosthatpokemon.png")
 	embed.add_field(name="Guess", value="`guess pokemonName`")
 	embed.add_field(name="Help", value="`guess hint`")
-	await channel.send(file=file, embed=embed)
+	await attachments.cache.send(
+		channel,
+		f"silhouette:{pokemon.NatDex}",
+		lambda: silhouettes.get(pokemon.NatDex),
+		"whosthatpokemon.png",
+		embed,
+	)
 
 	def check(m):
 		return m.id != bot.user.id and m.channel == channel and m.content.startswith(
@@ -320,9 +330,13 @@ async def minigame(
 		color=0x00ff00
 	)
 
-	file = discord.File(f"./images/{pokemon.NatDex}.png", filename=f"{name}.png")
-	embed.set_image(url=f"attachment://{name}.png")
-	await channel.send(file=file, embed=embed)
+	await attachments.cache.send(
+		channel,
+		f"sprite:{pokemon.NatDex}",
+		Path(f"./images/{pokemon.NatDex}.png"),
+		f"{name}.png",
+		embed,
+	)
 	await pokemon.save()
 	profile.add_pokemon(pokemon)
 	await profile.save()
@@ -357,7 +371,8 @@ async def generate_emoji(ctx: commands.Context): # noqa: D103
 			continue
 		with io.BytesIO() as data:
 			im = visualize.get_element_type_img(e)
-			im.resize(visualize.scale(im.size, 4), Image.NEAREST).save(data, 'PNG')
+			im.resize(visualize.scale(im.size, 4),
+						Image.Resampling.NEAREST).save(data, 'PNG')
 			data.seek(0)
 			log.debug(f"creating emoji {ename}")
 			emoji = await guild.create_custom_emoji(
@@ -377,7 +392,8 @@ async def generate_emoji(ctx: commands.Context): # noqa: D103
 			continue
 		with io.BytesIO() as data:
 			im = visualize.get_status_condition_img(status)
-			im.resize(visualize.scale(im.size, 6), Image.NEAREST).save(data, 'PNG')
+			im.resize(visualize.scale(im.size, 6),
+						Image.Resampling.NEAREST).save(data, 'PNG')
 			data.seek(0)
 			log.debug(f"creating emoji {ename}")
 			emoji = await guild.create_custom_emoji(
@@ -443,7 +459,7 @@ async def gimmie_mons(ctx: commands.Context, num: int = 10): # noqa: D103
 		log.error("user does not have profile")
 		raise Exception("Profile not found")
 	assert isinstance(profile, userprofile.UserProfile)
-	pkmns = [await battleapi.generate_pokemon() for _ in range(num)]
+	pkmns = await battleapi.generate_many([{}] * num)
 	for pkmn in pkmns:
 		await pkmn.save()
 		profile.add_pokemon(pkmn)
@@ -452,8 +468,18 @@ async def gimmie_mons(ctx: commands.Context, num: int = 10): # noqa: D103
 
 
 if __name__ == "__main__":
+	assert config.BOT_TOKEN != None, "BOT_TOKEN was not provided."
 	log.info("Brock is starting...")
 	coordinator.set_bot(bot)
+	bot.loop.create_task(battleapi.client.open())
+	for level in config.POKEMON_RESERVOIR_LEVELS:
+		reservoir.pokemon.warm(level=level)
+	reservoir.pokemon.warm() # random encounters
+	for natdex in STARTER_DEXNUMS:
+		reservoir.pokemon.warm(level=starters.level, natdex=natdex, stock_size=1)
+	bot.loop.create_task(reservoir.pokemon.start())
+	bot.loop.create_task(starters.load())
+	bot.loop.run_in_executor(None, silhouettes.build_all)
 	# reference: https://pgjones.gitlab.io/quart/how_to_guides/event_loop.html
 	bot.loop.create_task(serve.app.run_task(host="0.0.0.0", use_reloader=False))
 	bot.load_extension("cogs.error_handler_fallback")
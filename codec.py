@@ -0,0 +1,69 @@
+"""Encoding and decoding of the JSON that is exchanged with the battle API.
+
+`orjson <https://github.com/ijl/orjson>`_ is used when it's installed, because team encoding and context decoding are some of the most expensive things that happen on the event loop. Otherwise, the standard library's :mod:`json` is used.
+"""
+from typing import Any, Callable, Union
+import json
+import logging, coloredlogs
+from pkmntypes import *
+
+_dumps: Callable[[Any], bytes]
+_loads: Callable[[Union[bytes, str]], Any]
+try:
+	import orjson
+	_dumps = orjson.dumps
+	_loads = orjson.loads
+	BACKEND = "orjson"
+except ImportError:
+	_dumps = lambda obj: json.dumps(obj, separators=(",", ":")).encode()
+	_loads = json.loads
+	BACKEND = "json"
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+
+def dumps(obj: Any) -> bytes:
+	"""Serialize `obj` to compact JSON."""
+	return _dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+	"""Deserialize a JSON document."""
+	return _loads(data)
+
+
+def encode_move(move: Move) -> dict[str, Any]:
+	"""Get the JSON representation of a move, as the battle API expects it."""
+	d = {field: getattr(move, attr) for field, attr in Move.json_fields.items()}
+	d["Ailment"] = move.ailment.value
+	return d
+
+
+def encode_pokemon(pokemon: Pokemon) -> dict[str, Any]:
+	"""Get the JSON representation of a pokemon, as the battle API expects it.
+
+	This is driven by :attr:`Pokemon.json_fields`, instead of walking the object like :mod:`jsonpickle` does.
+	"""
+	d: dict[str, Any] = {"_id": None if pokemon._id is None else str(pokemon._id)}
+	for field, attr in Pokemon.json_fields.items():
+		d[field] = getattr(pokemon, attr)
+	d["StatusEffects"] = pokemon.StatusEffects.value
+	d["Moves"] = [encode_move(move) for move in pokemon.Moves]
+	return d
+
+
+def encode_team(team: Team) -> dict[str, Any]:
+	"""Get the JSON representation of a team, as the battle API expects it."""
+	return {
+		"parties": [
+			{
+				"pokemon": [encode_pokemon(pkmn) for pkmn in party.pokemon]
+			} for party in team.parties
+		]
+	}
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -21,8 +21,55 @@ assert BROCK_ENVIRONMENT in [
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 if not BOT_TOKEN:
 	BOT_TOKEN = read_discord_token()
-assert BOT_TOKEN != None, "BOT_TOKEN was not provided."
 
 BATTLE_API_BASE_URL = os.environ.get("BATTLE_API_BASE_URL", "http://api:4000")
+BATTLE_API_BASE_URLS = [
+	url.strip()
+	for url in os.environ.get("BATTLE_API_BASE_URLS", BATTLE_API_BASE_URL).split(",")
+	if url.strip()
+]
+BATTLE_API_MAX_CONNECTIONS_PER_HOST = int(
+	os.environ.get("BATTLE_API_MAX_CONNECTIONS_PER_HOST", "32")
+)
+BATTLE_API_GENERATE_CONCURRENCY = int(
+	os.environ.get("BATTLE_API_GENERATE_CONCURRENCY", "8")
+)
+BATTLE_API_TIMEOUT_MIN = float(os.environ.get("BATTLE_API_TIMEOUT_MIN", "2"))
+BATTLE_API_TIMEOUT_MAX = float(os.environ.get("BATTLE_API_TIMEOUT_MAX", "30"))
+BATTLE_API_TIMEOUT_MULTIPLIER = float(
+	os.environ.get("BATTLE_API_TIMEOUT_MULTIPLIER", "4")
+)
+BATTLE_API_RETRIES = int(os.environ.get("BATTLE_API_RETRIES", "2"))
+BATTLE_API_RETRY_BACKOFF = float(os.environ.get("BATTLE_API_RETRY_BACKOFF", "0.1"))
+BATTLE_API_BREAKER_THRESHOLD = int(os.environ.get("BATTLE_API_BREAKER_THRESHOLD", "5"))
+BATTLE_API_BREAKER_COOLDOWN = float(os.environ.get("BATTLE_API_BREAKER_COOLDOWN", "10"))
+
+BATTLE_MAX_RUNNING = int(os.environ.get("BATTLE_MAX_RUNNING", "100"))
+BATTLE_MAX_RUNNING_PER_GUILD = int(os.environ.get("BATTLE_MAX_RUNNING_PER_GUILD", "20"))
+BOT_BATTLE_ROUND_DELAY = float(os.environ.get("BOT_BATTLE_ROUND_DELAY", "2"))
+
+RENDER_PROCESSES = int(os.environ.get("RENDER_PROCESSES", "2"))
+RENDER_PROFILE = os.environ.get("RENDER_PROFILE", "palette")
+RENDER_DM_PROFILE = os.environ.get("RENDER_DM_PROFILE", "mobile")
+RENDER_CACHE_BYTES = int(os.environ.get("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+ROUND_REPLAY_PROFILE = os.environ.get("ROUND_REPLAY_PROFILE", "gif")
+SPRITE_CACHE_BYTES = int(os.environ.get("SPRITE_CACHE_BYTES", str(32 * 1024 * 1024)))
+LAYER_CACHE_BYTES = int(os.environ.get("LAYER_CACHE_BYTES", str(32 * 1024 * 1024)))
+SPRITE_CACHE_WARMUP = [
+	int(natdex) for natdex in os.environ.get("SPRITE_CACHE_WARMUP", "").split(",")
+	if natdex.strip()
+]
+ATTACHMENT_URL_MAX_AGE = float(os.environ.get("ATTACHMENT_URL_MAX_AGE", "86400"))
+SILHOUETTE_CACHE_DIR = os.environ.get("SILHOUETTE_CACHE_DIR", "./cache/silhouettes")
+
+POKEMON_RESERVOIR_LEVELS = [
+	int(level)
+	for level in os.environ.get("POKEMON_RESERVOIR_LEVELS", "30,100").split(",")
+	if level.strip()
+]
+POKEMON_RESERVOIR_STOCK_SIZE = int(os.environ.get("POKEMON_RESERVOIR_STOCK_SIZE", "12"))
+POKEMON_RESERVOIR_REFILL_CONCURRENCY = int(
+	os.environ.get("POKEMON_RESERVOIR_REFILL_CONCURRENCY", "4")
+)
 
 __all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -1,5 +1,6 @@
-from typing import Callable, Union, Any, Optional
+from typing import Callable, Iterator, Union, Any, Optional
 import io
+import time
 import asyncio
 import aiohttp
 import functools
@@ -8,9 +9,14 @@ from discord import embeds
 from turns import *
 import util
 import battleapi
+import config
+import scheduler
 from pkmntypes import *
 from discord.message import Message
-from visualize import visualize_battle
+import attachments
+import render
+import replay
+import visualize
 import battle_ai
 import traceback
 import logging, coloredlogs
@@ -46,10 +52,12 @@ class Agent():
 				channel = self.user.dm_channel
 			if channel:
 				with channel.typing():
-					with io.BytesIO() as data:
-						visualize_battle(ctx).save(data, 'PNG')
-						data.seek(0)
-						await channel.send(file=discord.File(data, filename="battle.png"))
+					profile = config.RENDER_DM_PROFILE
+					data = await render.renderer.render(ctx, profile)
+					filename = f"battle.{visualize.output_profiles[profile].extension}"
+					await channel.send(
+						file=discord.File(io.BytesIO(data), filename=filename)
+					)
 
 	async def get_turn(
 		self, context: BattleContext, original_channel: discord.TextChannel
@@ -99,6 +107,8 @@ class Battle():
 		self.active_pokemon: int = None
 		self.agents: list[Agent] = []
 		self.transactions: list[Transaction] = []
+		self.round_durations: list[float] = []
+		self.ticket: Optional[scheduler.Ticket] = None
 		self.original_channel: discord.TextChannel = kwargs.pop("original_channel", None)
 		self.teams: list[Team] = kwargs.pop("teams")
 
@@ -120,18 +130,110 @@ class Battle():
 		return all([a.bot != None and len(a.bot) > 0 for a in self.agents])
 
 	async def start(self):
-		"""Create the battle on the battle API, making the battle ready to simulate, and starts a task asynchronously to simulate the battle."""
-		args = await battleapi.create_battle(self.teams)
+		"""Create the battle on the battle API, making the battle ready to simulate, and starts a task asynchronously to simulate the battle.
+
+		If too many battles are in progress already, this waits for the battle's turn in :data:`scheduler.battles`, and lets the players know where they are in the queue.
+		"""
+		guild = getattr(self.original_channel, "guild", None)
+		self.ticket = scheduler.battles.submit(
+			scheduler.PRIORITY_BOTS if self.is_just_bots else scheduler.PRIORITY_HUMANS,
+			guild.id if guild is not None else None
+		)
+		battles.add_pending(self)
+		try:
+			if not self.ticket.admitted:
+				if self.original_channel:
+					await self.original_channel.send(
+						f"Lots of battles are going on right now, you are #{scheduler.battles.position(self.ticket)} in queue."
+					)
+				await scheduler.battles.wait(self.ticket)
+			args = await battleapi.create_battle(self.teams)
+		except BaseException:
+			scheduler.battles.release(self.ticket)
+			battles.remove(self)
+			raise
 		self.bid = args["bid"]
+		battles.add(self)
 		self.active_pokemon = args["active_pokemon"]
 		bot.loop.create_task(self.simulate())
 
-	async def queue_turns(self):
-		"""Request and queue turns from all agents in the battle."""
+	async def get_contexts(self) -> list[BattleContext]:
+		"""Get the battle context for every agent in the battle at the same time.
+
+		:returns: The contexts, in the same order as `agents`.
+		"""
+		return list(
+			await asyncio.gather(
+				*[
+					battleapi.get_battle_context(self.bid, i)
+					for i in range(len(self.agents))
+				]
+			)
+		)
+
+	async def send_frame(
+		self,
+		ctx: BattleContext,
+		embed: discord.Embed,
+		content: Optional[str] = None
+	) -> discord.Message:
+		"""Send a message to the original channel, with a visualization of `ctx` as the image of `embed`.
+
+		A frame that looks exactly like one that was sent before isn't rendered or uploaded again, see :mod:`attachments`.
+		"""
+		snapshot = visualize.BattleSnapshot.from_context(ctx)
+		profile = config.RENDER_PROFILE
+		return await attachments.cache.send(
+			self.original_channel,
+			f"battle:{snapshot.digest()}:{profile}",
+			lambda: render.renderer.render(snapshot, profile),
+			f"battle.{visualize.output_profiles[profile].extension}",
+			embed,
+			content,
+		)
+
+	async def send_replay(
+		self,
+		ctx: BattleContext,
+		transactions: list[Transaction],
+		embed: discord.Embed,
+		content: Optional[str] = None
+	) -> discord.Message:
+		"""Send a message to the original channel, with the animated replay of a round as the image of `embed`.
+
+		Replays are only cosmetic, so if the replay can't be built or rendered, a frame of `ctx` is sent instead, see :meth:`send_frame`.
+
+		:param ctx: The battle context from before the round, whose perspective the replay is from.
+		:param transactions: The transactions of the round.
+		"""
+		profile = config.ROUND_REPLAY_PROFILE
+		try:
+			round_replay = replay.RoundReplay.from_transactions(
+				ctx, transactions, self.teams
+			)
+			data = await render.renderer.render_replay(round_replay, profile)
+		except Exception as e:
+			log.error(
+				f"Failed to render the replay of a round, sending a frame instead: {type(e)} {e}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}"
+			)
+			return await self.send_frame(ctx, embed, content)
+		filename = f"round.{replay.animation_profiles[profile].extension}"
+		embed.set_image(url=f"attachment://{filename}")
+		return await self.original_channel.send(
+			content, embed=embed, file=discord.File(io.BytesIO(data), filename=filename)
+		)
+
+	async def queue_turns(self, contexts: Optional[list[BattleContext]] = None):
+		"""Request and queue turns from all agents in the battle. Each agent's turn is submitted as soon as it has been made.
+
+		:param contexts: The battle context for each agent, if they have already been fetched.
+		"""
 		log.debug(f"asking {len(self.agents)} agents")
+		if contexts is None:
+			contexts = await self.get_contexts()
 
 		async def _do(i: int, agent: Agent):
-			context = await battleapi.get_battle_context(self.bid, i)
+			context = contexts[i]
 			await agent.send_visualization(context)
 			turn = await agent.get_turn(context, self.original_channel)
 			log.debug(f"posting turn {turn} from {agent}")
@@ -141,8 +243,13 @@ class Battle():
 
 	async def simulate(self):
 		"""Simulate the entire battle. Asynchronously blocks until the battle is completed."""
+		# the contexts for the next round are fetched while the results of the current round are being sent
+		next_contexts: Optional[asyncio.Future[list[BattleContext]]] = None
+		# with replays, each round is one message with the replay of the round, instead of a frame and the text of the round
+		replays = config.ROUND_REPLAY_PROFILE != "off"
 		try:
 			while True:
+				round_start = time.perf_counter()
 				log.debug("visualizing")
 				spectator_embed = discord.Embed(
 					title=f"{self.agents[0].name} vs. {self.agents[1].name}",
@@ -150,22 +257,24 @@ class Battle():
 				)
 				spectator_content = f"{self.agents[0].mention} vs. {self.agents[1].mention}"
 
-				ctx = await battleapi.get_battle_context(self.bid, 0)
-				if not self.is_just_bots:
+				if next_contexts is None:
+					contexts = await self.get_contexts()
+				else:
+					contexts = await next_contexts
+					next_contexts = None
+				ctx = contexts[0]
+				# the replay of the last round ends with what the battle looks like now
+				if not self.is_just_bots and not (replays and self.round_durations):
 					with self.original_channel.typing():
-						with io.BytesIO() as data:
-							visualize_battle(ctx).save(data, 'PNG')
-							data.seek(0)
-							spectator_embed.set_image(url="attachment://battle.png")
-							spectator_msg: discord.Message = await self.original_channel.send(
-								spectator_content,
-								embed=spectator_embed,
-								file=discord.File(data, filename="battle.png")
-							)
+						spectator_msg: discord.Message = await self.send_frame(
+							ctx, spectator_embed, spectator_content
+						)
 				log.debug("asking agents for turns")
-				await self.queue_turns()
+				await self.queue_turns(contexts)
 				log.debug("simulating round")
 				results = await battleapi.simulate(self.bid)
+				if not results.ended:
+					next_contexts = asyncio.ensure_future(self.get_contexts())
 				self.transactions += results.transactions
 				# embed descriptions can only be 2048 characters long.
 				char_limit = 2048
@@ -173,7 +282,13 @@ class Battle():
 					results.transactions, self.teams
 				)
 
-				if len(transactions_text) == 1:
+				if replays:
+					# the replay shows what happened, so the text is cut to fit in its embed
+					text = "\n".join(transactions_text[:1]) or "[No transactions]"
+					if len(transactions_text) > 1:
+						text = text[:char_limit - 2] + "\n…"
+					spectator_embed.description = text
+				elif len(transactions_text) == 1:
 					spectator_embed.description = transactions_text[0]
 				else:
 					# if the text doesn't fit on one embed, just put all the transactions into new messages
@@ -209,22 +324,26 @@ class Battle():
 								await agent.user.dm_channel.send(
 									embed=discord.Embed(description=text)
 								)
-				if not self.is_just_bots:
+				if replays:
+					with self.original_channel.typing():
+						await self.send_replay(
+							ctx, results.transactions, spectator_embed, spectator_content
+						)
+				elif not self.is_just_bots:
 					await spectator_msg.edit(embed=spectator_embed)
 				else:
-					with io.BytesIO() as data:
-						visualize_battle(ctx).save(data, 'PNG')
-						data.seek(0)
-						spectator_embed.set_image(url="attachment://battle.png")
-						spectator_msg: discord.Message = await self.original_channel.send(
-							spectator_content,
-							embed=spectator_embed,
-							file=discord.File(data, filename="battle.png")
-						)
+					spectator_msg: discord.Message = await self.send_frame(
+						ctx, spectator_embed, spectator_content
+					)
+				duration = time.perf_counter() - round_start
+				self.round_durations.append(duration)
+				log.info(
+					f"Round {len(self.round_durations)} of battle {self.bid} took {duration} seconds"
+				)
 				if results.ended:
 					break
 				if self.is_just_bots:
-					await asyncio.sleep(2)
+					await asyncio.sleep(config.BOT_BATTLE_ROUND_DELAY)
 			log.info(f"Battle between {self.agents} concluded")
 			results = await battleapi.get_results(self.bid)
 			if self.original_channel:
@@ -250,6 +369,8 @@ class Battle():
 					except discord.HTTPException:
 						pass
 		finally:
+			if next_contexts is not None:
+				next_contexts.cancel()
 			await self.__cleanup()
 
 	async def apply_post_battle_updates(self, results: battleapi.BattleResults):
@@ -281,18 +402,94 @@ class Battle():
 
 	async def __cleanup(self):
 		log.debug("cleaning up completed battle")
-		global battles
-		idx = None
-		for i, b in enumerate(battles):
-			if b is self:
-				idx = i
-				break
-		if idx == None:
+		if self.ticket is not None:
+			scheduler.battles.release(self.ticket)
+		if self.bid is not None:
+			# battles that error out never get their results, which would otherwise drop their cached contexts
+			battleapi.client.contexts.forget(self.bid)
+		if not battles.remove(self):
 			log.critical("Unable to find battle in all registered battles.")
-			return
-		async with battles_lock:
-			del battles[idx]
 
 
-battles: list[Battle] = []
-battles_lock = asyncio.Lock()
+class BattleRegistry():
+	"""All of the battles that are currently in progress, indexed by battle ID, and by the users and channels that are involved in them.
+
+	Battles that are still waiting in :data:`scheduler.battles` are registered too, see :meth:`add_pending`. They have no battle ID yet, so they are only indexed by user and channel.
+
+	Every operation is synchronous, so no lock is needed as long as it's only used from the event loop.
+	"""
+
+	def __init__(self):
+		self._by_id: dict[int, Battle] = {}
+		# keyed by the id() of the battle, because battles that are waiting to start have no battle ID
+		self._by_user: dict[int, dict[int, Battle]] = {}
+		self._by_channel: dict[int, dict[int, Battle]] = {}
+
+	@staticmethod
+	def _index_keys(battle: Battle) -> tuple[list[int], list[int]]:
+		users = [agent.user.id for agent in battle.agents if agent.user is not None]
+		channels = [battle.original_channel.id
+					] if battle.original_channel is not None else []
+		return users, channels
+
+	def add_pending(self, battle: Battle):
+		"""Register a battle that is waiting for its turn to start, so that it is found by :meth:`by_user` and :meth:`by_channel` while it waits. Register it again with :meth:`add` once it has started."""
+		users, channels = self._index_keys(battle)
+		for user_id in users:
+			self._by_user.setdefault(user_id, {})[id(battle)] = battle
+		for channel_id in channels:
+			self._by_channel.setdefault(channel_id, {})[id(battle)] = battle
+
+	def add(self, battle: Battle):
+		"""Register a battle. It must have been created on the battle API already, so that it has a battle ID."""
+		assert battle.bid is not None, "battle must be started before it can be registered"
+		assert battle.bid not in self._by_id, f"battle {battle.bid} is already registered"
+		self._by_id[battle.bid] = battle
+		self.add_pending(battle)
+
+	def remove(self, battle: Battle) -> bool:
+		"""Unregister a battle, whether it has started or is still waiting to.
+
+		:returns: Whether the battle was registered.
+		"""
+		registered = False
+		if battle.bid is not None and self._by_id.get(battle.bid) is battle:
+			del self._by_id[battle.bid]
+			registered = True
+		users, channels = self._index_keys(battle)
+		for index, keys in [(self._by_user, users), (self._by_channel, channels)]:
+			for key in keys:
+				entries = index.get(key)
+				if entries is not None and entries.pop(id(battle), None) is not None:
+					registered = True
+					if len(entries) == 0:
+						del index[key]
+		return registered
+
+	def get(self, bid: int) -> Optional[Battle]:
+		"""Get the battle with the given battle ID, if it's in progress."""
+		return self._by_id.get(bid)
+
+	def by_user(self, user_id: int) -> list[Battle]:
+		"""Get the battles that a user is taking part in, or is waiting to."""
+		return list(self._by_user.get(user_id, {}).values())
+
+	def by_channel(self, channel_id: int) -> list[Battle]:
+		"""Get the battles that are being played in a channel, or are waiting to be."""
+		return list(self._by_channel.get(channel_id, {}).values())
+
+	def snapshot(self) -> list[Battle]:
+		"""Get all of the battles in progress. The list is a copy, so battles can start and end while it's being iterated."""
+		return list(self._by_id.values())
+
+	def __len__(self) -> int:
+		return len(self._by_id)
+
+	def __iter__(self) -> Iterator[Battle]:
+		return iter(self.snapshot())
+
+	def __contains__(self, battle: Battle) -> bool:
+		return self._by_id.get(battle.bid) is battle
+
+
+battles = BattleRegistry()
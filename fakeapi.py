@@ -0,0 +1,454 @@
+"""An in-process stand-in for the battle API, for load testing and benchmarking the bot without containers.
+
+It implements the same endpoints and JSON shapes as the real battle API, with a much simpler battle simulation. Run it with `python fakeapi.py`, and point the bot at it with `BATTLE_API_BASE_URL`.
+"""
+from typing import Any, Awaitable, Callable, Optional
+import argparse
+import asyncio
+import collections
+import copy
+import json
+import random
+from aiohttp import web
+import logging, coloredlogs
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+_Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+# (id, name, index in TYPE_ELEMENTS, category, power, accuracy, pp, priority)
+MOVES = [
+	(33, "Tackle", 0, 1, 40, 100, 35, 0),
+	(98, "Quick Attack", 0, 1, 40, 100, 30, 1),
+	(45, "Growl", 0, 0, 0, 100, 40, 0),
+	(2, "Karate Chop", 1, 1, 50, 100, 25, 0),
+	(64, "Peck", 2, 1, 35, 100, 35, 0),
+	(17, "Wing Attack", 2, 1, 60, 100, 35, 0),
+	(40, "Poison Sting", 3, 1, 15, 100, 35, 0),
+	(189, "Mud-Slap", 4, 2, 20, 100, 10, 0),
+	(88, "Rock Throw", 5, 1, 50, 90, 15, 0),
+	(141, "Leech Life", 6, 1, 20, 100, 15, 0),
+	(122, "Lick", 7, 1, 30, 100, 30, 0),
+	(232, "Metal Claw", 8, 1, 50, 95, 35, 0),
+	(52, "Ember", 9, 2, 40, 100, 25, 0),
+	(55, "Water Gun", 10, 2, 40, 100, 25, 0),
+	(22, "Vine Whip", 11, 1, 45, 100, 25, 0),
+	(84, "Thunder Shock", 12, 2, 40, 100, 30, 0),
+	(85, "Thunderbolt", 12, 2, 90, 100, 15, 0),
+	(93, "Confusion", 13, 2, 50, 100, 25, 0),
+	(181, "Powder Snow", 14, 2, 40, 100, 25, 0),
+	(225, "Dragon Breath", 15, 2, 60, 100, 20, 0),
+	(44, "Bite", 16, 1, 60, 100, 25, 0),
+]
+MAX_NATDEX = 493
+
+POKEMON_FIELDS = [
+	"Name", "NatDex", "Level", "Ability", "TotalExperience", "Gender", "IVs", "EVs",
+	"Nature", "Stats", "StatModifiers", "StatusEffects", "CurrentHP", "HeldItem", "Moves",
+	"Friendship", "OriginalTrainerID", "Type"
+]
+
+# transaction type ids, as used by the battle API
+USE_MOVE_TRANSACTION = 0
+DAMAGE_TRANSACTION = 1
+PP_TRANSACTION = 5
+FAINT_TRANSACTION = 10
+SEND_OUT_TRANSACTION = 11
+END_BATTLE_TRANSACTION = 13
+MOVE_FAIL_TRANSACTION = 15
+
+
+def _move_json(move_id: int) -> dict[str, Any]:
+	default = (move_id, f"Move{move_id}", 0, 1, 50, 100, 20, 0)
+	move = next((m for m in MOVES if m[0] == move_id), default)
+	_, name, elemental_type, category, power, accuracy, pp, priority = move
+	return {
+		"Id": move_id,
+		"CurrentPP": pp,
+		"MaxPP": pp,
+		"Name": name,
+		"Type": 1 << elemental_type,
+		"Category": category,
+		"Targets": 10,
+		"Priority": priority,
+		"Power": power,
+		"Accuracy": accuracy,
+		"InitialMaxPP": pp,
+		"MinHits": 0,
+		"MaxHits": 0,
+		"MinTurns": 0,
+		"MaxTurns": 0,
+		"Drain": 0,
+		"Healing": 0,
+		"CritRate": 0,
+		"AilmentChance": 0,
+		"FlinchChance": 0,
+		"StatChance": 0,
+		"Flags": 0,
+		"AffectedStat": 0,
+		"StatStages": 0,
+		"Ailment": 0,
+		"MetaCategory": 0,
+	}
+
+
+def generate_pokemon(
+	rng: random.Random,
+	natdex: Optional[int] = None,
+	level: Optional[int] = None,
+	moves: Optional[list[int]] = None
+) -> dict[str, Any]:
+	"""Generate the JSON for a random pokemon, like `/pokedex/generate` does."""
+	natdex = natdex or rng.randint(1, MAX_NATDEX)
+	level = level or rng.randint(1, 100)
+	if not moves:
+		moves = [m[0] for m in rng.sample(MOVES, 4)]
+	base_stats = [rng.randint(40, 120) for _ in range(6)]
+	ivs = [rng.randint(0, 31) for _ in range(6)]
+	stats = [(2 * base_stats[0] + ivs[0]) * level // 100 + level + 10] + [
+		(2 * base + iv) * level // 100 + 5 for base, iv in zip(base_stats[1:], ivs[1:])
+	]
+	return {
+		"Name": f"Fakemon{natdex}",
+		"NatDex": natdex,
+		"Level": level,
+		"Ability": 0,
+		"TotalExperience": level**3,
+		"Gender": rng.randint(0, 2),
+		"IVs": ivs,
+		"EVs": [0] * 6,
+		"Nature": rng.randint(0, 24),
+		"Stats": stats,
+		"StatModifiers": [0] * 9,
+		"StatusEffects": 0,
+		"CurrentHP": stats[0],
+		"HeldItem": {
+			"Id": 0,
+			"Name": "",
+			"Category": 0,
+			"FlingPower": 0,
+			"FlingEffect": 0,
+			"Flags": 0
+		},
+		"Moves": [_move_json(m) for m in moves],
+		"Friendship": 0,
+		"OriginalTrainerID": 0,
+		"Type": 1 << rng.randint(0, 16),
+	}
+
+
+def _case_insensitive_get(d: dict[str, Any], name: str) -> Any:
+	return d.get(name, d.get(name.lower()))
+
+
+class FakeBattle:
+	"""A single battle, simulated with simplified rules.
+
+	Every party is active at the same time with 1 pokemon, so target `i` is the active pokemon of party `i`.
+	"""
+
+	def __init__(self, teams: list[dict[str, Any]], rng: random.Random):
+		self.rng = rng
+		self.parties: list[list[dict[str, Any]]] = []
+		self.party_teams: list[int] = []
+		for t, team in enumerate(teams):
+			for party in _case_insensitive_get(team, "parties"):
+				self.parties.append(
+					[
+						{
+							k: v
+							for k, v in pkmn.items() if k in POKEMON_FIELDS
+						} for pkmn in _case_insensitive_get(party, "pokemon")
+					]
+				)
+				self.party_teams.append(t)
+		self.active = [0] * len(self.parties)
+		self.turns: dict[int, dict[str, Any]] = {}
+		self.ended = False
+		self.winner = -1
+
+	def target(self, party: int, snapshot: bool = True) -> dict[str, Any]:
+		"""Get the JSON for the active pokemon of `party`.
+
+		:param snapshot: Copy the pokemon, so that the result isn't changed by the rest of the round. Without it, the result must be serialized before the battle is simulated again.
+		"""
+		pkmn = self.parties[party][self.active[party]]
+		return {
+			"Party": party,
+			"Slot": self.active[party],
+			"Team": self.party_teams[party],
+			# only current HP and PP change during a battle, so the rest can be shared
+			"Pokemon": {
+				**pkmn, "Moves": [dict(m) for m in pkmn["Moves"]]
+			} if snapshot else pkmn,
+		}
+
+	def context(self, party: int) -> dict[str, Any]:
+		"""Get the JSON for the battle context of the active pokemon of `party`."""
+		targets = [self.target(p, snapshot=False) for p in range(len(self.parties))]
+		team = self.party_teams[party]
+		return {
+			"Battle": {
+				"Weather": 0
+			},
+			"Self": targets[party],
+			"Team": team,
+			"Targets": targets,
+			"Allies": [t for t in targets if t["Team"] == team and t["Party"] != party],
+			"Opponents": [t for t in targets if t["Team"] != team],
+		}
+
+	def simulate(self) -> dict[str, Any]:
+		"""Simulate a round with the turns that have been submitted."""
+		transactions: list[dict[str, Any]] = []
+		if self.ended:
+			return {"Transactions": transactions, "Ended": True}
+
+		def add(type: int, name: str, **args):
+			transactions.append({"type": type, "name": name, "args": args})
+
+		def order(party: int):
+			pkmn = self.parties[party][self.active[party]]
+			move = pkmn["Moves"][self.turns[party]["args"]["move"]]
+			return (-move["Priority"], -pkmn["Stats"][5], self.rng.random())
+
+		users = sorted(
+			[p for p, t in self.turns.items() if t.get("type") == 0], key=order
+		)
+		for party in users:
+			user = self.parties[party][self.active[party]]
+			args = self.turns[party]["args"]
+			target_party = args["Target"]["Party"]
+			target = self.parties[target_party][self.active[target_party]]
+			if user["CurrentHP"] == 0 or target["CurrentHP"] == 0:
+				continue
+			move = user["Moves"][args["move"]]
+			add(
+				USE_MOVE_TRANSACTION,
+				"UseMoveTransaction",
+				User=self.target(party),
+				Target=self.target(target_party),
+				Move=copy.deepcopy(move)
+			)
+			if move["CurrentPP"] > 0:
+				move["CurrentPP"] -= 1
+				add(PP_TRANSACTION, "PPTransaction", Move=copy.deepcopy(move), Amount=-1)
+			if self.rng.randint(1, 100) > move["Accuracy"]:
+				add(
+					MOVE_FAIL_TRANSACTION,
+					"MoveFailTransaction",
+					User=self.target(party),
+					Reason=1
+				)
+				continue
+			if move["Category"] == 0:
+				continue
+			attack, defense = (1, 2) if move["Category"] == 1 else (3, 4)
+			damage = int(
+				(
+					(2 * user["Level"] / 5 + 2) * move["Power"] * user["Stats"][attack] /
+					max(target["Stats"][defense], 1) / 50 + 2
+				) * self.rng.uniform(0.85, 1)
+			)
+			damage = min(max(damage, 1), target["CurrentHP"])
+			target["CurrentHP"] -= damage
+			add(
+				DAMAGE_TRANSACTION,
+				"DamageTransaction",
+				Target=self.target(target_party),
+				Move=copy.deepcopy(move),
+				Damage=damage,
+				StatusEffect=0
+			)
+			if target["CurrentHP"] == 0:
+				add(
+					FAINT_TRANSACTION,
+					"FaintTransaction",
+					Target=self.target(target_party)
+				)
+				if self._send_out(target_party, add):
+					add(
+						END_BATTLE_TRANSACTION,
+						"EndBattleTransaction",
+						Reason=0,
+						Winner=self.winner
+					)
+					break
+		self.turns = {}
+		return {"Transactions": transactions, "Ended": self.ended}
+
+	def _send_out(self, party: int, add) -> bool:
+		# returns whether the battle ended, because the party had no pokemon left to send out
+		for slot, pkmn in enumerate(self.parties[party]):
+			if pkmn["CurrentHP"] > 0:
+				self.active[party] = slot
+				add(SEND_OUT_TRANSACTION, "SendOutTransaction", Target=self.target(party))
+				return False
+		standing = {
+			self.party_teams[p]
+			for p, pokemon in enumerate(self.parties)
+			if any(pkmn["CurrentHP"] > 0 for pkmn in pokemon)
+		}
+		if len(standing) <= 1:
+			self.ended = True
+			self.winner = standing.pop() if len(standing) > 0 else 0
+		return self.ended
+
+	def results(self) -> dict[str, Any]:
+		"""Get the JSON for the results of the battle."""
+		return {
+			"Winner": self.winner,
+			"Parties": [{
+				"Pokemon": copy.deepcopy(pokemon)
+			} for pokemon in self.parties],
+		}
+
+
+class FakeBattleApi:
+	"""A stand-in for the battle API's HTTP server.
+
+	:param seed: Seed for all randomness, so that runs can be reproduced.
+	:param latency: Artificial latency added to every request, in seconds.
+	:param jitter: Maximum amount of random latency added on top of `latency`, in seconds.
+	"""
+
+	def __init__(self, seed: int = 0, latency: float = 0, jitter: float = 0):
+		self.seed = seed
+		self.latency = latency
+		self.jitter = jitter
+		self.battles: dict[int, FakeBattle] = {}
+		self.requests: collections.Counter[str] = collections.Counter()
+		self._rng = random.Random(seed)
+		self._latency_rng = random.Random(seed)
+		self._runner: Optional[web.AppRunner] = None
+		# stall and status of the next requests to each endpoint that should misbehave
+		self._faults: dict[str, list[tuple[float, Optional[int]]]] = {}
+
+	def app(self) -> web.Application:
+		"""Create the aiohttp application that serves the fake API."""
+		app = web.Application(middlewares=[self._middleware])
+		app.router.add_get("/pokedex/generate", self._generate)
+		app.router.add_post("/battle/new", self._new)
+		app.router.add_get("/battle/context", self._context)
+		app.router.add_post("/battle/act", self._act)
+		app.router.add_get("/battle/simulate", self._simulate)
+		app.router.add_get("/battle/results", self._results)
+		return app
+
+	async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+		"""Start serving the fake API in the running event loop.
+
+		:param port: The port to listen on. By default, a free port is picked.
+		:returns: The base URL of the fake API.
+		"""
+		self._runner = web.AppRunner(self.app())
+		await self._runner.setup()
+		site = web.TCPSite(self._runner, host, port)
+		await site.start()
+		host, port = self._runner.addresses[0][:2]
+		return f"http://{host}:{port}"
+
+	async def stop(self):
+		"""Stop serving the fake API."""
+		if self._runner is not None:
+			await self._runner.cleanup()
+			self._runner = None
+
+	def inject_fault(
+		self, path: str, stall: float = 0, status: Optional[int] = None, count: int = 1
+	):
+		"""Make the next requests to an endpoint misbehave, like a battle API that is under GC or CPU pressure.
+
+		:param path: The path of the endpoint, eg. `/battle/simulate`.
+		:param stall: Extra latency added to each request, in seconds.
+		:param status: Respond with this HTTP status instead of handling the request.
+		:param count: The number of requests to misbehave on.
+		"""
+		self._faults.setdefault(path, []).extend([(stall, status)] * count)
+
+	@web.middleware
+	async def _middleware(
+		self, request: web.Request, handler: _Handler
+	) -> web.StreamResponse:
+		self.requests[request.path] += 1
+		stall, status = 0.0, None
+		if self._faults.get(request.path):
+			stall, status = self._faults[request.path].pop(0)
+		delay = self.latency + self._latency_rng.uniform(0, self.jitter) + stall
+		if delay > 0:
+			await asyncio.sleep(delay)
+		if status is not None:
+			return web.Response(status=status, text="injected fault")
+		return await handler(request)
+
+	def _battle(self, request: web.Request) -> FakeBattle:
+		try:
+			return self.battles[int(request.query["id"])]
+		except (KeyError, ValueError):
+			raise web.HTTPNotFound(text="battle not found")
+
+	async def _generate(self, request: web.Request) -> web.Response:
+		moves = request.query.get("moves")
+		pkmn = generate_pokemon(
+			self._rng,
+			natdex=int(request.query["natdex"]) if "natdex" in request.query else None,
+			level=int(request.query["level"]) if "level" in request.query else None,
+			moves=[int(m) for m in moves.split(",")] if moves else None,
+		)
+		return web.json_response(pkmn)
+
+	async def _new(self, request: web.Request) -> web.Response:
+		body = json.loads(await request.read())
+		bid = len(self.battles)
+		battle = FakeBattle(
+			_case_insensitive_get(body, "teams"), random.Random(f"{self.seed}:{bid}")
+		)
+		self.battles[bid] = battle
+		return web.json_response(
+			{
+				"BattleId": bid,
+				"ActivePokemon": [battle.target(p) for p in range(len(battle.parties))],
+			}
+		)
+
+	async def _context(self, request: web.Request) -> web.Response:
+		battle = self._battle(request)
+		return web.json_response(battle.context(int(request.query["target"])))
+
+	async def _act(self, request: web.Request) -> web.Response:
+		battle = self._battle(request)
+		battle.turns[int(request.query["target"])] = json.loads(await request.read())
+		return web.Response()
+
+	async def _simulate(self, request: web.Request) -> web.Response:
+		return web.json_response(self._battle(request).simulate())
+
+	async def _results(self, request: web.Request) -> web.Response:
+		return web.json_response(self._battle(request).results())
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--host", default="0.0.0.0")
+	parser.add_argument("--port", type=int, default=4000)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument(
+		"--latency",
+		type=float,
+		default=0,
+		help="Artificial latency per request, in seconds."
+	)
+	parser.add_argument(
+		"--jitter",
+		type=float,
+		default=0,
+		help="Maximum random latency added per request, in seconds."
+	)
+	args = parser.parse_args()
+	api = FakeBattleApi(seed=args.seed, latency=args.latency, jitter=args.jitter)
+	web.run_app(api.app(), host=args.host, port=args.port)
@@ -0,0 +1,211 @@
+"""Run battles between battle bots as fast as possible, without discord.
+
+Unlike :class:`coordinator.Battle`, nothing is rendered or sent anywhere, and rounds are not paced. This is useful for balancing battle strategies, and as a benchmark of the battle pipeline.
+"""
+from typing import Any, Optional, Sequence
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import collections
+import json
+import time
+import logging, coloredlogs
+from pkmntypes import *
+import battle_ai
+import battleapi
+import util
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+
+@dataclass
+class HeadlessResult:
+	"""The outcome of a headless battle.
+
+	:param bid: The battle's ID.
+	:param strategies: The battle strategy that played each team.
+	:param winner: The index of the team that won.
+	:param rounds: The number of rounds that were simulated.
+	:param duration: How long the whole battle took, in seconds.
+	:param decision_time: The total time spent in each strategy, in seconds.
+	:param transactions: The number of transactions that happened in the battle.
+	"""
+
+	bid: int
+	strategies: list[str]
+	winner: int
+	rounds: int
+	duration: float
+	decision_time: list[float] = field(default_factory=list)
+	transactions: int = 0
+
+
+async def run_battle(
+	strategies: Sequence[str],
+	teams: list[Team],
+	max_rounds: int = 1000
+) -> HeadlessResult:
+	"""Play a battle to completion, with each team controlled by a battle strategy.
+
+	:param strategies: The name of the battle strategy for each team, from :data:`battle_ai.strategies`.
+	:param teams: The teams that battle, with 1 party each.
+	:param max_rounds: Give up on the battle if it isn't over after this many rounds.
+	:raises RuntimeError: If the battle didn't end after `max_rounds` rounds.
+	"""
+	assert len(strategies) == len(teams), "each team needs a strategy"
+	for name in strategies:
+		assert name in battle_ai.strategies, f"Invalid battle strategy: {name}"
+	start = time.perf_counter()
+	bid = (await battleapi.create_battle(teams))["bid"]
+	decision_time = [0.0] * len(strategies)
+	transactions = 0
+
+	async def _turn(target: int, name: str):
+		ctx = await battleapi.get_battle_context(bid, target)
+		decision_start = time.perf_counter()
+		turn = battle_ai.strategies[name](ctx)
+		decision_time[target] += time.perf_counter() - decision_start
+		await battleapi.submit_turn(bid, target, turn)
+
+	try:
+		for rounds in range(1, max_rounds + 1):
+			await asyncio.gather(*[_turn(i, name) for i, name in enumerate(strategies)])
+			results = await battleapi.simulate(bid)
+			transactions += len(results.transactions)
+			if results.ended:
+				break
+		else:
+			raise RuntimeError(f"battle {bid} did not end after {max_rounds} rounds")
+		final = await battleapi.get_results(bid)
+	finally:
+		# battles that fail never get their results, which would otherwise drop their cached contexts
+		battleapi.client.contexts.forget(bid)
+	return HeadlessResult(
+		bid=bid,
+		strategies=list(strategies),
+		winner=final.winner,
+		rounds=rounds,
+		duration=time.perf_counter() - start,
+		decision_time=decision_time,
+		transactions=transactions,
+	)
+
+
+async def run_random_battle(
+	strategies: Sequence[str], level: int = 100, party_size: int = 6
+) -> HeadlessResult:
+	"""Play a battle between randomly generated parties of pokemon, see :func:`run_battle`."""
+	pkmn = await battleapi.generate_many([{"level": level}] * (party_size * 2))
+	teams = util.build_teams_single(pkmn[:party_size], pkmn[party_size:])
+	return await run_battle(strategies, teams)
+
+
+async def run_many(
+	battles: int,
+	strategies: Sequence[str],
+	concurrency: int = 16,
+	level: int = 100,
+	party_size: int = 6
+) -> list[HeadlessResult]:
+	"""Play many random battles, with up to `concurrency` of them in progress at the same time.
+
+	Battles that fail are logged and left out of the results.
+	"""
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def _do() -> Optional[HeadlessResult]:
+		async with semaphore:
+			try:
+				return await run_random_battle(strategies, level, party_size)
+			except Exception as e:
+				log.error(f"headless battle failed: {e}")
+				return None
+
+	results = await asyncio.gather(*[_do() for _ in range(battles)])
+	return [r for r in results if r is not None]
+
+
+def summarize(results: list[HeadlessResult], duration: float) -> dict[str, Any]:
+	"""Summarize a set of headless battles.
+
+	:param duration: The wall clock time it took to play all of the battles, in seconds.
+	"""
+	wins: collections.Counter[str] = collections.Counter()
+	for r in results:
+		wins[f"{r.winner}:{r.strategies[r.winner]}"] += 1
+	rounds = sum(r.rounds for r in results)
+	return {
+		"battles": len(results),
+		"duration": duration,
+		"battles_per_minute": len(results) / duration * 60 if duration > 0 else 0,
+		"rounds_per_second": rounds / duration if duration > 0 else 0,
+		"average_rounds": rounds / len(results) if results else 0,
+		"wins": dict(wins),
+		"api": battleapi.client.stats(),
+	}
+
+
+async def main(args: argparse.Namespace):
+	"""Run the battles that were asked for on the command line, and print a summary as JSON."""
+	fake = None
+	if args.fake:
+		import fakeapi
+		fake = fakeapi.FakeBattleApi(seed=args.seed)
+		battleapi.client = battleapi.BattleApiClient([await fake.start()])
+	elif args.base_url:
+		battleapi.client = battleapi.BattleApiClient(args.base_url)
+	try:
+		start = time.perf_counter()
+		results = await run_many(
+			args.battles, args.strategies, args.concurrency, args.level, args.party_size
+		)
+		print(json.dumps(summarize(results, time.perf_counter() - start), indent=2))
+	finally:
+		await battleapi.client.close()
+		if fake is not None:
+			await fake.stop()
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument(
+		"strategies",
+		nargs=2,
+		metavar="STRATEGY",
+		choices=list(battle_ai.strategies),
+		help="The battle strategy for each team."
+	)
+	parser.add_argument("-n", "--battles", type=int, default=100)
+	parser.add_argument(
+		"-c",
+		"--concurrency",
+		type=int,
+		default=16,
+		help="Maximum number of battles in progress at the same time."
+	)
+	parser.add_argument("--level", type=int, default=100)
+	parser.add_argument("--party-size", type=int, default=6)
+	parser.add_argument(
+		"--base-url",
+		action="append",
+		help="URL of a battle API backend. Can be given more than once."
+	)
+	parser.add_argument(
+		"--fake",
+		action="store_true",
+		help="Run against an in-process fake battle API, see fakeapi.py."
+	)
+	parser.add_argument(
+		"--seed", type=int, default=0, help="Seed for the fake battle API."
+	)
+	parser.add_argument("-v", "--verbose", action="store_true")
+	args = parser.parse_args()
+	if not args.verbose:
+		for name in ["battleapi", "battle_ai", "headless", "fakeapi"]:
+			logging.getLogger(name).setLevel(logging.WARNING)
+	asyncio.run(main(args))
@@ -0,0 +1,214 @@
+"""In-process metrics: counters, gauges and latency histograms, which can be exported in the Prometheus text format."""
+from typing import Any, Generic, Iterator, Optional, TypeVar, Union
+import bisect
+import collections
+import contextlib
+import math
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+__exclude_exports__ = set(dir())
+
+DEFAULT_BUCKETS = [
+	0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+]
+
+
+class Counter:
+	"""A value that only goes up."""
+
+	def __init__(self):
+		self.value = 0.0
+
+	def inc(self, amount: float = 1):
+		"""Increase the counter by `amount`."""
+		self.value += amount
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Get the current state of the metric."""
+		return {"value": self.value}
+
+
+class Gauge(Counter):
+	"""A value that can go up and down."""
+
+	def dec(self, amount: float = 1):
+		"""Decrease the gauge by `amount`."""
+		self.value -= amount
+
+	def set(self, value: float):
+		"""Set the gauge to `value`."""
+		self.value = value
+
+	@contextlib.contextmanager
+	def track(self) -> Iterator[None]:
+		"""Increase the gauge for the duration of the `with` block."""
+		self.inc()
+		try:
+			yield
+		finally:
+			self.dec()
+
+
+class Histogram:
+	"""A distribution of observed values, eg. latencies in seconds.
+
+	Observations are counted in cumulative buckets, like Prometheus does. The most recent observations are also kept so that quantiles can be estimated accurately.
+
+	:param buckets: Upper bounds of the buckets, in ascending order.
+	:param window: The number of recent observations to keep for :meth:`quantile`.
+	"""
+
+	def __init__(self, buckets: list[float] = DEFAULT_BUCKETS, window: int = 1024):
+		self.buckets = list(buckets)
+		self.bucket_counts = [0] * (len(self.buckets) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.recent: collections.deque[float] = collections.deque(maxlen=window)
+
+	def observe(self, value: float):
+		"""Record an observation."""
+		self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.count += 1
+		self.sum += value
+		self.recent.append(value)
+
+	@contextlib.contextmanager
+	def time(self) -> Iterator[None]:
+		"""Observe how long the `with` block takes, in seconds."""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start)
+
+	def quantile(self, q: float) -> Optional[float]:
+		"""Estimate the `q` quantile of the recent observations.
+
+		:param q: The quantile, between 0 and 1.
+		:returns: The estimate, or `None` if nothing has been observed yet.
+		"""
+		if len(self.recent) == 0:
+			return None
+		values = sorted(self.recent)
+		return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Get the current state of the metric."""
+		return {
+			"count": self.count,
+			"sum": self.sum,
+			"buckets": dict(zip(map(str, self.buckets + [math.inf]), self.bucket_counts)),
+			"p50": self.quantile(0.5),
+			"p95": self.quantile(0.95),
+			"p99": self.quantile(0.99),
+		}
+
+
+_Metric = TypeVar("_Metric", bound=Union[Counter, Histogram])
+
+
+class _Family(Generic[_Metric]):
+
+	def __init__(self, name: str, kind: type[_Metric], help: str, **kwargs):
+		self.name = name
+		self.kind = kind
+		self.help = help
+		self.kwargs = kwargs
+		self.children: dict[tuple[tuple[str, str], ...], _Metric] = {}
+
+	def child(self, labels: dict[str, Any]) -> _Metric:
+		key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+		if key not in self.children:
+			self.children[key] = self.kind(**self.kwargs)
+		return self.children[key]
+
+
+class Registry:
+	"""A collection of named metrics. Each metric can have several children, identified by their labels."""
+
+	def __init__(self):
+		self._families: dict[str, _Family[Any]] = {}
+
+	def _family(self, name: str, kind: type[_Metric], help: str,
+				**kwargs) -> _Family[_Metric]:
+		if name not in self._families:
+			self._families[name] = _Family(name, kind, help, **kwargs)
+		family = self._families[name]
+		assert family.kind is kind, f"{name} is already registered as a {family.kind.__name__}"
+		return family
+
+	def counter(self, name: str, help: str = "", **labels) -> Counter:
+		"""Get or create the counter `name` with the given labels."""
+		return self._family(name, Counter, help).child(labels)
+
+	def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+		"""Get or create the gauge `name` with the given labels."""
+		return self._family(name, Gauge, help).child(labels)
+
+	def histogram(
+		self,
+		name: str,
+		help: str = "",
+		buckets: list[float] = DEFAULT_BUCKETS,
+		**labels
+	) -> Histogram:
+		"""Get or create the histogram `name` with the given labels."""
+		return self._family(name, Histogram, help, buckets=buckets).child(labels)
+
+	def snapshot(self) -> dict[str, Any]:
+		"""Get the current state of all metrics, suitable for serializing to JSON."""
+		return {
+			name: {
+				"type":
+				family.kind.__name__.lower(),
+				"help":
+				family.help,
+				"series": [
+					{
+						"labels": dict(key),
+						**metric.to_dict()
+					} for key, metric in family.children.items()
+				],
+			}
+			for name, family in self._families.items()
+		}
+
+	def render_prometheus(self) -> str:
+		"""Render all metrics in the Prometheus text exposition format."""
+		lines = []
+		for name, family in self._families.items():
+			kind = family.kind.__name__.lower()
+			if family.help:
+				lines += [f"# HELP {name} {family.help}"]
+			lines += [f"# TYPE {name} {kind}"]
+			for key, metric in family.children.items():
+				if isinstance(metric, Histogram):
+					cumulative = 0
+					for bound, count in zip(
+						metric.buckets + [math.inf], metric.bucket_counts
+					):
+						cumulative += count
+						le = "+Inf" if bound == math.inf else str(bound)
+						lines += [
+							f"{name}_bucket{_labels(key + (('le', le), ))} {cumulative}"
+						]
+					lines += [f"{name}_sum{_labels(key)} {metric.sum}"]
+					lines += [f"{name}_count{_labels(key)} {metric.count}"]
+				else:
+					lines += [f"{name}{_labels(key)} {metric.value}"]
+		return "\n".join(lines) + "\n"
+
+
+def _labels(key: tuple[tuple[str, str], ...]) -> str:
+	if len(key) == 0:
+		return ""
+	escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in key]
+	return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+registry = Registry()
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -159,8 +159,8 @@ class StatusCondition():
 
 	@property
 	def value(self) -> int:
-		"""Get the combined value of this condition."""
-		return int(self.non_volatile & (self.volatile << 3))
+		"""Get the combined value of this condition, as the battle API encodes it: the non-volatile condition in the lowest 3 bits, and the volatile conditions in the bits above them."""
+		return int(self.non_volatile | (self.volatile << 3))
 
 	def __getstate__(self):
 		return self.value
@@ -346,31 +346,16 @@ class Pokemon():
 
 	def get_image(self) -> Image:
 		"""Get the image of the pokemon."""
-		return Image.open(f"./images/{self.NatDex}.png")
+		import visualize # avoid circular import
+		return visualize.get_pokemon_image(self.NatDex)
 
 	def get_silhouette(self) -> Path:
 		"""Return the path to the silhouette image of a pokemon. If the image doesn't exist it will be created.
 
 		:returns: Path to pokemon silhouette
 		"""
-		imgPath = Path(f"./images/{self.NatDex}.png")
-		silPath = Path(f"./images/{self.NatDex}_sil.png")
-		if not silPath.exists():
-			img = Image.open(imgPath)
-			img = img.convert("RGBA")
-			background = Image.open(f"./images/background.png")
-			pixdata = img.load()
-
-			width, height = img.size
-			for y in range(height):
-				for x in range(width):
-					if pixdata[x, y][3] != 0:
-						pixdata[x, y] = (0, 0, 0, 255)
-
-			background.paste(img, (60, 60), img)
-			background.save(silPath, "PNG")
-
-		return silPath
+		import silhouettes # avoid circular import
+		return silhouettes.build(self.NatDex)
 
 	@property
 	def name_and_type(self):
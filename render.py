@@ -0,0 +1,334 @@
+"""Renders battle images in a pool of worker processes, so that rendering doesn't stall the event loop."""
+from typing import Optional, Sequence, Union
+import asyncio
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import time
+import logging, coloredlogs
+from pkmntypes import BattleContext
+import config
+import metrics
+import replay
+import visualize
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+FRAME_SIZE_BUCKETS = [2**i * 1024 for i in range(3, 13)]
+
+
+def _init_worker(warm_sprites: Sequence[int]):
+	visualize.assets.preload()
+	visualize.sprites.warm(warm_sprites)
+
+
+def _worker_caches() -> dict[str, visualize.ImageCache]:
+	return {"sprite": visualize.sprites, "layer": visualize.layers}
+
+
+def _render_frame(snapshot: visualize.BattleSnapshot, profile: str) -> tuple[
+	bytes, float, float, dict[str, tuple[int, int]]]:
+	# images are cached in the process that renders them, so report back how the caches did
+	before = {name: (c.hits, c.misses) for name, c in _worker_caches().items()}
+	start = time.perf_counter()
+	im = visualize.visualize_battle(snapshot)
+	composed = time.perf_counter()
+	data = visualize.output_profiles[profile].encode(im)
+	encoded = time.perf_counter()
+	cache_counts = {
+		name: (c.hits - before[name][0], c.misses - before[name][1])
+		for name, c in _worker_caches().items()
+	}
+	return data, composed - start, encoded - composed, cache_counts
+
+
+def _render_replay(
+	round_replay: replay.RoundReplay, profile: str
+) -> tuple[bytes, float, float, dict[str, tuple[int, int]]]:
+	before = {name: (c.hits, c.misses) for name, c in _worker_caches().items()}
+	start = time.perf_counter()
+	frames = replay.frames(round_replay)
+	composed = time.perf_counter()
+	data = replay.animation_profiles[profile].encode(frames)
+	encoded = time.perf_counter()
+	cache_counts = {
+		name: (c.hits - before[name][0], c.misses - before[name][1])
+		for name, c in _worker_caches().items()
+	}
+	return data, composed - start, encoded - composed, cache_counts
+
+
+class RenderCache:
+	"""Encoded battle images, keyed by :meth:`visualize.BattleSnapshot.digest` and output profile.
+
+	The least recently used images are evicted once all of them together take up more than `max_bytes`.
+
+	:param max_bytes: The most bytes of images to keep. 0 disables the cache.
+	:param registry: The registry to count cache hits, misses and evictions in.
+	"""
+
+	def __init__(self, max_bytes: int, registry: metrics.Registry = metrics.registry):
+		self.max_bytes = max_bytes
+		self.size = 0
+		self._images: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+		self.hits = registry.counter(
+			"render_cache_total",
+			"Battle image lookups, by whether they were served from the cache.",
+			result="hit"
+		)
+		self.misses = registry.counter(
+			"render_cache_total",
+			"Battle image lookups, by whether they were served from the cache.",
+			result="miss"
+		)
+		self.evictions = registry.counter(
+			"render_cache_evictions_total", "Battle images evicted from the cache."
+		)
+		self.size_gauge = registry.gauge(
+			"render_cache_bytes", "Bytes of battle images in the cache."
+		)
+
+	def __len__(self) -> int:
+		return len(self._images)
+
+	def __contains__(self, key: str) -> bool:
+		return key in self._images
+
+	def get(self, key: str) -> Optional[bytes]:
+		"""Get a cached image, and mark it as recently used.
+
+		:returns: The image, or `None` if it isn't cached.
+		"""
+		png = self._images.get(key)
+		if png is None:
+			self.misses.inc()
+			return None
+		self.hits.inc()
+		self._images.move_to_end(key)
+		return png
+
+	def put(self, key: str, png: bytes):
+		"""Cache an image, evicting the least recently used images if the cache is full. Images bigger than the whole cache aren't cached."""
+		if len(png) > self.max_bytes:
+			return
+		old = self._images.pop(key, None)
+		if old is not None:
+			self.size -= len(old)
+		self._images[key] = png
+		self.size += len(png)
+		while self.size > self.max_bytes:
+			_, evicted = self._images.popitem(last=False)
+			self.size -= len(evicted)
+			self.evictions.inc()
+		self.size_gauge.set(self.size)
+
+
+class Renderer:
+	"""Renders battle images and round replays in a pool of worker processes.
+
+	Only a :class:`visualize.BattleSnapshot` or a :class:`replay.RoundReplay` is sent to the workers. They compose and encode it in the requested output or animation profile, and send back the encoded bytes, how long composing and encoding took, and how their sprite and layer caches did, which are counted in this process's metrics.
+
+	Rendered images are cached by what they show, see :class:`RenderCache`, so a frame that was already rendered for one agent or spectator costs nothing for the next one. Renders of a frame that is already being rendered wait for that render instead of starting another.
+
+	:param processes: The number of worker processes. 0 renders in the event loop's default thread pool instead, which keeps the event loop responsive but still competes with it for the GIL.
+	:param cache_bytes: The most bytes of rendered images to cache.
+	:param warm_sprites: The national dex numbers of pokemon whose sprites each worker process loads when it starts, see :meth:`visualize.SpriteCache.warm`.
+	"""
+
+	def __init__(
+		self,
+		processes: int = 0,
+		cache_bytes: int = 0,
+		warm_sprites: Sequence[int] = (),
+		registry: metrics.Registry = metrics.registry
+	):
+		self.processes = processes
+		self.warm_sprites = warm_sprites
+		self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+		self.cache = RenderCache(cache_bytes, registry)
+		self._pending: dict[str, asyncio.Future[bytes]] = {}
+		self.queue_depth = registry.gauge(
+			"render_queue_depth",
+			"Battle images and replays waiting to be rendered, or being rendered."
+		)
+		self.render_time = registry.histogram(
+			"render_seconds", "How long rendering and encoding a battle image took."
+		)
+		self.latency = registry.histogram(
+			"render_latency_seconds",
+			"How long it took to get a battle image, including waiting for a free worker."
+		)
+		self.worker_cache_counters = {
+			name:
+			tuple(
+				registry.counter(
+					f"render_{name}_cache_total",
+					f"Lookups in the {name} cache of the process that rendered them, by whether they were hits.",
+					result=result
+				) for result in ("hit", "miss")
+			)
+			for name in _worker_caches()
+		}
+		self.errors = registry.counter(
+			"render_errors_total", "Battle images that failed to render."
+		)
+		self.encode_time = {
+			profile:
+			registry.histogram(
+				"render_encode_seconds",
+				"How long encoding a battle image took, by output profile.",
+				profile=profile
+			)
+			for profile in visualize.output_profiles
+		}
+		self.frame_size = {
+			profile:
+			registry.histogram(
+				"render_frame_bytes",
+				"Size of encoded battle images, by output profile.",
+				buckets=FRAME_SIZE_BUCKETS,
+				profile=profile
+			)
+			for profile in visualize.output_profiles
+		}
+		self.replay_time = registry.histogram(
+			"render_replay_seconds",
+			"How long rendering and encoding a round replay took."
+		)
+		self.replay_size = registry.histogram(
+			"render_replay_bytes",
+			"Size of encoded round replays.",
+			buckets=FRAME_SIZE_BUCKETS
+		)
+
+	def pool(self) -> Optional[concurrent.futures.ProcessPoolExecutor]:
+		"""Get the pool of worker processes, starting it if needed.
+
+		:returns: The pool, or `None` if rendering isn't done in worker processes.
+		"""
+		if self.processes > 0 and self._pool is None:
+			log.info(f"starting {self.processes} render workers")
+			# forking a process that already runs threads can leave the workers stuck on locks that were held when it forked
+			self._pool = concurrent.futures.ProcessPoolExecutor(
+				self.processes,
+				mp_context=multiprocessing.get_context("forkserver"),
+				initializer=_init_worker,
+				initargs=(self.warm_sprites, )
+			)
+		return self._pool
+
+	async def render(
+		self,
+		snapshot: Union[BattleContext, visualize.BattleSnapshot],
+		profile: str = "png"
+	) -> bytes:
+		"""Render a battle image.
+
+		:param snapshot: What to render. A battle context is snapshotted first.
+		:param profile: How to encode the image, one of :data:`visualize.output_profiles`.
+		:returns: The encoded image.
+		"""
+		assert profile in visualize.output_profiles, f"Invalid output profile: {profile}"
+		if isinstance(snapshot, BattleContext):
+			snapshot = visualize.BattleSnapshot.from_context(snapshot)
+		key = f"{snapshot.digest()}:{profile}"
+		png = self.cache.get(key)
+		if png is not None:
+			return png
+		pending = self._pending.get(key)
+		if pending is None or pending.get_loop() is not asyncio.get_event_loop():
+			pending = asyncio.ensure_future(self._render(snapshot, profile))
+			pending.add_done_callback(lambda f: self._finish(key, f))
+			self._pending[key] = pending
+		# shielded, so that a caller giving up doesn't cancel the render for everyone else
+		return await asyncio.shield(pending)
+
+	def _finish(self, key: str, pending: asyncio.Future[bytes]):
+		if self._pending.get(key) is pending:
+			del self._pending[key]
+		if not pending.cancelled() and pending.exception() is None:
+			self.cache.put(key, pending.result())
+
+	async def _render(self, snapshot: visualize.BattleSnapshot, profile: str) -> bytes:
+		data, compose_time, encode_time = await self._run(
+			_render_frame, snapshot, profile
+		)
+		self.render_time.observe(compose_time + encode_time)
+		self.encode_time[profile].observe(encode_time)
+		self.frame_size[profile].observe(len(data))
+		log.debug(
+			f"rendered {profile} frame: {len(data)} bytes, composed in {compose_time * 1000:.1f}ms, encoded in {encode_time * 1000:.1f}ms"
+		)
+		return data
+
+	async def render_replay(
+		self, round_replay: replay.RoundReplay, profile: str = "gif"
+	) -> bytes:
+		"""Render the replay of a round, see :mod:`replay`.
+
+		Replays are different every round, so they aren't cached.
+
+		:param profile: How to encode the replay, one of :data:`replay.animation_profiles`.
+		:returns: The encoded animation.
+		"""
+		assert profile in replay.animation_profiles, f"Invalid animation profile: {profile}"
+		data, compose_time, encode_time = await self._run(
+			_render_replay, round_replay, profile
+		)
+		self.replay_time.observe(compose_time + encode_time)
+		self.replay_size.observe(len(data))
+		log.debug(
+			f"rendered {profile} replay of {len(round_replay.events)} events: {len(data)} bytes, composed in {compose_time * 1000:.1f}ms, encoded in {encode_time * 1000:.1f}ms"
+		)
+		return data
+
+	async def _run(self, render, *args) -> tuple[bytes, float, float]:
+		loop = asyncio.get_event_loop()
+		start = time.perf_counter()
+		with self.queue_depth.track():
+			try:
+				data, compose_time, encode_time, cache_counts = await loop.run_in_executor(
+					self.pool(), render, *args
+				)
+			except concurrent.futures.process.BrokenProcessPool:
+				# a worker died, so the pool can't be used anymore
+				log.error("render worker died, restarting render workers")
+				self.errors.inc()
+				self.close()
+				raise
+			except Exception:
+				self.errors.inc()
+				raise
+		for name, (hits, misses) in cache_counts.items():
+			self.worker_cache_counters[name][0].inc(hits)
+			self.worker_cache_counters[name][1].inc(misses)
+		self.latency.observe(time.perf_counter() - start)
+		return data, compose_time, encode_time
+
+	def close(self):
+		"""Stop the worker processes. They are started again by the next render."""
+		if self._pool is not None:
+			self._pool.shutdown(wait=False)
+			self._pool = None
+
+
+assert all(
+	profile in visualize.output_profiles
+	for profile in (config.RENDER_PROFILE, config.RENDER_DM_PROFILE)
+), "RENDER_PROFILE and RENDER_DM_PROFILE must be one of: " + ", ".join(
+	visualize.output_profiles
+)
+
+assert config.ROUND_REPLAY_PROFILE in (
+	"off", *replay.animation_profiles
+), "ROUND_REPLAY_PROFILE must be one of: off, " + ", ".join(replay.animation_profiles)
+
+renderer = Renderer(
+	config.RENDER_PROCESSES, config.RENDER_CACHE_BYTES, config.SPRITE_CACHE_WARMUP
+)
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
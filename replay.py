@@ -0,0 +1,329 @@
+"""Animated replays of battle rounds, built from the transactions of the round.
+
+A replay starts from what the battle looked like before the round, and plays back everything that changed what it looks like: HP going down and up, pokemon fainting, status conditions appearing and going away, and pokemon being sent out. Everything else that happened, such as moves being used and the weather changing, is shown as a caption.
+"""
+from typing import Optional
+from dataclasses import dataclass, replace
+import io
+import math
+from PIL import Image, ImageDraw
+from pkmntypes import BattleContext, BattleWeather, Move, MoveFailReason, StatusCondition, Target, Team, Transaction
+import util
+import visualize
+
+__exclude_exports__ = set(dir())
+
+# how long each part of a replay is shown for, in milliseconds
+HP_STEP_DURATION = 60
+EVENT_DURATION = 700
+END_DURATION = 2500
+# a replay never has more frames than this, no matter how much happened in the round
+MAX_FRAMES = 80
+
+weather_captions = {
+	BattleWeather.ClearSkies: "The weather is now clear.",
+	BattleWeather.HarshSunlight: "The sunlight turned harsh.",
+	BattleWeather.Rain: "It started to rain.",
+	BattleWeather.Sandstorm: "A sandstorm brewed.",
+	BattleWeather.Hail: "It started to hail.",
+	BattleWeather.Fog: "The fog is deep...",
+}
+
+
+@dataclass(frozen=True)
+class ReplayEvent:
+	"""Something that happened during a round.
+
+	:param caption: Describes what happened.
+	:param side: The pokemon that the event changed. 0 is the pokemon that the replay is from the perspective of, and 1 is its opponent. `None` if the event doesn't change either of them.
+	:param hp: The pokemon's HP after the event, if it changed.
+	:param status: The pokemon's non-volatile status condition after the event, if it changed.
+	:param pokemon: The pokemon that was sent out, if one was.
+	"""
+
+	caption: str
+	side: Optional[int] = None
+	hp: Optional[int] = None
+	status: Optional[int] = None
+	pokemon: Optional[visualize.PokemonSnapshot] = None
+
+
+@dataclass(frozen=True)
+class RoundReplay:
+	"""Everything that is needed to render the replay of a round. Like :class:`visualize.BattleSnapshot`, it is small and cheap to pickle.
+
+	:param start: What the battle looked like before the round.
+	:param events: What happened during the round, in order.
+	"""
+
+	start: visualize.BattleSnapshot
+	events: tuple[ReplayEvent, ...]
+
+	@classmethod
+	def from_transactions(
+		cls, ctx: BattleContext, transactions: list[Transaction], teams: list[Team]
+	) -> "RoundReplay":
+		"""Build the replay of a round.
+
+		:param ctx: The battle context from before the round, whose perspective the replay is from.
+		:param transactions: The transactions of the round.
+		:param teams: The teams in the battle, to look up the pokemon that transactions refer to.
+		"""
+		start = visualize.BattleSnapshot.from_context(ctx)
+		# the party and slot of the pokemon on each side, which changes when a pokemon is sent out
+		slots = [
+			(ctx.target_pokemon.party, ctx.target_pokemon.slot),
+			(ctx.opponents[0].party, ctx.opponents[0].slot),
+		]
+		sides = [start.pokemon, start.opponent]
+		events: list[ReplayEvent] = []
+
+		def _side(target: Target) -> Optional[int]:
+			if (target.party, target.slot) in slots:
+				return slots.index((target.party, target.slot))
+			return None
+
+		def _name(target: Target) -> str:
+			side = _side(target)
+			if side is not None:
+				return sides[side].name
+			return util.resolve_target(teams, target).pokemon.Name
+
+		def _change(
+			target: Target,
+			caption: str,
+			hp: Optional[int] = None,
+			status: Optional[int] = None
+		):
+			side = _side(target)
+			if side is None:
+				events.append(ReplayEvent(caption))
+				return
+			if hp is not None:
+				sides[side] = replace(sides[side], current_hp=hp)
+			if status is not None:
+				sides[side] = replace(sides[side], status=status)
+			events.append(ReplayEvent(caption, side, hp=hp, status=status))
+
+		for t in transactions:
+			if t.name == "UseMoveTransaction":
+				target = Target(**t.args["Target"])
+				user = Target(**t.args["User"])
+				move = Move(**t.args["Move"])
+				events.append(
+					ReplayEvent(f"{_name(user)} used {move.name} on {_name(target)}!")
+				)
+			elif t.name == "MoveFailTransaction":
+				user = Target(**t.args["User"])
+				reason = MoveFailReason(t.args["Reason"])
+				if reason == MoveFailReason.miss:
+					msg = "missed"
+				elif reason == MoveFailReason.dodge:
+					msg = "was dodged"
+				else:
+					msg = "failed"
+				events.append(ReplayEvent(f"{_name(user)}'s move {msg}."))
+			elif t.name == "DamageTransaction":
+				target = Target(**t.args["Target"])
+				side = _side(target)
+				hp = max(
+					sides[side].current_hp - t.args["Damage"], 0
+				) if side is not None else None
+				caption = f"{_name(target)} took {t.args['Damage']} damage."
+				status = StatusCondition(t.args["StatusEffect"])
+				if status != 0:
+					caption = caption[:-1] + f" from being {status.past_tense}."
+				_change(target, caption, hp=hp)
+			elif t.name == "HealTransaction":
+				target = Target(**t.args["Target"])
+				side = _side(target)
+				hp = min(
+					sides[side].current_hp + t.args["Amount"], sides[side].max_hp
+				) if side is not None else None
+				_change(target, f"{_name(target)} restored {t.args['Amount']} HP.", hp=hp)
+			elif t.name == "FaintTransaction":
+				target = Target(**t.args["Target"])
+				_change(target, f"{_name(target)} fainted.", hp=0)
+			elif t.name == "InflictStatusTransaction":
+				target = Target(**t.args["Target"])
+				status = StatusCondition(t.args["StatusEffect"])
+				caption = f"{_name(target)} was {status.past_tense}."
+				if status.non_volatile != StatusCondition.NonVolatile.none:
+					_change(target, caption, status=int(status.non_volatile))
+				else:
+					events.append(ReplayEvent(caption))
+			elif t.name == "CureStatusTransaction":
+				target = Target(**t.args["Target"])
+				status = StatusCondition(t.args["StatusEffect"])
+				caption = f"{_name(target)} is no longer {status.past_tense}!"
+				if status.non_volatile != StatusCondition.NonVolatile.none:
+					_change(target, caption, status=0)
+				else:
+					events.append(ReplayEvent(caption))
+			elif t.name == "ImmobilizeTransaction":
+				target = Target(**t.args["Target"])
+				status = StatusCondition(t.args["StatusEffect"])
+				events.append(ReplayEvent(f"{_name(target)} is {status.past_tense}!"))
+			elif t.name == "SendOutTransaction":
+				target = Target(**t.args["Target"])
+				if getattr(target, "pokemon", None) is None:
+					target = util.resolve_target(teams, target)
+				pkmn = visualize.PokemonSnapshot.from_pokemon(target.pokemon)
+				caption = f"{pkmn.name} was sent out."
+				parties = [party for party, _ in slots]
+				side = parties.index(target.party) if target.party in parties else None
+				if side is None:
+					events.append(ReplayEvent(caption))
+				else:
+					slots[side] = (target.party, target.slot)
+					sides[side] = pkmn
+					events.append(ReplayEvent(caption, side, pokemon=pkmn))
+			elif t.name == "WeatherTransaction":
+				weather = BattleWeather(t.args["Weather"])
+				events.append(
+					ReplayEvent(
+						weather_captions.get(
+							weather, f"The weather changed to {weather}."
+						)
+					)
+				)
+			elif t.name == "EndBattleTransaction":
+				events.append(ReplayEvent("The battle has ended."))
+		return cls(start, tuple(events))
+
+
+def draw_caption(im: Image.Image, text: str):
+	"""Draw a caption in the bottom left corner of a battle image, where nothing else is drawn."""
+	size = visualize.info_box_scale
+	font = visualize.assets.font(int(12 * size))
+	left, top, right, bottom = 16, im.height - 58, 590, im.height - 10
+	draw = ImageDraw.Draw(im, "RGBA")
+	draw.rounded_rectangle((left, top, right, bottom), radius=10, fill=(0, 0, 0, 170))
+	max_width = right - left - 24
+	if draw.textlength(text, font=font) > max_width:
+		while text and draw.textlength(text + "...", font=font) > max_width:
+			text = text[:-1]
+		text += "..."
+	draw.text((left + 12, top + 8), text, fill=(255, 255, 255), font=font)
+
+
+def frames(
+	replay: RoundReplay,
+	layer_cache: Optional[visualize.ImageCache] = None
+) -> list[tuple[Image.Image, int]]:
+	"""Render the frames of a replay.
+
+	Frames are built out of cached layers, see :func:`visualize.visualize_battle`, so that frames in which only HP bars and status conditions change are cheap.
+
+	:returns: Each frame, with how long it is shown for in milliseconds.
+	"""
+	events = replay.events
+	hp_steps = 6
+	changes = sum(e.hp is not None for e in events)
+	while hp_steps > 1 and len(events) + changes * (hp_steps - 1) > MAX_FRAMES:
+		hp_steps //= 2
+	# if there are still too many events, only every few of them are drawn. The others still change what is drawn next, so the replay ends in the same state as the round.
+	stride = math.ceil(len(events) / MAX_FRAMES)
+
+	result = []
+	sides = [replay.start.pokemon, replay.start.opponent]
+
+	def _frame(caption: Optional[str], duration: int):
+		im = visualize.visualize_battle(visualize.BattleSnapshot(*sides), layer_cache)
+		if caption:
+			draw_caption(im, caption)
+		result.append((im, duration))
+
+	_frame(None, EVENT_DURATION)
+	for i, event in enumerate(events):
+		drawn = (i + 1) % stride == 0 or i == len(events) - 1
+		side = event.side
+		if side is None:
+			if drawn:
+				_frame(event.caption, EVENT_DURATION)
+			continue
+		if drawn and event.hp is not None:
+			start_hp = sides[side].current_hp
+			for step in range(1, hp_steps):
+				hp = round(start_hp + (event.hp - start_hp) * step / hp_steps)
+				sides[side] = replace(sides[side], current_hp=hp)
+				_frame(event.caption, HP_STEP_DURATION)
+		if event.pokemon is not None:
+			sides[side] = event.pokemon
+		if event.hp is not None:
+			sides[side] = replace(sides[side], current_hp=event.hp)
+		if event.status is not None:
+			sides[side] = replace(sides[side], status=event.status)
+		if drawn:
+			_frame(event.caption, EVENT_DURATION)
+	_frame(None, END_DURATION)
+	return result
+
+
+@dataclass(frozen=True)
+class AnimationProfile:
+	"""How replays are encoded.
+
+	:param format: The animated format that PIL encodes to.
+	:param extension: The file extension of that format.
+	:param scale: Resize frames by this much before encoding them.
+	:param colors: Quantize every frame to the same palette of this many colors, taken from a sample of the frames. Frames only differ where something changed then, so formats that store the differences between frames, like GIF, only store what changed. 0 keeps every frame in RGB.
+	:param options: Passed to :meth:`PIL.Image.Image.save`. Replays are recaps of a round, so they should play once, which each format says differently.
+	"""
+
+	format: str
+	extension: str
+	scale: float = 0.5
+	colors: int = 0
+	options: tuple[tuple[str, object], ...] = ()
+
+	def encode(self, frames: list[tuple[Image.Image, int]]) -> bytes:
+		"""Encode the frames of a replay as one animated image."""
+		images: list[Image.Image] = []
+		for im, _ in frames:
+			if self.scale != 1:
+				im = im.resize(
+					visualize.scale(im.size, self.scale), Image.Resampling.BILINEAR
+				)
+			images.append(im.convert("RGB"))
+		if self.colors:
+			palette = _palette(images, self.colors)
+			images = [
+				im.quantize(palette=palette, dither=Image.Dither.NONE) for im in images
+			]
+		with io.BytesIO() as data:
+			images[0].save(
+				data,
+				self.format,
+				save_all=True,
+				append_images=images[1:],
+				duration=[duration for _, duration in frames],
+				**dict(self.options)
+			)
+			return data.getvalue()
+
+
+def _palette(images: list[Image.Image], colors: int, samples: int = 8) -> Image.Image:
+	# pokemon that are sent out during the round aren't in the first frame, so the palette is taken from frames all through the replay
+	sample = images[::max(1, len(images) // samples)] + [images[-1]]
+	width, height = sample[0].size
+	strip = Image.new("RGB", (width, height * len(sample)))
+	for i, im in enumerate(sample):
+		strip.paste(im, (0, height * i))
+	return strip.quantize(colors, method=Image.Quantize.FASTOCTREE)
+
+
+animation_profiles = {
+	# a GIF without a loop count plays once
+	"gif": AnimationProfile("GIF", "gif", colors=256),
+	"webp": AnimationProfile("WEBP", "webp", options=(("quality", 75), ("loop", 1))),
+	"apng": AnimationProfile("PNG", "png", options=(("loop", 1), )),
+}
+
+
+def render(replay: RoundReplay, profile: str = "gif") -> bytes:
+	"""Render a replay, encoded with one of the :data:`animation_profiles`."""
+	return animation_profiles[profile].encode(frames(replay))
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
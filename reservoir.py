@@ -0,0 +1,191 @@
+"""Keeps a warm stock of pre-generated pokemon, so that battles can be set up without waiting on the battle API."""
+from typing import Any, Optional
+import asyncio
+import collections
+from pkmntypes import *
+import battleapi
+import config
+import logging, coloredlogs
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+
+class PokemonReservoir:
+	"""A stock of randomly generated pokemon, keyed by level and optionally by natdex number.
+
+	Only stocks that have been registered with :meth:`warm` are kept filled. Taking a pokemon that isn't in stock falls back to generating it with the battle API.
+
+	:param stock_size: The number of pokemon to keep in each stock.
+	:param refill_concurrency: The maximum number of pokemon to generate at the same time while refilling.
+	"""
+
+	retry_delay = 5
+
+	def __init__(self, stock_size: int, refill_concurrency: int):
+		self.stock_size = stock_size
+		self.refill_concurrency = refill_concurrency
+		self._stock: dict[tuple[Optional[int], Optional[int]],
+							collections.deque[Pokemon]] = {}
+		self._targets: dict[tuple[Optional[int], Optional[int]], int] = {}
+		# used as an ordered set of the stocks that need refilling
+		self._pending: dict[tuple[Optional[int], Optional[int]], None] = {}
+		self._worker: Optional[asyncio.Task[None]] = None
+		self._worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+	def warm(
+		self,
+		level: Optional[int] = None,
+		natdex: Optional[int] = None,
+		stock_size: Optional[int] = None
+	) -> None:
+		"""Keep a stock of pokemon with the given parameters.
+
+		:param stock_size: Override the number of pokemon to keep in this stock.
+		"""
+		key = (level, natdex)
+		self._targets[key] = stock_size if stock_size != None else self.stock_size
+		self._stock.setdefault(key, collections.deque())
+		self._request_refill(key)
+
+	async def start(self) -> None:
+		"""Start filling all the stocks registered with :meth:`warm`."""
+		for key in self._targets:
+			self._request_refill(key)
+
+	async def stop(self) -> None:
+		"""Stop refilling stocks. Pokemon that are already in stock can still be taken."""
+		if self._worker is not None and not self._worker.done():
+			self._worker.cancel()
+		self._worker = None
+		self._worker_loop = None
+
+	def available(self, level: Optional[int] = None, natdex: Optional[int] = None) -> int:
+		"""Get the number of pokemon currently in stock for the given parameters."""
+		return len(self._stock.get((level, natdex), ()))
+
+	async def take(
+		self, level: Optional[int] = None, natdex: Optional[int] = None
+	) -> Pokemon:
+		"""Take a pokemon out of the reservoir, or generate one if none are in stock."""
+		pkmn = self._pop(level, natdex)
+		if pkmn is None:
+			pkmn = await battleapi.generate_pokemon(natdex=natdex, level=level)
+		return pkmn
+
+	async def take_many(self, specs: list[dict[str, Any]]) -> list[Pokemon]:
+		"""Take several pokemon out of the reservoir, generating the ones that aren't in stock.
+
+		:param specs: The `level` and `natdex` of each pokemon.
+		:returns: The pokemon, in the same order as `specs`.
+		"""
+		taken = [self._pop(spec.get("level"), spec.get("natdex")) for spec in specs]
+		missing = [i for i, pkmn in enumerate(taken) if pkmn is None]
+		if len(missing) > 0:
+			log.debug(
+				f"{len(missing)}/{len(specs)} pokemon not in stock, generating them"
+			)
+			generated = await battleapi.generate_many([specs[i] for i in missing])
+			for i, pkmn in zip(missing, generated):
+				taken[i] = pkmn
+		return [pkmn for pkmn in taken if pkmn is not None]
+
+	def _pop(self, level: Optional[int], natdex: Optional[int]) -> Optional[Pokemon]:
+		key = (level, natdex)
+		stock = self._stock.get(key)
+		pkmn = stock.popleft() if stock else None
+		self._request_refill(key)
+		return pkmn
+
+	def _request_refill(self, key: tuple[Optional[int], Optional[int]]) -> None:
+		if key not in self._targets or len(self._stock[key]) >= self._targets[key]:
+			return
+		self._pending[key] = None
+		try:
+			loop = asyncio.get_running_loop()
+		except RuntimeError:
+			# not running yet, refilling will begin with `start()`
+			return
+		if self._worker is None or self._worker.done() or self._worker_loop is not loop:
+			self._worker = loop.create_task(self._refill())
+			self._worker_loop = loop
+
+	async def _refill(self) -> None:
+		while len(self._pending) > 0:
+			key = next(iter(self._pending))
+			del self._pending[key]
+			level, natdex = key
+			stock = self._stock[key]
+			missing = self._targets[key] - len(stock)
+			if missing <= 0:
+				continue
+			batch = min(missing, self.refill_concurrency)
+			try:
+				pkmn = await battleapi.generate_many(
+					[{
+						"level": level,
+						"natdex": natdex
+					}] * batch,
+					limit=self.refill_concurrency
+				)
+			except Exception as e:
+				log.error(
+					f"Failed to refill pokemon reservoir (level={level} natdex={natdex}): {e}"
+				)
+				self._pending[key] = None
+				await asyncio.sleep(self.retry_delay)
+				continue
+			stock.extend(pkmn)
+			if len(stock) < self._targets[key]:
+				# go to the back of the line so other stocks get filled too
+				self._pending[key] = None
+
+
+class StarterCatalogue:
+	"""The pokemon that new users can pick from, generated ahead of time so they can be shown instantly.
+
+	The catalogue is only used for display, each user gets a freshly rolled copy of the pokemon they pick.
+
+	:param dexnums: The natdex numbers of the starters.
+	:param level: The level that starters are given at.
+	"""
+
+	def __init__(self, dexnums: list[int], level: int = 5):
+		self.dexnums = dexnums
+		self.level = level
+		self._entries: Optional[list[Pokemon]] = None
+		self._loading: Optional[asyncio.Future[list[Pokemon]]] = None
+
+	async def load(self) -> list[Pokemon]:
+		"""Generate the catalogue, if it hasn't been already.
+
+		:returns: One example of each starter, in the same order as `dexnums`.
+		"""
+		if self._entries is not None:
+			return self._entries
+		if self._loading is None or self._loading.done():
+			self._loading = asyncio.ensure_future(self._generate())
+		self._entries = await asyncio.shield(self._loading)
+		return self._entries
+
+	async def roll(self, index: int) -> Pokemon:
+		"""Get a new copy of the starter at `index` in the catalogue."""
+		return await pokemon.take(level=self.level, natdex=self.dexnums[index])
+
+	async def _generate(self) -> list[Pokemon]:
+		log.debug(f"Generating starter catalogue: {self.dexnums}")
+		return await battleapi.generate_many(
+			[{
+				"natdex": natdex,
+				"level": self.level
+			} for natdex in self.dexnums]
+		)
+
+
+pokemon = PokemonReservoir(
+	config.POKEMON_RESERVOIR_STOCK_SIZE, config.POKEMON_RESERVOIR_REFILL_CONCURRENCY
+)
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -0,0 +1,176 @@
+"""Admission control for battles, so that a burst of battles waits in a queue instead of slowing every battle down."""
+from typing import AsyncIterator, Optional
+import asyncio
+import bisect
+import collections
+import contextlib
+import itertools
+import time
+import logging, coloredlogs
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+# lower priorities are admitted first
+PRIORITY_HUMANS = 0
+PRIORITY_BOTS = 1
+
+
+class Ticket:
+	"""A place in the :class:`BattleScheduler`'s queue.
+
+	:param priority: Tickets with a lower priority are admitted first. Tickets with the same priority are admitted in the order they were submitted.
+	:param guild_id: The guild that the battle is in, if any.
+	"""
+
+	def __init__(self, priority: int, seq: int, guild_id: Optional[int] = None):
+		self.priority = priority
+		self.seq = seq
+		self.guild_id = guild_id
+		self.admitted = False
+		self.released = False
+		self.submitted_at = time.perf_counter()
+		self._waiter: Optional[asyncio.Future[None]] = None
+
+	@property
+	def key(self) -> tuple[int, int]:
+		"""Get the key that the queue is ordered by."""
+		return self.priority, self.seq
+
+	def __repr__(self) -> str:
+		return f"Ticket<priority={self.priority} seq={self.seq} guild={self.guild_id} admitted={self.admitted}>"
+
+
+class BattleScheduler:
+	"""Limits how many battles can be in progress at the same time, overall and in each guild.
+
+	Battles that can't start yet wait in a queue, ordered by priority and then by the order they were submitted in. Battles that are held back by their guild's limit don't hold back battles in other guilds.
+
+	:param max_running: The maximum number of battles in progress at the same time. 0 means no limit.
+	:param max_running_per_guild: The maximum number of battles in progress at the same time in each guild. 0 means no limit.
+	"""
+
+	def __init__(self, max_running: int = 0, max_running_per_guild: int = 0):
+		self.max_running = max_running
+		self.max_running_per_guild = max_running_per_guild
+		self.running = 0
+		self.running_per_guild: collections.Counter[int] = collections.Counter()
+		self._queue: list[Ticket] = []
+		self._keys: list[tuple[int, int]] = []
+		self._seq = itertools.count()
+		self.running_gauge = metrics.registry.gauge(
+			"battles_running", "Battles that are in progress."
+		)
+		self.queued_gauge = metrics.registry.gauge(
+			"battles_queued", "Battles waiting for a free slot to start in."
+		)
+		self.wait_time = metrics.registry.histogram(
+			"battle_queue_wait_seconds", "How long battles waited in the queue to start."
+		)
+
+	@property
+	def queued(self) -> int:
+		"""Get the number of battles waiting to start."""
+		return len(self._queue)
+
+	def submit(
+		self, priority: int = PRIORITY_BOTS, guild_id: Optional[int] = None
+	) -> Ticket:
+		"""Ask for a slot to run a battle in. The ticket is admitted right away if there's a free slot.
+
+		:returns: The ticket. Wait for it with :meth:`wait`, and give the slot back with :meth:`release`.
+		"""
+		ticket = Ticket(priority, next(self._seq), guild_id)
+		i = bisect.bisect(self._keys, ticket.key)
+		self._keys.insert(i, ticket.key)
+		self._queue.insert(i, ticket)
+		self._dispatch()
+		if not ticket.admitted:
+			log.info(f"battle queued at position {self.position(ticket)}: {ticket}")
+		return ticket
+
+	def position(self, ticket: Ticket) -> int:
+		"""Get the position of a ticket in the queue, starting at 1.
+
+		:returns: The position, or 0 if the ticket isn't waiting.
+		"""
+		if ticket.admitted:
+			return 0
+		i = bisect.bisect_left(self._keys, ticket.key)
+		if i < len(self._queue) and self._queue[i] is ticket:
+			return i + 1
+		return 0
+
+	async def wait(self, ticket: Ticket):
+		"""Wait until the ticket is admitted."""
+		if ticket.admitted:
+			return
+		loop = asyncio.get_event_loop()
+		if ticket._waiter is None or ticket._waiter.get_loop() is not loop:
+			ticket._waiter = loop.create_future()
+		await ticket._waiter
+
+	def release(self, ticket: Ticket):
+		"""Give back the ticket's slot, or leave the queue if it hasn't been admitted yet. Releasing a ticket more than once does nothing."""
+		if ticket.released:
+			return
+		ticket.released = True
+		if ticket.admitted:
+			self.running -= 1
+			if ticket.guild_id is not None:
+				self.running_per_guild[ticket.guild_id] -= 1
+				if self.running_per_guild[ticket.guild_id] == 0:
+					del self.running_per_guild[ticket.guild_id]
+		else:
+			i = self.position(ticket) - 1
+			del self._queue[i]
+			del self._keys[i]
+		self._dispatch()
+
+	@contextlib.asynccontextmanager
+	async def slot(self,
+					priority: int = PRIORITY_BOTS,
+					guild_id: Optional[int] = None) -> AsyncIterator[Ticket]:
+		"""Hold a slot for the duration of the `async with` block, waiting for one if needed."""
+		ticket = self.submit(priority, guild_id)
+		try:
+			await self.wait(ticket)
+			yield ticket
+		finally:
+			self.release(ticket)
+
+	def _is_full(self) -> bool:
+		return self.max_running > 0 and self.running >= self.max_running
+
+	def _has_room(self, ticket: Ticket) -> bool:
+		if ticket.guild_id is None or self.max_running_per_guild <= 0:
+			return True
+		return self.running_per_guild[ticket.guild_id] < self.max_running_per_guild
+
+	def _dispatch(self):
+		i = 0
+		while i < len(self._queue) and not self._is_full():
+			ticket = self._queue[i]
+			if not self._has_room(ticket):
+				i += 1
+				continue
+			del self._queue[i]
+			del self._keys[i]
+			self.running += 1
+			if ticket.guild_id is not None:
+				self.running_per_guild[ticket.guild_id] += 1
+			ticket.admitted = True
+			self.wait_time.observe(time.perf_counter() - ticket.submitted_at)
+			if ticket._waiter is not None and not ticket._waiter.done():
+				ticket._waiter.set_result(None)
+		self.running_gauge.set(self.running)
+		self.queued_gauge.set(len(self._queue))
+
+
+battles = BattleScheduler(config.BATTLE_MAX_RUNNING, config.BATTLE_MAX_RUNNING_PER_GUILD)
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
@@ -3,6 +3,8 @@ from quart import Quart, Response
 import quart
 import json
 import coordinator
+import metrics
+import scheduler
 import logging
 
 app = Quart(__name__)
@@ -12,15 +14,32 @@ app = Quart(__name__)
 async def status(): # noqa: D103
 	output = [
 		f'Active battles: {len(coordinator.battles)}',
+		f'Queued battles: {scheduler.battles.queued}',
 	]
-	for i, battle in enumerate(coordinator.battles):
+	for battle in coordinator.battles.snapshot():
 		output += [
-			f"Battle {i}:",
+			f"Battle {battle.bid}:",
 			f"Agents: {[str(a) for a in battle.agents]}"
 			"",
 			"Transactions:",
 		]
 		for transaction in battle.transactions:
-			output += [f"{transaction.name}<{transaction.type}>: {transaction.pretty()}"]
+			output += [
+				f"{transaction.name}<{transaction.type}>: {transaction.pretty(battle.teams)}"
+			]
 
 	return "<br>\n".join(map(quart.escape, output))
+
+
+@app.route('/metrics')
+async def get_metrics():
+	"""Export all metrics in the Prometheus text format."""
+	return Response(
+		metrics.registry.render_prometheus(), mimetype="text/plain; version=0.0.4"
+	)
+
+
+@app.route('/metrics.json')
+async def get_metrics_json():
+	"""Export all metrics as JSON, including latency percentiles."""
+	return metrics.registry.snapshot()
@@ -0,0 +1,130 @@
+"""Silhouettes of pokemon for the "Who's That Pokemon?" minigame.
+
+Silhouettes are saved in `SILHOUETTE_CACHE_DIR`, so each one only has to be made once. Build all of them ahead of time with `python silhouettes.py`. The bot also builds the missing ones in the background when it starts.
+"""
+from typing import Iterable, Optional
+from pathlib import Path
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import tempfile
+import time
+import logging, coloredlogs
+from PIL import Image
+import config
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+# the umask can only be read by setting it, which changes it for every thread, so it is read once on import, before any threads that create files are started
+_umask = os.umask(0)
+os.umask(_umask)
+
+__exclude_exports__ = set(dir())
+
+sprite_path = "./images/{natdex}.png"
+background_path = "./images/background.png"
+sprite_pos = (60, 60)
+
+
+def path(natdex: int) -> Path:
+	"""Get the path that the silhouette of a pokemon is saved at."""
+	return Path(config.SILHOUETTE_CACHE_DIR) / f"{natdex}.png"
+
+
+def all_natdexes() -> list[int]:
+	"""Get the national dex numbers of every pokemon that has a sprite."""
+	return sorted(int(p.stem) for p in Path("./images").glob("*.png") if p.stem.isdigit())
+
+
+def render(natdex: int) -> Image.Image:
+	"""Render the silhouette of a pokemon: every pixel of its sprite that isn't fully transparent is painted black, on the minigame background."""
+	sprite = Image.open(sprite_path.format(natdex=natdex)).convert("RGBA")
+	mask = sprite.getchannel("A").point(lambda a: 255 if a > 0 else 0)
+	im = Image.open(background_path).convert("RGBA")
+	im.paste(
+		(0, 0, 0, 255),
+		(*sprite_pos, sprite_pos[0] + sprite.width, sprite_pos[1] + sprite.height), mask
+	)
+	return im
+
+
+def build(natdex: int, force: bool = False) -> Path:
+	"""Make sure that the silhouette of a pokemon is saved, rendering it if it isn't.
+
+	The silhouette is written to a temporary file first, and then moved into place, so that a silhouette that is being built is never read half written.
+
+	:param force: Render the silhouette even if it is already saved.
+	:returns: The path that the silhouette is saved at.
+	"""
+	dest = path(natdex)
+	if dest.exists() and not force:
+		return dest
+	dest.parent.mkdir(parents=True, exist_ok=True)
+	fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{natdex}.", suffix=".png")
+	try:
+		with os.fdopen(fd, "wb") as f:
+			render(natdex).save(f, "PNG")
+		# mkstemp only lets the owner read the file, but silhouettes should be readable like any other file that is created
+		os.chmod(tmp, 0o644 & ~_umask)
+		os.replace(tmp, dest)
+	except BaseException:
+		os.unlink(tmp)
+		raise
+	return dest
+
+
+def build_all(
+	natdexes: Optional[Iterable[int]] = None,
+	processes: int = 1,
+	force: bool = False
+) -> int:
+	"""Build the silhouettes of many pokemon.
+
+	:param natdexes: The pokemon to build silhouettes of. Defaults to all of them.
+	:param processes: The number of processes to build silhouettes in.
+	:returns: The number of silhouettes that were rendered.
+	"""
+	if natdexes is None:
+		natdexes = all_natdexes()
+	todo = [n for n in natdexes if force or not path(n).exists()]
+	if processes > 1:
+		with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+			list(pool.map(build, todo, [force] * len(todo), chunksize=16))
+	else:
+		for natdex in todo:
+			build(natdex, force)
+	return len(todo)
+
+
+async def get(natdex: int) -> Path:
+	"""Get the path to the silhouette of a pokemon, building it without blocking the event loop if it hasn't been built yet."""
+	dest = path(natdex)
+	if dest.exists():
+		return dest
+	return await asyncio.get_event_loop().run_in_executor(None, build, natdex)
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument(
+		"natdexes",
+		nargs="*",
+		type=int,
+		metavar="NATDEX",
+		help="The pokemon to build silhouettes of. Defaults to all of them."
+	)
+	parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+	parser.add_argument(
+		"-f",
+		"--force",
+		action="store_true",
+		help="Rebuild silhouettes that already exist."
+	)
+	args = parser.parse_args()
+	start = time.perf_counter()
+	built = build_all(args.natdexes or None, args.processes, args.force)
+	log.info(f"built {built} silhouettes in {time.perf_counter() - start:.1f} seconds")
@@ -15,6 +15,7 @@ class TestBattleApi(unittest.TestCase):
 		asyncio.set_event_loop(self.loop)
 
 	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
 		self.loop.close()
 
 	@given(
@@ -33,6 +34,22 @@ class TestBattleApi(unittest.TestCase):
 
 		return self.loop.run_until_complete(go())
 
+	def test_generate_many(self):
+
+		async def go():
+			natdexes = [25, 1, 396, 7, 4]
+			pkmn = await battleapi.generate_many(
+				[{
+					"natdex": natdex,
+					"level": 5
+				} for natdex in natdexes], limit=2
+			)
+			self.assertEqual([p.NatDex for p in pkmn], natdexes)
+			for p in pkmn:
+				self.assertEqual(p.Level, 5)
+
+		return self.loop.run_until_complete(go())
+
 	def test_battle_results(self):
 
 		async def go():
@@ -56,7 +73,7 @@ class TestBattleApi(unittest.TestCase):
 				if round_result.ended:
 					break
 				for t in round_result.transactions:
-					print(t.pretty())
+					print(t.pretty(teams))
 			bresults = await battleapi.get_results(bid)
 			self.assertEqual(bresults.parties[0].pokemon[0].NatDex, 25)
 			self.assertEqual(bresults.parties[1].pokemon[0].NatDex, 396)
@@ -0,0 +1,89 @@
+import unittest
+from pkmntypes import *
+from reservoir import PokemonReservoir, StarterCatalogue
+import asyncio
+import battleapi
+
+
+class TestPokemonReservoir(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+
+	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
+		self.loop.close()
+
+	def test_take_without_stock(self):
+
+		async def go():
+			reservoir = PokemonReservoir(stock_size=2, refill_concurrency=2)
+			pkmn = await reservoir.take(level=12)
+			self.assertIsInstance(pkmn, Pokemon)
+			self.assertEqual(pkmn.Level, 12)
+			self.assertEqual(
+				reservoir.available(level=12), 0,
+				"should not stock levels that aren't warm"
+			)
+
+		return self.loop.run_until_complete(go())
+
+	def test_refill(self):
+
+		async def go():
+			reservoir = PokemonReservoir(stock_size=3, refill_concurrency=2)
+			reservoir.warm(level=30)
+			reservoir.warm(level=5, natdex=25, stock_size=1)
+			for _ in range(100):
+				stocked = [
+					reservoir.available(level=30),
+					reservoir.available(level=5, natdex=25)
+				]
+				if stocked == [3, 1]:
+					break
+				await asyncio.sleep(0.1)
+			self.assertEqual(reservoir.available(level=30), 3)
+			self.assertEqual(reservoir.available(level=5, natdex=25), 1)
+
+			specs = [dict(level=30)] * 4 + [dict(level=5, natdex=25)]
+			pkmn = await reservoir.take_many(specs)
+			self.assertEqual(len(pkmn), 5)
+			self.assertEqual(
+				len(set(map(id, pkmn))), 5, "should not hand out the same pokemon twice"
+			)
+			for p in pkmn[:4]:
+				self.assertEqual(p.Level, 30)
+			self.assertEqual(pkmn[4].NatDex, 25)
+			await reservoir.stop()
+
+		return self.loop.run_until_complete(go())
+
+
+class TestStarterCatalogue(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+
+	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
+		self.loop.close()
+
+	def test_roll(self):
+
+		async def go():
+			catalogue = StarterCatalogue([1, 4, 7], level=5)
+			entries = await catalogue.load()
+			self.assertEqual([p.NatDex for p in entries], [1, 4, 7])
+			self.assertIs(await catalogue.load(), entries, "should only generate once")
+			pkmn = await catalogue.roll(1)
+			self.assertEqual(pkmn.NatDex, 4)
+			self.assertEqual(pkmn.Level, 5)
+			self.assertIsNot(pkmn, entries[1], "should not hand out the catalogue's copy")
+
+		return self.loop.run_until_complete(go())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import time
+from types import SimpleNamespace
+import discord
+import metrics
+from attachments import *
+
+
+class FakeChannel:
+
+	def __init__(self):
+		self.sent = []
+
+	async def send(self, content=None, *, embed=None, file=None):
+		self.sent += [(content, embed.image.url, file)]
+		expiry = hex(int(time.time()) + 3600)[2:]
+		attachments = [
+			SimpleNamespace(
+				url=f"https://cdn.example.com/{len(self.sent)}/{file.filename}?ex={expiry}"
+			)
+		] if file else []
+		return SimpleNamespace(attachments=attachments)
+
+
+class TestAttachmentCache(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.cache = AttachmentCache(registry=metrics.Registry())
+		self.channel = FakeChannel()
+
+	def tearDown(self):
+		self.loop.close()
+
+	def test_url_expiry(self):
+		self.assertEqual(
+			url_expiry("https://cdn.example.com/a.png?ex=65a0b1c2&is=1"), 0x65a0b1c2
+		)
+		self.assertIsNone(url_expiry("https://cdn.example.com/a.png"))
+
+	def test_reuses_upload(self):
+		renders = []
+
+		async def _image():
+			renders.append(1)
+			return b"png"
+
+		for _ in range(3):
+			self.loop.run_until_complete(
+				self.cache.send(
+					self.channel, "battle:1", _image, "battle.png", discord.Embed()
+				)
+			)
+		self.assertEqual(len(renders), 1)
+		self.assertIsNotNone(self.channel.sent[0][2])
+		self.assertEqual(self.channel.sent[0][1], "attachment://battle.png")
+		for _, url, file in self.channel.sent[1:]:
+			self.assertIsNone(file)
+			self.assertTrue(url.startswith("https://cdn.example.com/1/battle.png"))
+		self.assertEqual(self.cache.hits.value, 2)
+		self.assertEqual(self.cache.uploaded_bytes.value, 3)
+
+	def test_expired_url_uploaded_again(self):
+		self.cache.put("sprite:1", "https://cdn.example.com/1.png?ex=1")
+		self.assertIsNone(self.cache.get("sprite:1"))
+		self.cache.max_age = 0
+		self.cache.put("sprite:1", "https://cdn.example.com/1.png")
+		self.assertIsNone(self.cache.get("sprite:1"))
+		self.assertEqual(self.cache.expired.value, 2)
@@ -0,0 +1,301 @@
+import unittest
+import asyncio
+from turns import *
+from pkmntypes import *
+import util
+import battleapi
+import codec
+import metrics
+from fakeapi import FakeBattleApi
+
+
+class TestBattleApiClient(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original_client = battleapi.client
+		self.fakes: list[FakeBattleApi] = []
+
+	def tearDown(self):
+
+		async def tearDown_async():
+			await battleapi.client.close()
+			for fake in self.fakes:
+				await fake.stop()
+
+		self.loop.run_until_complete(tearDown_async())
+		self.loop.close()
+		battleapi.client = self.original_client
+
+	async def start_fakes(self, n: int, **kwargs) -> list[FakeBattleApi]:
+		self.fakes = [FakeBattleApi(seed=i, **kwargs) for i in range(n)]
+		urls = [await fake.start() for fake in self.fakes]
+		battleapi.client = battleapi.BattleApiClient(urls, registry=metrics.Registry())
+		return self.fakes
+
+	def test_battle_id_routing(self):
+		client = battleapi.BattleApiClient(["http://a", "http://b", "http://c"])
+		for backend in client.backends:
+			for backend_battle_id in range(5):
+				bid = client.battle_id(backend, backend_battle_id)
+				self.assertEqual(client.route(bid), (backend, backend_battle_id))
+
+	def test_single_backend_ids_unchanged(self):
+		client = battleapi.BattleApiClient(["http://a"])
+		self.assertEqual(client.battle_id(client.backends[0], 7), 7)
+
+	def test_sharded_battles(self):
+
+		async def go():
+			fakes = await self.start_fakes(2)
+			pkmn = await battleapi.generate_many([{"level": 20}] * 2)
+
+			async def play() -> int:
+				teams = util.build_teams_single([pkmn[0]], [pkmn[1]])
+				bid: int = (await battleapi.create_battle(teams))["bid"]
+				while True:
+					for target in range(2):
+						ctx = await battleapi.get_battle_context(bid, target)
+						opponent = ctx.opponents[0]
+						turn = FightTurn(party=opponent.party, slot=opponent.slot, move=0)
+						await battleapi.submit_turn(bid, target, turn)
+					if (await battleapi.simulate(bid)).ended:
+						break
+				await battleapi.get_results(bid)
+				return bid
+
+			bids = await asyncio.gather(*[play() for _ in range(6)])
+			self.assertEqual(
+				len(set(bids)), 6, "battle ids should be unique across backends"
+			)
+			self.assertEqual([len(fake.battles) for fake in fakes], [3, 3])
+			for fake in fakes:
+				self.assertEqual(fake.requests["/battle/new"], 3)
+				self.assertEqual(
+					fake.requests["/battle/results"], 3,
+					"requests should be routed to the backend the battle lives on"
+				)
+
+		return self.loop.run_until_complete(go())
+
+	def test_least_loaded(self):
+		client = battleapi.BattleApiClient(["http://a", "http://b"])
+		a, b = client.backends
+		a.in_flight = 2
+		self.assertIs(client.least_loaded(), b)
+		a.in_flight = 0
+		self.assertEqual(
+			{client.least_loaded().url,
+				client.least_loaded().url}, {a.url, b.url}
+		)
+
+	def test_endpoint_metrics(self):
+
+		async def go():
+			await self.start_fakes(1)
+			await battleapi.generate_many([{}] * 3)
+			stats = battleapi.client.stats()["/pokedex/generate"]
+			self.assertEqual(stats["requests"], 3)
+			self.assertEqual(stats["in_flight"], 0)
+			self.assertGreater(stats["received_bytes"], 0)
+			self.assertIsNotNone(stats["p99"])
+
+		return self.loop.run_until_complete(go())
+
+	def test_context_single_flight(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			pkmn = await battleapi.generate_many([{"level": 50}] * 2)
+			teams = util.build_teams_single([pkmn[0]], [pkmn[1]])
+			bid = (await battleapi.create_battle(teams))["bid"]
+
+			contexts = await asyncio.gather(
+				*[battleapi.get_battle_context(bid, 0) for _ in range(3)]
+			)
+			self.assertIs(contexts[0], contexts[1])
+			self.assertIs(contexts[0], contexts[2])
+			self.assertIs(await battleapi.get_battle_context(bid, 0), contexts[0])
+			await battleapi.get_battle_context(bid, 1)
+			self.assertEqual(fakes[0].requests["/battle/context"], 2)
+
+			for target in range(2):
+				await battleapi.submit_turn(
+					bid, target, FightTurn(party=1 - target, slot=0, move=0)
+				)
+			fakes[0].inject_fault("/battle/simulate", status=400)
+			with self.assertRaises(battleapi.BattleApiError):
+				await battleapi.simulate(bid)
+			self.assertIs(
+				await battleapi.get_battle_context(bid, 0), contexts[0],
+				"a failed simulate should keep the cached contexts"
+			)
+			await battleapi.simulate(bid)
+			self.assertIsNot(await battleapi.get_battle_context(bid, 0), contexts[0])
+			self.assertEqual(
+				fakes[0].requests["/battle/context"], 3,
+				"simulating a round should invalidate the cached contexts"
+			)
+
+		return self.loop.run_until_complete(go())
+
+	def test_hedged_request(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			client = battleapi.client
+			client.min_samples = 5
+			await battleapi.generate_many([{}] * 5)
+			fakes[0].inject_fault("/pokedex/generate", stall=5)
+			await asyncio.wait_for(battleapi.generate_pokemon(), 1)
+			self.assertEqual(client.stats()["/pokedex/generate"]["hedges"], 1)
+			self.assertEqual(fakes[0].requests["/pokedex/generate"], 7)
+
+		return self.loop.run_until_complete(go())
+
+	def test_retry_server_error(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			fakes[0].inject_fault("/pokedex/generate", status=503)
+			await battleapi.generate_pokemon()
+			self.assertEqual(battleapi.client.stats()["/pokedex/generate"]["retries"], 1)
+
+			fakes[0].inject_fault("/pokedex/generate", status=503, count=3)
+			with self.assertRaises(battleapi.BattleApiError) as cm:
+				await battleapi.generate_pokemon()
+			self.assertEqual(cm.exception.status, 503)
+
+		return self.loop.run_until_complete(go())
+
+	def test_timeout_not_retried(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			pkmn = await battleapi.generate_many([{}] * 2)
+			bid = (
+				await
+				battleapi.create_battle(util.build_teams_single([pkmn[0]], [pkmn[1]]))
+			)["bid"]
+			battleapi.client.max_timeout = 0.2
+			fakes[0].inject_fault("/battle/simulate", stall=5)
+			with self.assertRaises(battleapi.BattleApiError) as cm:
+				await battleapi.simulate(bid)
+			# depending on the aiohttp version, a timeout is raised as a timeout or as a dropped connection
+			self.assertTrue(cm.exception.sent)
+			self.assertEqual(
+				fakes[0].requests["/battle/simulate"], 1,
+				"simulating is not idempotent, so it should not be sent again"
+			)
+			self.assertEqual(battleapi.client.stats()["/battle/simulate"]["retries"], 0)
+
+		return self.loop.run_until_complete(go())
+
+	def test_server_error_not_retried(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			pkmn = await battleapi.generate_many([{}] * 2)
+			bid = (
+				await
+				battleapi.create_battle(util.build_teams_single([pkmn[0]], [pkmn[1]]))
+			)["bid"]
+			fakes[0].inject_fault("/battle/act", status=500)
+			with self.assertRaises(battleapi.BattleApiError) as cm:
+				await battleapi.submit_turn(bid, 0, FightTurn(party=1, slot=0, move=0))
+			self.assertEqual(cm.exception.status, 500)
+			self.assertEqual(fakes[0].requests["/battle/act"], 1)
+
+			fakes[0].inject_fault("/battle/simulate", status=503)
+			with self.assertRaises(battleapi.BattleApiError) as cm:
+				await battleapi.simulate(bid)
+			self.assertEqual(cm.exception.status, 503)
+			self.assertEqual(
+				fakes[0].requests["/battle/simulate"], 1,
+				"a simulate that failed with a server error may have advanced the battle already"
+			)
+			self.assertEqual(len(fakes[0].battles), 1)
+
+		return self.loop.run_until_complete(go())
+
+	def test_unsent_request_retried(self):
+
+		async def go():
+			# nothing listens on port 1, so the request never reaches a battle api
+			client = battleapi.BattleApiClient(
+				["http://127.0.0.1:1"], registry=metrics.Registry()
+			)
+			client.retry_backoff = 0.01
+			try:
+				with self.assertRaises(battleapi.BattleApiError) as cm:
+					await client.request(
+						"POST", "/battle/new", data=codec.dumps({"teams": []})
+					)
+			finally:
+				await client.close()
+			self.assertFalse(cm.exception.sent)
+			self.assertEqual(client.stats()["/battle/new"]["retries"], client.retries)
+
+		return self.loop.run_until_complete(go())
+
+	def test_circuit_breaker(self):
+		client = battleapi.BattleApiClient(["http://a", "http://b"])
+		a, b = client.backends
+		a.breaker = battleapi.CircuitBreaker(threshold=2, cooldown=60)
+		a.breaker.record_failure()
+		self.assertFalse(a.breaker.is_open)
+		a.breaker.record_failure()
+		self.assertTrue(a.breaker.is_open)
+		self.assertEqual([client.least_loaded() for _ in range(3)], [b, b, b])
+		a.breaker.cooldown = 0
+		self.assertFalse(a.breaker.is_open)
+		a.breaker.record_success()
+		self.assertEqual(a.breaker.failures, 0)
+
+	def test_slow_request_not_timed_out(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			client = battleapi.client
+			client.min_samples = 5
+			client.min_timeout = 0.05
+			pkmn = await battleapi.generate_many([{}] * 2)
+			teams = util.build_teams_single([pkmn[0]], [pkmn[1]])
+			for _ in range(5):
+				await battleapi.create_battle(teams)
+			self.assertLess(client.timeout("/battle/new"), 0.3)
+			fakes[0].inject_fault("/battle/new", stall=0.3)
+			await battleapi.create_battle(teams)
+			self.assertEqual(client.stats()["/battle/new"]["timeouts"], 0)
+
+		return self.loop.run_until_complete(go())
+
+	def test_pinned_request_ignores_breaker(self):
+
+		async def go():
+			fakes = await self.start_fakes(1)
+			pkmn = await battleapi.generate_many([{}] * 2)
+			bid = (
+				await
+				battleapi.create_battle(util.build_teams_single([pkmn[0]], [pkmn[1]]))
+			)["bid"]
+			breaker = battleapi.client.backends[0].breaker
+			for _ in range(breaker.threshold):
+				breaker.record_failure()
+			self.assertTrue(breaker.is_open)
+			await battleapi.get_battle_context(bid, 0)
+			self.assertEqual(fakes[0].requests["/battle/context"], 1)
+			self.assertFalse(breaker.is_open, "a success should close the breaker")
+
+			for _ in range(breaker.threshold):
+				breaker.record_failure()
+			with self.assertRaises(battleapi.BattleApiError) as cm:
+				await battleapi.generate_pokemon()
+			self.assertFalse(cm.exception.sent)
+
+		return self.loop.run_until_complete(go())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import json
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+	def test_corpus_is_reproducible(self):
+		a = benchmark.make_corpus(5, seed=1)
+		b = benchmark.make_corpus(5, seed=1)
+		self.assertEqual(len(a), 5)
+		self.assertEqual(
+			[(ctx.pokemon.NatDex, ctx.pokemon.CurrentHP) for ctx in a],
+			[(ctx.pokemon.NatDex, ctx.pokemon.CurrentHP) for ctx in b]
+		)
+
+	def test_percentile(self):
+		samples = list(range(1, 101))
+		self.assertEqual(benchmark.percentile(samples, 95), 95)
+		self.assertEqual(benchmark.percentile(samples, 100), 100)
+		self.assertEqual(benchmark.percentile([3], 95), 3)
+		self.assertEqual(benchmark.percentile([], 95), 0)
+
+	def test_every_benchmark_has_inputs(self):
+		corpus = benchmark.make_corpus(10)
+		for name, b in benchmark.benchmarks.items():
+			with self.subTest(benchmark=name):
+				if name.startswith("encode_"):
+					continue
+				self.assertGreater(len(b.inputs(corpus)), 0)
+
+	def test_run(self):
+		report = benchmark.run(
+			["visualize_battle", "get_element_type_img", "encode_mobile"],
+			corpus_size=2,
+			repeat=2,
+			warmup=0
+		)
+		self.assertEqual(report["corpus_size"], 2)
+		results = {r["name"]: r for r in report["benchmarks"]}
+		self.assertEqual(results["visualize_battle"]["runs"], 4)
+		self.assertEqual(results["visualize_battle"]["output_bytes"], 1280 * 720 * 4)
+		self.assertGreater(results["encode_mobile"]["mean"], 0)
+		self.assertGreater(results["encode_mobile"]["p95"], 0)
+		self.assertEqual(json.loads(json.dumps(report)), report)
+
+	def test_format_table(self):
+		report = {
+			"commit":
+			"abc",
+			"benchmarks": [
+				{
+					"name": "x",
+					"runs": 1,
+					"mean": 0.002,
+					"p95": 0.003,
+					"peak_memory": 2**20,
+					"output_bytes": 2048
+				}
+			]
+		}
+		baseline = {
+			"commit": "def",
+			"benchmarks": [dict(report["benchmarks"][0], mean=0.001)]
+		}
+		table = benchmark.format_table(report, baseline)
+		self.assertIn("vs def", table)
+		self.assertIn("+100.0%", table)
@@ -0,0 +1,194 @@
+import unittest
+from typing import Optional
+import asyncio
+import random
+from types import SimpleNamespace
+import discord
+from pkmntypes import *
+import attachments
+import coordinator
+import fakeapi
+import metrics
+import render
+import scheduler
+
+
+def make_battle(bid: int, user_ids: list[int], channel_id=None) -> coordinator.Battle:
+	channel = SimpleNamespace(id=channel_id) if channel_id is not None else None
+	battle = coordinator.Battle(teams=[], original_channel=channel)
+	battle.bid = bid
+	battle.agents = [coordinator.Agent(user=SimpleNamespace(id=u)) for u in user_ids]
+	battle.add_bot("simple")
+	return battle
+
+
+class TestBattleRegistry(unittest.TestCase):
+
+	def test_indexes(self):
+		registry = coordinator.BattleRegistry()
+		a = make_battle(1, [10, 11], channel_id=100)
+		b = make_battle(2, [10], channel_id=100)
+		c = make_battle(3, [], channel_id=200)
+		for battle in [a, b, c]:
+			registry.add(battle)
+		self.assertEqual(len(registry), 3)
+		self.assertIs(registry.get(2), b)
+		self.assertEqual(registry.by_user(10), [a, b])
+		self.assertEqual(registry.by_user(11), [a])
+		self.assertEqual(registry.by_user(12), [])
+		self.assertEqual(registry.by_channel(100), [a, b])
+		self.assertEqual(registry.by_channel(200), [c])
+
+		self.assertTrue(registry.remove(a))
+		self.assertFalse(registry.remove(a))
+		self.assertNotIn(a, registry)
+		self.assertIsNone(registry.get(1))
+		self.assertEqual(registry.by_user(10), [b])
+		self.assertEqual(registry.by_user(11), [])
+		self.assertEqual(registry.by_channel(100), [b])
+
+	def test_iterate_while_removing(self):
+		registry = coordinator.BattleRegistry()
+		for bid in range(5):
+			registry.add(make_battle(bid, [bid]))
+		for battle in registry:
+			registry.remove(battle)
+		self.assertEqual(len(registry), 0)
+
+	def test_duplicate_bid(self):
+		registry = coordinator.BattleRegistry()
+		registry.add(make_battle(1, []))
+		with self.assertRaises(AssertionError):
+			registry.add(make_battle(1, []))
+		self.assertFalse(registry.remove(make_battle(1, [])))
+
+	def test_pending(self):
+		registry = coordinator.BattleRegistry()
+		battle = make_battle(None, [10], channel_id=100)
+		registry.add_pending(battle)
+		self.assertEqual(len(registry), 0)
+		self.assertEqual(registry.by_user(10), [battle])
+		self.assertEqual(registry.by_channel(100), [battle])
+
+		battle.bid = 1
+		registry.add(battle)
+		self.assertIs(registry.get(1), battle)
+		self.assertEqual(registry.by_user(10), [battle])
+		self.assertTrue(registry.remove(battle))
+		self.assertEqual(registry.by_user(10), [])
+
+		pending = make_battle(None, [10])
+		registry.add_pending(pending)
+		self.assertTrue(registry.remove(pending))
+		self.assertFalse(registry.remove(pending))
+		self.assertEqual(registry.by_user(10), [])
+
+
+class FakeChannel:
+
+	def __init__(self, id: int = 100):
+		self.id = id
+		self.sent: list[tuple[Optional[str], Optional[str]]] = []
+
+	async def send(self, content=None, *, embed=None, file=None):
+		self.sent += [
+			(
+				embed.image.url if embed is not None else None,
+				file.filename if file else None
+			)
+		]
+		return SimpleNamespace(attachments=[])
+
+
+class TestStart(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original = scheduler.battles, coordinator.battles
+		scheduler.battles = scheduler.BattleScheduler(max_running=1)
+		coordinator.battles = coordinator.BattleRegistry()
+
+	def tearDown(self):
+		scheduler.battles, coordinator.battles = self.original
+		self.loop.close()
+
+	def test_queued_battle_is_registered(self):
+		running = scheduler.battles.submit()
+		channel = FakeChannel()
+		battle = coordinator.Battle(teams=[], original_channel=channel)
+		battle.agents = [coordinator.Agent(user=SimpleNamespace(id=10))]
+		task = self.loop.create_task(battle.start())
+		self.loop.run_until_complete(asyncio.sleep(0.01))
+		self.assertEqual(scheduler.battles.queued, 1)
+		self.assertEqual(coordinator.battles.by_user(10), [battle])
+		self.assertEqual(coordinator.battles.by_channel(channel.id), [battle])
+		self.assertEqual(len(coordinator.battles), 0)
+
+		task.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			self.loop.run_until_complete(task)
+		self.assertEqual(coordinator.battles.by_user(10), [])
+		self.assertEqual(scheduler.battles.queued, 0)
+		scheduler.battles.release(running)
+
+
+class TestSendReplay(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original = render.renderer, attachments.cache
+		render.renderer = render.Renderer(registry=metrics.Registry())
+		attachments.cache = attachments.AttachmentCache(registry=metrics.Registry())
+		rng = random.Random(0)
+		teams = [
+			{
+				"parties":
+				[{
+					"pokemon": [fakeapi.generate_pokemon(rng, natdex, 50, None)]
+				}]
+			} for natdex in (1, 4)
+		]
+		self.ctx = BattleContext(**fakeapi.FakeBattle(teams, rng).context(0))
+		self.channel = FakeChannel()
+		self.battle = coordinator.Battle(teams=[], original_channel=self.channel)
+
+	def tearDown(self):
+		render.renderer, attachments.cache = self.original
+		self.loop.close()
+
+	def test_replay(self):
+		transactions = [
+			Transaction(
+				type=0,
+				name="DamageTransaction",
+				args={
+					"Target": {
+						"Party": 1,
+						"Slot": 0,
+						"Team": 1
+					},
+					"Damage": 10,
+					"StatusEffect": 0
+				}
+			)
+		]
+		self.loop.run_until_complete(
+			self.battle.send_replay(self.ctx, transactions, discord.Embed())
+		)
+		self.assertEqual(self.channel.sent, [("attachment://round.gif", "round.gif")])
+
+	def test_broken_replay_sends_frame(self):
+		transactions = [
+			Transaction(type=0, name="DamageTransaction", args={"Damage": 10})
+		]
+		self.loop.run_until_complete(
+			self.battle.send_replay(self.ctx, transactions, discord.Embed())
+		)
+		self.assertEqual(len(self.channel.sent), 1)
+		self.assertTrue(self.channel.sent[0][1].startswith("battle."))
+
+
+if __name__ == "__main__":
+	unittest.main()
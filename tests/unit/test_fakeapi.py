@@ -0,0 +1,106 @@
+import unittest
+import asyncio
+import time
+from turns import *
+from pkmntypes import *
+import util
+import battleapi
+import metrics
+import battle_ai
+from fakeapi import FakeBattleApi
+
+
+class TestFakeBattleApi(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original_client = battleapi.client
+
+	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
+		self.loop.close()
+		battleapi.client = self.original_client
+
+	async def start_fake(self, **kwargs) -> FakeBattleApi:
+		fake = FakeBattleApi(**kwargs)
+		battleapi.client = battleapi.BattleApiClient(
+			[await fake.start()], registry=metrics.Registry()
+		)
+		return fake
+
+	def test_generate_is_deterministic(self):
+
+		async def go():
+			names = []
+			for _ in range(2):
+				fake = await self.start_fake(seed=42)
+				pkmn = [await battleapi.generate_pokemon(level=50) for _ in range(3)]
+				names += [[(p.NatDex, p.Stats, [m.name for m in p.Moves]) for p in pkmn]]
+				await fake.stop()
+			self.assertEqual(names[0], names[1])
+
+		return self.loop.run_until_complete(go())
+
+	def test_generate_params(self):
+
+		async def go():
+			fake = await self.start_fake()
+			pkmn = await battleapi.generate_pokemon(natdex=25, level=28, moves=[84, 33])
+			self.assertEqual(pkmn.NatDex, 25)
+			self.assertEqual(pkmn.Level, 28)
+			self.assertEqual([m.name for m in pkmn.Moves], ["Thunder Shock", "Tackle"])
+			self.assertEqual(pkmn.CurrentHP, pkmn.Stats[Stat.Hp])
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+	def test_full_battle(self):
+
+		async def go():
+			fake = await self.start_fake(seed=1)
+			pkmn = await battleapi.generate_many([{"level": 30}] * 4)
+			teams = util.build_teams_single(pkmn[:2], pkmn[2:])
+			bid = (await battleapi.create_battle(teams))["bid"]
+			for _ in range(200):
+				for target in range(2):
+					ctx = await battleapi.get_battle_context(bid, target)
+					self.assertEqual(ctx.team, target)
+					self.assertEqual(len(ctx.opponents), 1)
+					turn = battle_ai.strategies["simple"](ctx)
+					await battleapi.submit_turn(bid, target, turn)
+				results = await battleapi.simulate(bid)
+				for t in results.transactions:
+					self.assertFalse(t.pretty(teams).startswith("Failed"), t)
+				if results.ended:
+					break
+			self.assertTrue(results.ended)
+			self.assertEqual(results.transactions[-1].name, "EndBattleTransaction")
+
+			final = await battleapi.get_results(bid)
+			self.assertIn(final.winner, [0, 1])
+			loser = final.parties[1 - final.winner]
+			self.assertTrue(all(p.CurrentHP == 0 for p in loser.pokemon))
+			self.assertEqual(
+				[p.NatDex for party in final.parties for p in party.pokemon],
+				[p.NatDex for p in pkmn]
+			)
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+	def test_latency(self):
+
+		async def go():
+			fake = await self.start_fake(latency=0.05)
+			start = time.perf_counter()
+			await battleapi.generate_pokemon()
+			self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+			self.assertEqual(fake.requests["/pokedex/generate"], 1)
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import asyncio
+import battleapi
+import headless
+import metrics
+import util
+from fakeapi import FakeBattleApi
+
+
+class TestHeadless(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original_client = battleapi.client
+
+	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
+		self.loop.close()
+		battleapi.client = self.original_client
+
+	def test_run_many(self):
+
+		async def go():
+			fake = FakeBattleApi(seed=3)
+			battleapi.client = battleapi.BattleApiClient(
+				[await fake.start()], registry=metrics.Registry()
+			)
+			results = await headless.run_many(
+				4, ["simple", "inflicter"], concurrency=2, level=20, party_size=2
+			)
+			self.assertEqual(len(results), 4)
+			self.assertEqual(len({r.bid for r in results}), 4)
+			for r in results:
+				self.assertIn(r.winner, [0, 1])
+				self.assertGreater(r.rounds, 0)
+				self.assertGreater(r.transactions, 0)
+				self.assertEqual(len(r.decision_time), 2)
+			self.assertEqual(
+				fake.requests["/battle/simulate"], sum(r.rounds for r in results)
+			)
+
+			summary = headless.summarize(results, 1.0)
+			self.assertEqual(summary["battles"], 4)
+			self.assertEqual(sum(summary["wins"].values()), 4)
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+	def test_failed_battle_forgotten(self):
+
+		async def go():
+			fake = FakeBattleApi(seed=3)
+			battleapi.client = battleapi.BattleApiClient(
+				[await fake.start()], registry=metrics.Registry()
+			)
+			pkmn = await battleapi.generate_many([{"level": 100}] * 12)
+			teams = util.build_teams_single(pkmn[:6], pkmn[6:])
+			with self.assertRaises(RuntimeError):
+				await headless.run_battle(["simple", "simple"], teams, max_rounds=1)
+			[bid] = fake.battles
+			self.assertEqual(battleapi.client.contexts.round(bid), 0)
+			self.assertEqual(len(battleapi.client.contexts), 0)
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+	def test_invalid_strategy(self):
+		with self.assertRaises(AssertionError):
+			self.loop.run_until_complete(
+				headless.run_battle(["simple", "nope"], [None, None])
+			)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+	def test_counter_labels(self):
+		registry = metrics.Registry()
+		registry.counter("requests", endpoint="/a").inc()
+		registry.counter("requests", endpoint="/a").inc(2)
+		registry.counter("requests", endpoint="/b").inc()
+		self.assertEqual(registry.counter("requests", endpoint="/a").value, 3)
+		self.assertEqual(registry.counter("requests", endpoint="/b").value, 1)
+
+	def test_histogram(self):
+		hist = metrics.Histogram(buckets=[1, 10])
+		for value in [0.5, 1, 5, 20]:
+			hist.observe(value)
+		self.assertEqual(hist.bucket_counts, [2, 1, 1])
+		self.assertEqual(hist.count, 4)
+		self.assertEqual(hist.sum, 26.5)
+		self.assertEqual(hist.quantile(0.5), 1)
+		self.assertEqual(hist.quantile(1), 20)
+		self.assertIsNone(metrics.Histogram().quantile(0.5))
+
+	def test_histogram_window(self):
+		hist = metrics.Histogram(window=10)
+		for value in range(100):
+			hist.observe(value)
+		self.assertEqual(hist.count, 100)
+		self.assertEqual(hist.quantile(0), 90)
+
+	def test_render_prometheus(self):
+		registry = metrics.Registry()
+		registry.counter("requests_total", "Requests.", endpoint="/a").inc()
+		registry.histogram("latency_seconds", buckets=[0.1, 1],
+							endpoint="/a").observe(0.5)
+		self.assertEqual(
+			registry.render_prometheus().splitlines(), [
+				'# HELP requests_total Requests.',
+				'# TYPE requests_total counter',
+				'requests_total{endpoint="/a"} 1.0',
+				'# TYPE latency_seconds histogram',
+				'latency_seconds_bucket{endpoint="/a",le="0.1"} 0',
+				'latency_seconds_bucket{endpoint="/a",le="1"} 1',
+				'latency_seconds_bucket{endpoint="/a",le="+Inf"} 1',
+				'latency_seconds_sum{endpoint="/a"} 0.5',
+				'latency_seconds_count{endpoint="/a"} 1',
+			]
+		)
+
+	def test_snapshot(self):
+		registry = metrics.Registry()
+		registry.gauge("in_flight", endpoint="/a").set(2)
+		self.assertEqual(
+			registry.snapshot(), {
+				"in_flight": {
+					"type": "gauge",
+					"help": "",
+					"series": [{
+						"labels": {
+							"endpoint": "/a"
+						},
+						"value": 2
+					}],
+				}
+			}
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
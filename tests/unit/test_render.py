@@ -0,0 +1,171 @@
+import unittest
+import asyncio
+import io
+import pickle
+import random
+from PIL import Image
+from pkmntypes import *
+import fakeapi
+import metrics
+import visualize
+from render import *
+
+
+def make_context() -> BattleContext:
+	rng = random.Random(0)
+	teams = [
+		{
+			"parties": [{
+				"pokemon": [fakeapi.generate_pokemon(rng, natdex, 50, None)]
+			}]
+		} for natdex in (1, 4)
+	]
+	battle = fakeapi.FakeBattle(teams, rng)
+	battle.parties[1][0]["StatusEffects"] = int(StatusCondition.NonVolatile.burn)
+	return BattleContext(**battle.context(0))
+
+
+class TestRenderer(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.ctx = make_context()
+
+	def tearDown(self):
+		self.loop.close()
+
+	def test_snapshot(self):
+		snapshot = visualize.BattleSnapshot.from_context(self.ctx)
+		self.assertEqual(snapshot.pokemon.natdex, 1)
+		self.assertEqual(snapshot.opponent.natdex, 4)
+		self.assertEqual(snapshot.opponent.status, StatusCondition.NonVolatile.burn)
+		self.assertEqual(pickle.loads(pickle.dumps(snapshot)), snapshot)
+
+	def test_assets_decoded_once(self):
+		store = visualize.AssetStore()
+		store.preload()
+		self.assertIs(store.background(), store.background())
+		self.assertIs(store.info_box(True, 2), store.info_box(True, 2))
+		self.assertIs(store.font(20), store.font(20))
+		self.assertIsNot(visualize.get_background(), visualize.assets.background())
+
+	def test_sprite_cache_bounded(self):
+		sprite_size = 256 * 256 * 4
+		cache = visualize.SpriteCache(2 * sprite_size)
+		cache.get(1)
+		cache.get(4)
+		self.assertIs(cache.get(1), cache.get(1))
+		cache.get(7)
+		self.assertNotIn(4, cache)
+		self.assertEqual(cache.size, 2 * sprite_size)
+		self.assertEqual(cache.hits, 2)
+		self.assertEqual(cache.misses, 3)
+		self.assertEqual(cache.evictions, 1)
+
+	def test_sprite_cache_warm_does_not_evict(self):
+		cache = visualize.SpriteCache(2 * 256 * 256 * 4)
+		cache.warm([1, 4, 7])
+		self.assertEqual(len(cache), 2)
+		self.assertNotIn(7, cache)
+		self.assertEqual(cache.misses, 0)
+
+	def test_layers_match_full_render(self):
+		layer_cache = visualize.ImageCache(1 << 26)
+		frames = []
+		for hp, status in [(None, 0), (30, 0), (9, StatusCondition.NonVolatile.poison)]:
+			if hp is not None:
+				self.ctx.pokemon.CurrentHP = hp
+				self.ctx.opponents[0].pokemon.CurrentHP = hp
+			self.ctx.pokemon.StatusEffects = StatusCondition(non_volatile=status)
+			frames += [visualize.BattleSnapshot.from_context(self.ctx)]
+		for frame in frames:
+			incremental = visualize.visualize_battle(frame, layer_cache=layer_cache)
+			full = visualize.visualize_battle(frame, layer_cache=visualize.ImageCache(0))
+			self.assertEqual(incremental.tobytes(), full.tobytes())
+		# the scene and both info boxes are only rendered for the first frame
+		self.assertEqual(layer_cache.misses, 3)
+		self.assertEqual(layer_cache.hits, 6)
+
+	def test_output_profiles(self):
+		im = visualize.visualize_battle(visualize.BattleSnapshot.from_context(self.ctx))
+		sizes = {}
+		for name, profile in visualize.output_profiles.items():
+			data = profile.encode(im)
+			decoded = Image.open(io.BytesIO(data))
+			self.assertEqual(decoded.format, profile.format)
+			self.assertEqual(decoded.width, round(im.width * profile.scale))
+			sizes[name] = len(data)
+		self.assertLess(sizes["palette"], sizes["png"])
+		self.assertLess(sizes["mobile"], sizes["webp"])
+
+	def test_frame_metrics_by_profile(self):
+		renderer = Renderer(processes=0, cache_bytes=1 << 20, registry=metrics.Registry())
+
+		async def _test():
+			return await renderer.render(self.ctx, "png"
+											), await renderer.render(self.ctx, "mobile")
+
+		png, mobile = self.loop.run_until_complete(_test())
+		self.assertNotEqual(png, mobile)
+		self.assertEqual(len(renderer.cache), 2)
+		self.assertEqual(renderer.frame_size["mobile"].sum, len(mobile))
+		self.assertEqual(renderer.encode_time["png"].count, 1)
+
+	def test_digest(self):
+		snapshot = visualize.BattleSnapshot.from_context(self.ctx)
+		self.assertEqual(
+			snapshot.digest(),
+			visualize.BattleSnapshot.from_context(self.ctx).digest()
+		)
+		mirrored = visualize.BattleSnapshot(snapshot.opponent, snapshot.pokemon)
+		self.assertNotEqual(snapshot.digest(), mirrored.digest())
+		self.ctx.pokemon.CurrentHP -= 1
+		self.assertNotEqual(
+			snapshot.digest(),
+			visualize.BattleSnapshot.from_context(self.ctx).digest()
+		)
+
+	def test_cache_evicts_least_recently_used(self):
+		cache = RenderCache(10, registry=metrics.Registry())
+		cache.put("a", b"aaaa")
+		cache.put("b", b"bbbb")
+		self.assertEqual(cache.get("a"), b"aaaa")
+		cache.put("c", b"cccc")
+		self.assertNotIn("b", cache)
+		self.assertEqual(cache.size, 8)
+		cache.put("d", b"d" * 11)
+		self.assertNotIn("d", cache)
+		self.assertEqual(cache.evictions.value, 1)
+
+	def test_identical_frames_rendered_once(self):
+		renderer = Renderer(processes=0, cache_bytes=1 << 20, registry=metrics.Registry())
+
+		async def _test():
+			first = await asyncio.gather(
+				renderer.render(self.ctx), renderer.render(self.ctx)
+			)
+			return first + [await renderer.render(self.ctx)]
+
+		pngs = self.loop.run_until_complete(_test())
+		self.assertEqual(len(set(pngs)), 1)
+		self.assertEqual(renderer.render_time.count, 1)
+		self.assertEqual(renderer.cache.hits.value, 1)
+		self.assertEqual(len(renderer.cache), 1)
+
+	def test_render_in_process_pool(self):
+		registry = metrics.Registry()
+		renderer = Renderer(processes=1, registry=registry)
+		try:
+			png = self.loop.run_until_complete(renderer.render(self.ctx))
+		finally:
+			renderer.close()
+		self.assertEqual(
+			png,
+			visualize.encode_snapshot(visualize.BattleSnapshot.from_context(self.ctx))
+		)
+		self.assertTrue(png.startswith(b"\x89PNG"))
+		self.assertEqual(renderer.render_time.count, 1)
+		self.assertEqual(renderer.queue_depth.value, 0)
+		layer_hits, layer_misses = renderer.worker_cache_counters["layer"]
+		self.assertEqual(layer_hits.value + layer_misses.value, 3)
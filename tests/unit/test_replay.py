@@ -0,0 +1,171 @@
+import unittest
+import asyncio
+import dataclasses
+import io
+import pickle
+import random
+from PIL import Image
+from pkmntypes import *
+import fakeapi
+import metrics
+import replay
+import visualize
+from render import Renderer
+
+
+class TestReplay(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		rng = random.Random(0)
+		teams = [
+			{
+				"parties": [
+					{
+						"pokemon": [
+							fakeapi.generate_pokemon(rng, natdex, 50, None)
+							for natdex in natdexes
+						]
+					}
+				]
+			} for natdexes in ((1, 7), (4, ))
+		]
+		self.battle = fakeapi.FakeBattle(teams, rng)
+		self.teams = [
+			Team(parties=[Party(pokemon=[Pokemon(**pkmn) for pkmn in party])])
+			for party in self.battle.parties
+		]
+
+	def tearDown(self):
+		self.loop.close()
+
+	def simulate(self) -> tuple[BattleContext, list[Transaction]]:
+		ctx = BattleContext(**self.battle.context(0))
+		for party in range(2):
+			self.battle.turns[party] = {
+				"type": 0,
+				"args": {
+					"Target": {
+						"Party": 1 - party,
+						"Slot": 0
+					},
+					"move": 0
+				}
+			}
+		results = self.battle.simulate()
+		return ctx, [Transaction(**t) for t in results["Transactions"]]
+
+	def test_damage(self):
+		ctx, transactions = self.simulate()
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		self.assertEqual(pickle.loads(pickle.dumps(round_replay)), round_replay)
+		damage = [t for t in transactions if t.name == "DamageTransaction"]
+		changes = [e for e in round_replay.events if e.hp is not None]
+		self.assertEqual(len(changes), len(damage))
+		for event, t in zip(changes, damage):
+			self.assertEqual(event.side, t.args["Target"]["Party"])
+			self.assertEqual(event.hp, t.args["Target"]["Pokemon"]["CurrentHP"])
+
+	def test_faint_and_send_out(self):
+		self.battle.parties[0][0]["CurrentHP"] = 1
+		ctx, transactions = self.simulate()
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		fainted = [e for e in round_replay.events if e.caption.endswith("fainted.")]
+		self.assertEqual(len(fainted), 1)
+		self.assertEqual((fainted[0].side, fainted[0].hp), (0, 0))
+		sent_out = [e for e in round_replay.events if e.pokemon is not None]
+		self.assertEqual(len(sent_out), 1)
+		self.assertEqual(sent_out[0].side, 0)
+		self.assertEqual(sent_out[0].pokemon.natdex, 7)
+
+	def test_status(self):
+		ctx, _ = self.simulate()
+		target = {"Party": 1, "Slot": 0, "Team": 1}
+		transactions = [
+			Transaction(
+				type=0,
+				name="InflictStatusTransaction",
+				args={
+					"Target": target,
+					"StatusEffect": int(StatusCondition.NonVolatile.burn)
+				}
+			),
+			Transaction(type=0, name="WeatherTransaction", args={"Weather": 2}),
+			Transaction(
+				type=0,
+				name="CureStatusTransaction",
+				args={
+					"Target": target,
+					"StatusEffect": int(StatusCondition.NonVolatile.burn)
+				}
+			),
+		]
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		self.assertEqual(
+			[(e.side, e.status) for e in round_replay.events],
+			[(1, StatusCondition.NonVolatile.burn), (None, None), (1, 0)]
+		)
+		self.assertEqual(round_replay.events[1].caption, "It started to rain.")
+
+	def test_encode(self):
+		ctx, transactions = self.simulate()
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		frames = replay.frames(round_replay)
+		self.assertLessEqual(len(frames), replay.MAX_FRAMES + 2)
+		for name, profile in replay.animation_profiles.items():
+			with self.subTest(profile=name):
+				im = Image.open(io.BytesIO(profile.encode(frames)))
+				self.assertEqual(im.format, profile.format)
+				self.assertGreater(im.n_frames, 1)
+				self.assertEqual(im.size, (640, 360))
+
+	def test_palette_covers_later_frames(self):
+		frames = [
+			(Image.new("RGB", (64, 36), color), 100)
+			for color in [(200, 0, 0), (0, 0, 200)]
+		]
+		im = Image.open(io.BytesIO(replay.animation_profiles["gif"].encode(frames)))
+		self.assertNotIn("loop", im.info, "replays should play once")
+		im.seek(1)
+		self.assertEqual(im.convert("RGB").getpixel((0, 0)), (0, 0, 200))
+
+	def test_frames_capped(self):
+		ctx, _ = self.simulate()
+		target = {"Party": 1, "Slot": 0, "Team": 1}
+		transactions = [
+			Transaction(
+				type=0,
+				name="DamageTransaction",
+				args={
+					"Target": target,
+					"Damage": 1,
+					"StatusEffect": 0
+				}
+			) for _ in range(100)
+		]
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		frames = replay.frames(round_replay)
+		self.assertLessEqual(len(frames), replay.MAX_FRAMES + 2)
+		# every event still counts, even the ones that weren't drawn
+		end = visualize.BattleSnapshot(
+			round_replay.start.pokemon,
+			dataclasses.replace(
+				round_replay.start.opponent,
+				current_hp=max(round_replay.start.opponent.current_hp - 100, 0)
+			)
+		)
+		self.assertEqual(
+			frames[-1][0].tobytes(),
+			visualize.visualize_battle(end).tobytes()
+		)
+
+	def test_renderer(self):
+		ctx, transactions = self.simulate()
+		round_replay = replay.RoundReplay.from_transactions(ctx, transactions, self.teams)
+		registry = metrics.Registry()
+		renderer = Renderer(registry=registry)
+		data = self.loop.run_until_complete(renderer.render_replay(round_replay, "gif"))
+		self.assertEqual(Image.open(io.BytesIO(data)).format, "GIF")
+		self.assertEqual(renderer.replay_size.count, 1)
+		self.assertEqual(renderer.replay_size.sum, len(data))
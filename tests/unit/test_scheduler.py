@@ -0,0 +1,80 @@
+import unittest
+import asyncio
+from scheduler import *
+
+
+class TestBattleScheduler(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+
+	def tearDown(self):
+		self.loop.close()
+
+	def test_global_limit(self):
+		s = BattleScheduler(max_running=2)
+		a, b, c = [s.submit() for _ in range(3)]
+		self.assertTrue(a.admitted and b.admitted)
+		self.assertFalse(c.admitted)
+		self.assertEqual(s.position(c), 1)
+		s.release(a)
+		self.assertTrue(c.admitted)
+		self.assertEqual(s.running, 2)
+		self.assertEqual(s.queued, 0)
+
+	def test_humans_first(self):
+		s = BattleScheduler(max_running=1)
+		running = s.submit(PRIORITY_BOTS)
+		bots = s.submit(PRIORITY_BOTS)
+		humans = s.submit(PRIORITY_HUMANS)
+		self.assertEqual(s.position(humans), 1)
+		self.assertEqual(s.position(bots), 2)
+		s.release(running)
+		self.assertTrue(humans.admitted)
+		self.assertFalse(bots.admitted)
+
+	def test_guild_limit(self):
+		s = BattleScheduler(max_running=3, max_running_per_guild=1)
+		a1 = s.submit(guild_id=1)
+		a2 = s.submit(guild_id=1)
+		b1 = s.submit(guild_id=2)
+		dm = s.submit()
+		self.assertTrue(a1.admitted)
+		self.assertFalse(a2.admitted)
+		self.assertTrue(b1.admitted, "a full guild should not hold back other guilds")
+		self.assertTrue(dm.admitted)
+		s.release(a1)
+		self.assertTrue(a2.admitted)
+
+	def test_leave_queue(self):
+		s = BattleScheduler(max_running=1)
+		a, b, c = [s.submit() for _ in range(3)]
+		s.release(b)
+		s.release(b)
+		self.assertEqual(s.position(c), 1)
+		s.release(a)
+		self.assertTrue(c.admitted)
+		self.assertEqual(s.running, 1)
+
+	def test_slot(self):
+		s = BattleScheduler(max_running=2)
+		active = 0
+		peak = 0
+
+		async def battle():
+			nonlocal active, peak
+			async with s.slot():
+				active += 1
+				peak = max(peak, active)
+				await asyncio.sleep(0.01)
+				active -= 1
+
+		self.loop.run_until_complete(asyncio.gather(*[battle() for _ in range(6)]))
+		self.assertEqual(peak, 2)
+		self.assertEqual(s.running, 0)
+		self.assertEqual(s.queued, 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import asyncio
+import stat
+import tempfile
+from pathlib import Path
+from PIL import Image
+import config
+import silhouettes
+
+
+class TestSilhouettes(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.tmp = tempfile.TemporaryDirectory()
+		self.cache_dir = config.SILHOUETTE_CACHE_DIR
+		config.SILHOUETTE_CACHE_DIR = self.tmp.name
+
+	def tearDown(self):
+		config.SILHOUETTE_CACHE_DIR = self.cache_dir
+		self.tmp.cleanup()
+		self.loop.close()
+
+	def test_sprite_blacked_out(self):
+		sprite = Image.open("./images/25.png").convert("RGBA")
+		im = silhouettes.render(25)
+		x, y = silhouettes.sprite_pos
+		for pos in [(128, 128), (0, 0), (255, 255), (40, 200)]:
+			pixel = im.getpixel((x + pos[0], y + pos[1]))
+			if sprite.getpixel(pos)[3] > 0:
+				self.assertEqual(pixel, (0, 0, 0, 255))
+			else:
+				self.assertNotEqual(pixel, (0, 0, 0, 255))
+
+	def test_build_all(self):
+		self.assertEqual(silhouettes.build_all([1, 4]), 2)
+		self.assertEqual(silhouettes.build_all([1, 4, 7]), 1)
+		self.assertEqual(
+			sorted(p.name for p in Path(self.tmp.name).iterdir()),
+			["1.png", "4.png", "7.png"]
+		)
+		self.assertEqual(
+			Image.open(silhouettes.path(4)).tobytes(),
+			silhouettes.render(4).tobytes()
+		)
+
+	def test_get(self):
+		path = self.loop.run_until_complete(silhouettes.get(25))
+		self.assertEqual(path, silhouettes.path(25))
+		self.assertTrue(path.exists())
+
+	def test_build_permissions(self):
+		path = silhouettes.build(1)
+		self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o644 & ~silhouettes._umask)
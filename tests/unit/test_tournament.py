@@ -0,0 +1,85 @@
+import unittest
+import asyncio
+import battleapi
+import headless
+import metrics
+import tournament
+from fakeapi import FakeBattleApi
+
+
+def result(
+	strategies: list[str], winner: int, rounds: int = 10
+) -> headless.HeadlessResult:
+	return headless.HeadlessResult(
+		bid=0,
+		strategies=strategies,
+		winner=winner,
+		rounds=rounds,
+		duration=1,
+		decision_time=[0.1, 0.2]
+	)
+
+
+class TestTournament(unittest.TestCase):
+
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.original_client = battleapi.client
+
+	def tearDown(self):
+		self.loop.run_until_complete(battleapi.client.close())
+		self.loop.close()
+		battleapi.client = self.original_client
+
+	def test_schedule(self):
+		matchups = tournament.schedule(["a", "b", "c"], 4)
+		self.assertEqual(len(matchups), 12)
+		self.assertEqual(matchups.count(("a", "b")), 2)
+		self.assertEqual(matchups.count(("b", "a")), 2)
+		self.assertEqual(matchups.count(("c", "b")), 2)
+
+	def test_tally(self):
+		stats = tournament.tally(
+			[result(["a", "b"], 0),
+				result(["b", "a"], 1),
+				result(["a", "b"], 1)]
+		)
+		self.assertEqual(stats["a"].battles, 3)
+		self.assertEqual(stats["a"].wins, 2)
+		self.assertAlmostEqual(stats["a"].win_rate, 2 / 3)
+		self.assertEqual(stats["b"].average_rounds, 10)
+		self.assertAlmostEqual(stats["a"].average_decision_time, 0.4 / 30)
+		self.assertGreater(stats["a"].elo, tournament.INITIAL_ELO)
+		self.assertAlmostEqual(
+			stats["a"].elo + stats["b"].elo, 2 * tournament.INITIAL_ELO
+		)
+
+	def test_elo(self):
+		self.assertEqual(tournament.expected_score(1500, 1500), 0.5)
+		self.assertAlmostEqual(
+			tournament.expected_score(1600, 1400) + tournament.expected_score(1400, 1600),
+			1
+		)
+		stats = tournament.tally([result(["a", "b"], 0)])
+		self.assertEqual(stats["a"].elo, tournament.INITIAL_ELO + tournament.ELO_K / 2)
+
+	def test_play(self):
+
+		async def go():
+			fake = FakeBattleApi(seed=5)
+			battleapi.client = battleapi.BattleApiClient(
+				[await fake.start()], registry=metrics.Registry()
+			)
+			matchups = tournament.schedule(["simple", "inflicter"], 4)
+			results = await tournament.play(
+				matchups, concurrency=4, level=10, party_size=1
+			)
+			self.assertEqual([r.strategies for r in results], [list(m) for m in matchups])
+			await fake.stop()
+
+		return self.loop.run_until_complete(go())
+
+
+if __name__ == "__main__":
+	unittest.main()
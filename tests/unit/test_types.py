@@ -37,6 +37,25 @@ class TestPkmnTypes(unittest.TestCase):
 	def test_status_condition_parse(self, status: StatusCondition):
 		self.assertEqual(status.value, StatusCondition(status.value).value)
 
+	@given(status_condition_strategy)
+	def test_status_condition_value_keeps_both_parts(self, status: StatusCondition):
+		parsed = StatusCondition(status.value)
+		self.assertEqual(parsed.non_volatile, status.non_volatile)
+		self.assertEqual(parsed.volatile, status.volatile)
+
+	def test_status_condition_value_combined(self):
+		status = StatusCondition(
+			non_volatile=StatusCondition.NonVolatile.burn,
+			volatile=StatusCondition.Volatile.confusion
+		)
+		self.assertEqual(
+			status.value,
+			int(StatusCondition.NonVolatile.burn)
+			| int(StatusCondition.Volatile.confusion) << 3
+		)
+		self.assertNotEqual(status.value, 0)
+		self.assertIn("confused", StatusCondition(status.value).past_tense)
+
 	@given(status_condition_strategy)
 	def test_status_condition_past_tense(self, status: StatusCondition):
 		self.assertFalse(status.past_tense.startswith(","))
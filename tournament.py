@@ -0,0 +1,264 @@
+"""Play every battle strategy against every other battle strategy, and compare how well they do.
+
+Battles are played headlessly, see :mod:`headless`. They can be spread over several processes, and over several battle API backends.
+"""
+from typing import Any, Optional, Sequence
+from dataclasses import dataclass
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import time
+import logging, coloredlogs
+import battle_ai
+import battleapi
+import headless
+
+log = logging.getLogger(__name__)
+coloredlogs.install(level='DEBUG', logger=log)
+
+__exclude_exports__ = set(dir())
+
+INITIAL_ELO = 1500
+ELO_K = 32
+
+
+@dataclass
+class StrategyStats:
+	"""How a battle strategy did in a tournament."""
+
+	name: str
+	battles: int = 0
+	wins: int = 0
+	rounds: int = 0
+	decision_time: float = 0
+	elo: float = INITIAL_ELO
+
+	@property
+	def win_rate(self) -> float:
+		"""Get the fraction of battles that were won."""
+		return self.wins / self.battles if self.battles > 0 else 0
+
+	@property
+	def average_rounds(self) -> float:
+		"""Get the average number of rounds per battle."""
+		return self.rounds / self.battles if self.battles > 0 else 0
+
+	@property
+	def average_decision_time(self) -> float:
+		"""Get the average time it took to pick a turn, in seconds."""
+		return self.decision_time / self.rounds if self.rounds > 0 else 0
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Get the stats, suitable for serializing to JSON."""
+		return {
+			"name": self.name,
+			"battles": self.battles,
+			"wins": self.wins,
+			"win_rate": self.win_rate,
+			"elo": self.elo,
+			"average_rounds": self.average_rounds,
+			"average_decision_time": self.average_decision_time,
+		}
+
+
+def schedule(strategies: Sequence[str], battles_per_pair: int) -> list[tuple[str, str]]:
+	"""Get the matchups to play, so that every strategy plays every other strategy `battles_per_pair` times.
+
+	The strategies take turns being the first team, so that neither one has an advantage from its position.
+	"""
+	matchups = []
+	for a, b in itertools.combinations(strategies, 2):
+		for i in range(battles_per_pair):
+			matchups += [(a, b) if i % 2 == 0 else (b, a)]
+	return matchups
+
+
+def expected_score(rating: float, opponent: float) -> float:
+	"""Get the expected score of a player with `rating` against a player with `opponent` rating, according to the Elo rating system."""
+	return 1 / (1 + 10**((opponent - rating) / 400))
+
+
+def tally(results: Sequence[headless.HeadlessResult]) -> dict[str, StrategyStats]:
+	"""Compute each strategy's stats from the results of a tournament.
+
+	Elo ratings depend on the order that battles are counted in, so `results` should be in the order they were scheduled in.
+	"""
+	stats: dict[str, StrategyStats] = {}
+	for result in results:
+		for name in result.strategies:
+			if name not in stats:
+				stats[name] = StrategyStats(name)
+		for i, name in enumerate(result.strategies):
+			stats[name].battles += 1
+			stats[name].wins += int(result.winner == i)
+			stats[name].rounds += result.rounds
+			stats[name].decision_time += result.decision_time[i]
+		if len(result.strategies) != 2 or result.strategies[0] == result.strategies[1]:
+			continue
+		a, b = [stats[name] for name in result.strategies]
+		expected = expected_score(a.elo, b.elo)
+		score = 1 if result.winner == 0 else 0
+		a.elo += ELO_K * (score - expected)
+		b.elo -= ELO_K * (score - expected)
+	return stats
+
+
+async def play(
+	matchups: Sequence[tuple[str, str]],
+	concurrency: int = 16,
+	level: int = 100,
+	party_size: int = 6
+) -> list[Optional[headless.HeadlessResult]]:
+	"""Play the matchups, with up to `concurrency` battles in progress at the same time.
+
+	:returns: The result of each matchup, in the same order, or `None` for the ones that failed.
+	"""
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def _do(matchup: tuple[str, str]) -> Optional[headless.HeadlessResult]:
+		async with semaphore:
+			try:
+				return await headless.run_random_battle(matchup, level, party_size)
+			except Exception as e:
+				log.error(f"battle {matchup} failed: {e}")
+				return None
+
+	return list(await asyncio.gather(*[_do(m) for m in matchups]))
+
+
+def _play_in_process(
+	matchups: Sequence[tuple[str, str]], base_urls: Optional[list[str]],
+	fake_seed: Optional[int], **kwargs
+) -> list[Optional[headless.HeadlessResult]]:
+
+	async def _main():
+		fake_api = None
+		if fake_seed is not None:
+			import fakeapi
+			fake_api = fakeapi.FakeBattleApi(seed=fake_seed)
+			battleapi.client = battleapi.BattleApiClient([await fake_api.start()])
+		elif base_urls:
+			battleapi.client = battleapi.BattleApiClient(base_urls)
+		try:
+			return await play(matchups, **kwargs)
+		finally:
+			await battleapi.client.close()
+			if fake_api is not None:
+				await fake_api.stop()
+
+	return asyncio.run(_main())
+
+
+def run(
+	strategies: Sequence[str],
+	battles_per_pair: int,
+	processes: int = 1,
+	base_urls: Optional[list[str]] = None,
+	fake: bool = False,
+	**kwargs
+) -> dict[str, StrategyStats]:
+	"""Run a tournament between battle strategies.
+
+	The matchups are split evenly between `processes` worker processes, which each play their share with :func:`play`.
+
+	:param base_urls: The battle API backends to use. Defaults to `BATTLE_API_BASE_URLS`.
+	:param fake: Have each process play against its own in-process fake battle API instead, see :mod:`fakeapi`.
+	:param kwargs: Passed to :func:`play`.
+	:returns: The stats of each strategy, see :func:`tally`.
+	"""
+	matchups = schedule(strategies, battles_per_pair)
+	chunks = [matchups[i::processes] for i in range(processes)]
+	with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+		futures = [
+			pool.submit(
+				_play_in_process, chunk, base_urls, i if fake else None, **kwargs
+			) for i, chunk in enumerate(chunks)
+		]
+		chunk_results = [f.result() for f in futures]
+	# put the results back in the order they were scheduled in
+	results: list[Optional[headless.HeadlessResult]] = [None] * len(matchups)
+	for i, chunk in enumerate(chunk_results):
+		results[i::processes] = chunk
+	failed = sum(r is None for r in results)
+	if failed > 0:
+		log.warning(f"{failed} of {len(results)} battles failed")
+	return tally([r for r in results if r is not None])
+
+
+def format_table(stats: dict[str, StrategyStats]) -> str:
+	"""Format the stats of each strategy as a table, from the highest Elo rating to the lowest."""
+	lines = [
+		f"{'strategy':<16} {'elo':>7} {'win rate':>9} {'battles':>8} {'avg rounds':>11} {'avg decision':>13}"
+	]
+	for s in sorted(stats.values(), key=lambda s: s.elo, reverse=True):
+		lines += [
+			f"{s.name:<16} {s.elo:>7.1f} {s.win_rate:>9.1%} {s.battles:>8} {s.average_rounds:>11.1f} {s.average_decision_time * 1000:>11.3f}ms"
+		]
+	return "\n".join(lines)
+
+
+__all__ = [x for x in dir() if not x.startswith("_") or x not in __exclude_exports__]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument(
+		"strategies",
+		nargs="*",
+		metavar="STRATEGY",
+		help="The battle strategies to compare. Defaults to all of them."
+	)
+	parser.add_argument(
+		"-n",
+		"--battles-per-pair",
+		type=int,
+		default=100,
+		help="Number of battles between each pair of strategies."
+	)
+	parser.add_argument(
+		"-c",
+		"--concurrency",
+		type=int,
+		default=16,
+		help="Maximum number of battles in progress at the same time, in each process."
+	)
+	parser.add_argument("-p", "--processes", type=int, default=1)
+	parser.add_argument("--level", type=int, default=100)
+	parser.add_argument("--party-size", type=int, default=6)
+	parser.add_argument(
+		"--base-url",
+		action="append",
+		help="URL of a battle API backend. Can be given more than once."
+	)
+	parser.add_argument(
+		"--fake",
+		action="store_true",
+		help="Run against an in-process fake battle API in each process, see fakeapi.py."
+	)
+	parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+	parser.add_argument("-v", "--verbose", action="store_true")
+	args = parser.parse_args()
+	if not args.verbose:
+		for name in ["battleapi", "battle_ai", "headless", "fakeapi", "tournament"]:
+			logging.getLogger(name).setLevel(logging.WARNING)
+	strategies = args.strategies or list(battle_ai.strategies)
+	for name in strategies:
+		if name not in battle_ai.strategies:
+			parser.error(f"invalid battle strategy: {name}")
+	start = time.perf_counter()
+	stats = run(
+		strategies,
+		args.battles_per_pair,
+		processes=args.processes,
+		base_urls=args.base_url,
+		fake=args.fake,
+		concurrency=args.concurrency,
+		level=args.level,
+		party_size=args.party_size
+	)
+	if args.json:
+		print(json.dumps([s.to_dict() for s in stats.values()], indent=2))
+	else:
+		print(format_table(stats))
+		print(f"took {time.perf_counter() - start:.1f} seconds")
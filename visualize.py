@@ -1,7 +1,13 @@
 import logging
 from os import name
-from typing import Union
+from typing import Any, Callable, Hashable, Iterable, Optional, Union
+from dataclasses import dataclass, astuple
+import collections
+import hashlib
+import io
+import threading
 from pkmntypes import BattleContext, Pokemon, Stat, StatusCondition
+import config
 
 log = logging.getLogger(__name__)
 from PIL import Image, ImageDraw, ImageFont
@@ -12,25 +18,272 @@ hp_bar_colors = [
 	(255, 203, 5), # yellow
 	(227, 0, 0), # red
 ]
-types_conditions_atlas = Image.open(
-	"./data/images/types-conditions.png"
-) # to avoid unnecessary file operations
+# the index of each elemental type, in the order they appear in on the atlas
+element_type_index = {
+	"Normal": 0,
+	"Fighting": 1,
+	"Flying": 2,
+	"Poison": 3,
+	"Ground": 4,
+	"Rock": 5,
+	"Bug": 6,
+	"Ghost": 7,
+	"Steel": 8,
+	"Fire": 10,
+	"Water": 11,
+	"Grass": 12,
+	"Electric": 13,
+	"Psychic": 14,
+	"Ice": 15,
+	"Dragon": 16,
+	"Dark": 17,
+}
+info_box_scale = 2.75
+
+
+class AssetStore:
+	"""The images and fonts that battle images are built from, each read from disk and decoded only once.
+
+	Assets are loaded the first time they are needed, or all at once with :meth:`preload`. The same images are handed out every time, so they must be copied before they are drawn on.
+	"""
+
+	background_path = "./images/battle-background-hd.png"
+	atlas_path = "./data/images/types-conditions.png"
+	info_box_paths = {
+		False: "./data/images/pkmn_info_box.png",
+		True: "./data/images/pkmn_info_box_opponent.png",
+	}
+	font_path = "./data/fonts/pokemon-gen-4-regular.ttf"
+
+	def __init__(self):
+		self._images: dict[str, Image.Image] = {}
+		self._info_boxes: dict[tuple[bool, float], Image.Image] = {}
+		self._crops: dict[tuple[int, int, int, int], Image.Image] = {}
+		self._fonts: dict[int, ImageFont.FreeTypeFont] = {}
+
+	def image(self, path: str) -> Image.Image:
+		"""Get a decoded image."""
+		im = self._images.get(path)
+		if im is None:
+			im = Image.open(path)
+			# decode it now, which also closes the file
+			im.load()
+			self._images[path] = im
+		return im
+
+	def background(self) -> Image.Image:
+		"""Get the battle background."""
+		return self.image(self.background_path)
+
+	def info_box(self, is_opponent: bool, size: float) -> Image.Image:
+		"""Get the empty info box template, scaled by `size`."""
+		im = self._info_boxes.get((is_opponent, size))
+		if im is None:
+			im = self.image(self.info_box_paths[is_opponent])
+			im = im.resize(
+				(int(im.width * size), int(im.height * size)), Image.Resampling.NEAREST
+			)
+			self._info_boxes[(is_opponent, size)] = im
+		return im
+
+	def atlas_crop(self, box: tuple[int, int, int, int]) -> Image.Image:
+		"""Get a region of the type and status condition atlas."""
+		im = self._crops.get(box)
+		if im is None:
+			im = self.image(self.atlas_path).crop(box)
+			self._crops[box] = im
+		return im
+
+	def font(self, size: int) -> ImageFont.FreeTypeFont:
+		"""Get the battle font at `size`."""
+		font = self._fonts.get(size)
+		if font is None:
+			font = ImageFont.truetype(self.font_path, size)
+			self._fonts[size] = font
+		return font
+
+	def preload(self, size: float = info_box_scale):
+		"""Load everything that battle images with info boxes scaled by `size` are built from."""
+		start_time = time.time()
+		self.background()
+		for is_opponent in self.info_box_paths:
+			self.info_box(is_opponent, size)
+		self.font(int(18 * size))
+		self.font(int(14 * size))
+		for t in element_type_index:
+			get_element_type_img(t)
+		for cond in StatusCondition.NonVolatile:
+			if cond != StatusCondition.NonVolatile.none:
+				get_status_condition_img(StatusCondition(non_volatile=cond))
+		log.info(f"Battle assets loaded in {time.time() - start_time} seconds.")
+
+
+assets = AssetStore()
+
+
+class ImageCache:
+	"""Decoded images, evicting the least recently used ones once all of them together take up more than `max_bytes`.
+
+	The same image is handed out every time, so it must be copied before it is drawn on.
+
+	:param max_bytes: The most bytes of decoded images to keep. 0 disables the cache.
+	"""
+
+	def __init__(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._images: collections.OrderedDict[Hashable,
+												Image.Image] = collections.OrderedDict()
+		# images can be drawn from several render threads at once
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._images)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self._images
+
+	def get_or_load(self, key: Hashable, load: Callable[[], Image.Image]) -> Image.Image:
+		"""Get a cached image, or create it with `load` and cache it."""
+		with self._lock:
+			im = self._images.get(key)
+			if im is not None:
+				self.hits += 1
+				self._images.move_to_end(key)
+				return im
+			self.misses += 1
+		im = load()
+		with self._lock:
+			self._put(key, im)
+		return im
+
+	def stats(self) -> dict[str, int]:
+		"""Get the cache's size and hit rate."""
+		return {
+			"images": len(self._images),
+			"bytes": self.size,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+		}
+
+	def _put(self, key: Hashable, im: Image.Image):
+		if key in self._images or _image_size(im) > self.max_bytes:
+			return
+		self._images[key] = im
+		self.size += _image_size(im)
+		while self.size > self.max_bytes:
+			_, evicted = self._images.popitem(last=False)
+			self.size -= _image_size(evicted)
+			self.evictions += 1
+
+
+def _image_size(im: Image.Image) -> int:
+	return im.width * im.height * len(im.getbands())
+
+
+class SpriteCache(ImageCache):
+	"""Decoded pokemon sprites, keyed by national dex number.
+
+	There are too many sprites to keep all of them in memory, so the least recently used ones are evicted once all of them together take up more than `max_bytes` decoded. Popular species stay cached, and never touch the disk again after their first use.
+	"""
+
+	path = "./images/{natdex}.png"
+
+	def get(self, natdex: int) -> Image.Image:
+		"""Get the sprite of a pokemon, reading it from disk if it isn't cached."""
+		return self.get_or_load(natdex, lambda: self._load(natdex))
+
+	def warm(self, natdexes: Iterable[int]):
+		"""Load sprites ahead of time, for as long as they fit without evicting any others."""
+		for natdex in natdexes:
+			if natdex in self:
+				continue
+			im = self._load(natdex)
+			with self._lock:
+				if self.size + _image_size(im) > self.max_bytes:
+					break
+				self._put(natdex, im)
+
+	def _load(self, natdex: int) -> Image.Image:
+		im = Image.open(self.path.format(natdex=natdex))
+		im.load()
+		return im if im.mode == "RGBA" else im.convert("RGBA")
+
+
+sprites = SpriteCache(config.SPRITE_CACHE_BYTES)
+# layers that battle images are built out of, see visualize_battle
+layers = ImageCache(config.LAYER_CACHE_BYTES)
+
+
+@dataclass(frozen=True)
+class PokemonSnapshot:
+	"""The parts of a pokemon that are shown in a battle image.
+
+	:param status: The pokemon's non-volatile status condition.
+	"""
+
+	name: str
+	natdex: int
+	level: int
+	gender: int
+	current_hp: int
+	max_hp: int
+	status: int = 0
+
+	@classmethod
+	def from_pokemon(cls, pkmn: Pokemon) -> "PokemonSnapshot":
+		"""Take a snapshot of a pokemon."""
+		return cls(
+			name=pkmn.Name,
+			natdex=pkmn.NatDex,
+			level=pkmn.Level,
+			gender=pkmn.Gender,
+			current_hp=pkmn.CurrentHP,
+			max_hp=pkmn.Stats[Stat.Hp],
+			status=int(pkmn.StatusEffects.non_volatile),
+		)
+
+
+@dataclass(frozen=True)
+class BattleSnapshot:
+	"""Everything that is shown in a battle image, from the perspective of one pokemon.
+
+	Unlike a :class:`BattleContext`, this is small and cheap to pickle, so it can be sent to a worker process to be rendered.
+	"""
+
+	pokemon: PokemonSnapshot
+	opponent: PokemonSnapshot
+
+	@classmethod
+	def from_context(cls, ctx: BattleContext) -> "BattleSnapshot":
+		"""Take a snapshot of what a battle context would look like."""
+		return cls(
+			PokemonSnapshot.from_pokemon(ctx.pokemon),
+			PokemonSnapshot.from_pokemon(ctx.opponents[0].pokemon),
+		)
+
+	def digest(self) -> str:
+		"""Get a hash of everything that is shown, which is the same in every process. Snapshots with the same digest look exactly the same."""
+		return hashlib.blake2b(repr(astuple(self)).encode(), digest_size=16).hexdigest()
 
 
 def get_background() -> Image.Image:
 	"""Grab a battle background."""
-	return Image.open("./images/battle-background-hd.png")
+	return assets.background().copy()
 
 
-def offset(pos: tuple[int, int], offset: tuple[int, int]) -> tuple[int, int]:
+def offset(pos: tuple[float, float], offset: tuple[float, float]) -> tuple[float, float]:
 	"""Offset xy coordinates `pos` by `offset`."""
 	x, y = pos
 	x2, y2 = offset
 	return (x + x2, y + y2)
 
 
-def scale(pos: tuple[Union[int, float], Union[int, float]],
-			multiplier: int) -> tuple[int, int]:
+def scale(pos: tuple[float, float], multiplier: float) -> tuple[int, int]:
 	"""Scale xy coordinates `pos` by `multiplier`."""
 	x, y = pos
 	return (round(x * multiplier), round(y * multiplier))
@@ -44,31 +297,10 @@ def get_element_type_img(type: str) -> Image.Image:
 	row_size = 16
 	column_size = 32
 	start_y_px = 0
-	# map the status condition we get from the battle api into
-	# the index of the status condition in the order as they appear
-	# on the image
-	idx = {
-		"Normal": 0,
-		"Fighting": 1,
-		"Flying": 2,
-		"Poison": 3,
-		"Ground": 4,
-		"Rock": 5,
-		"Bug": 6,
-		"Ghost": 7,
-		"Steel": 8,
-		"Fire": 10,
-		"Water": 11,
-		"Grass": 12,
-		"Electric": 13,
-		"Psychic": 14,
-		"Ice": 15,
-		"Dragon": 16,
-		"Dark": 17,
-	}[type]
+	idx = element_type_index[type]
 	x = column_size * (idx % 4)
 	y = start_y_px + (row_size * (idx // 4))
-	return types_conditions_atlas.copy().crop((x, y, x + column_size, y + row_size))
+	return assets.atlas_crop((x, y, x + column_size, y + row_size)).copy()
 
 
 def get_status_condition_img(status: StatusCondition) -> Image.Image:
@@ -94,45 +326,50 @@ def get_status_condition_img(status: StatusCondition) -> Image.Image:
 	x = column_size * (idx % 4)
 	y = start_y_px + (row_size * (idx // 4))
 	shave = 6
-	return types_conditions_atlas.copy().crop(
-		(x + shave, y, x + column_size - shave, y + row_size)
-	)
+	return assets.atlas_crop((x + shave, y, x + column_size - shave, y + row_size)).copy()
 
 
-def render_info_box(pkmn: Pokemon, is_opponent=False, size=1) -> Image.Image:
-	"""Render an info box that is shown in battle for the given pokemon."""
-	text_color = (72, 72, 72)
+def get_pokemon_image(natdex: int) -> Image.Image:
+	"""Get the image of a pokemon, by its national dex number."""
+	return sprites.get(natdex).copy()
+
+
+def _info_box_layout(is_opponent: bool, size: float):
 	if not is_opponent:
-		template = "./data/images/pkmn_info_box.png"
 		name_pos = (34, 12)
 		hp_bar_left, hp_bar_y = (136, 42.4)
 	else:
-		template = "./data/images/pkmn_info_box_opponent.png"
 		name_pos = (8, 12)
 		hp_bar_left, hp_bar_y = (102, 42.4)
 	name_pos = scale(name_pos, size)
 	hp_bar_left, hp_bar_y = scale((hp_bar_left, hp_bar_y), size)
 	hp_bar_width, hp_bar_height = scale((96, 6), size)
 	health_text_pos = scale((136, 51), size)
+	return name_pos, hp_bar_left, hp_bar_y, hp_bar_width, hp_bar_height, health_text_pos
 
-	font_big = ImageFont.truetype(
-		"./data/fonts/pokemon-gen-4-regular.ttf", int(18 * size)
-	)
-	im = Image.open(template)
-	im = im.resize((int(im.width * size), int(im.height * size)), Image.NEAREST)
+
+def _render_info_box_static(
+	pkmn: PokemonSnapshot, is_opponent: bool, size: float
+) -> Image.Image:
+	"""Render the parts of an info box that don't change during a battle."""
+	text_color = (72, 72, 72)
+	name_pos, hp_bar_left, _, hp_bar_width, _, _ = _info_box_layout(is_opponent, size)
+
+	font_big = assets.font(int(18 * size))
+	im = assets.info_box(is_opponent, size).copy()
 	draw = ImageDraw.Draw(im)
-	draw.text(name_pos, pkmn.Name, fill=text_color, font=font_big)
-	if pkmn.Gender > 0:
-		if pkmn.Gender == 1:
+	draw.text(name_pos, pkmn.name, fill=text_color, font=font_big)
+	if pkmn.gender > 0:
+		if pkmn.gender == 1:
 			gender_color = (242, 95, 47)
 			gender_text = "♀"
-		elif pkmn.Gender == 2:
+		elif pkmn.gender == 2:
 			gender_color = (52, 99, 211)
 			gender_text = "♂"
-		w = draw.textlength(pkmn.Name, font=font_big)
+		w = draw.textlength(pkmn.name, font=font_big)
 		draw.text(offset(name_pos, (w, 0)), gender_text, font=font_big, fill=gender_color)
-	font_sm = ImageFont.truetype("./data/fonts/pokemon-gen-4-regular.ttf", int(14 * size))
-	level_text = f"Lv{pkmn.Level}"
+	font_sm = assets.font(int(14 * size))
+	level_text = f"Lv{pkmn.level}"
 	level_text_width = draw.textlength(level_text, font=font_sm)
 	level_pos = offset((hp_bar_left + hp_bar_width, name_pos[1]), (-level_text_width, 0))
 	draw.text(
@@ -141,15 +378,41 @@ def render_info_box(pkmn: Pokemon, is_opponent=False, size=1) -> Image.Image:
 		fill=text_color,
 		font=font_sm,
 	)
+	return im
+
+
+def render_info_box(
+	pkmn: Union[Pokemon, PokemonSnapshot],
+	is_opponent=False,
+	size=1,
+	layer_cache: Optional[ImageCache] = None
+) -> Image.Image:
+	"""Render an info box that is shown in battle for the given pokemon.
 
+	Only the HP bar, HP text and status condition are drawn every time. The rest of the info box is taken from `layer_cache`, which defaults to :data:`layers`.
+	"""
+	if isinstance(pkmn, Pokemon):
+		pkmn = PokemonSnapshot.from_pokemon(pkmn)
+	if layer_cache is None:
+		layer_cache = layers
+	text_color = (72, 72, 72)
+	name_pos, hp_bar_left, hp_bar_y, hp_bar_width, hp_bar_height, health_text_pos = _info_box_layout(
+		is_opponent, size
+	)
+
+	im = layer_cache.get_or_load(
+		("info_box", is_opponent, size, pkmn.name, pkmn.gender, pkmn.level),
+		lambda: _render_info_box_static(pkmn, is_opponent, size)
+	).copy()
+	draw = ImageDraw.Draw(im)
 	if not is_opponent:
 		draw.text(
 			health_text_pos,
-			f"{pkmn.CurrentHP}/{pkmn.Stats[Stat.Hp]}",
+			f"{pkmn.current_hp}/{pkmn.max_hp}",
 			fill=text_color,
-			font=font_sm
+			font=assets.font(int(14 * size))
 		)
-	hp_percent = pkmn.CurrentHP / pkmn.Stats[Stat.Hp]
+	hp_percent = pkmn.current_hp / pkmn.max_hp
 	adjusted_hp_width = int(hp_percent * hp_bar_width)
 	if hp_percent > .5:
 		hp_color = hp_bar_colors[0]
@@ -172,43 +435,113 @@ def render_info_box(pkmn: Pokemon, is_opponent=False, size=1) -> Image.Image:
 	)
 
 	# status conditions
-	if pkmn.StatusEffects.non_volatile > 0:
-		cond = get_status_condition_img(pkmn.StatusEffects)
+	if pkmn.status > 0:
+		cond = get_status_condition_img(
+			StatusCondition(non_volatile=StatusCondition.NonVolatile(pkmn.status))
+		)
 		cond = cond.resize(
-			(int(cond.width * size * 1.5), int(cond.height * size * 1.5)), Image.NEAREST
+			(int(cond.width * size * 1.5), int(cond.height * size * 1.5)),
+			Image.Resampling.NEAREST
 		)
 		status_pos = (name_pos[0], hp_bar_y - 18)
 		im.paste(cond, status_pos, mask=cond)
 	return im
 
 
-def visualize_battle(ctx: BattleContext) -> Image.Image:
-	"""Visualize the battlecontext."""
-	start_time = time.time()
+def _render_scene(natdex: int, opponent_natdex: int) -> Image.Image:
+	"""Render the background with both pokemon on it."""
 	im = get_background()
-	im_pkmn = ctx.pokemon.get_image()
+	im_pkmn = sprites.get(natdex)
 	im.paste(im_pkmn, (350, im.height - im_pkmn.height - 50), im_pkmn)
-	im_opponent = ctx.opponents[0].pokemon.get_image()
+	im_opponent = sprites.get(opponent_natdex)
 	im.paste(im_opponent, (im.width - im_opponent.width - 200, 60), im_opponent)
+	return im
+
+
+def visualize_battle(
+	ctx: Union[BattleContext, BattleSnapshot],
+	layer_cache: Optional[ImageCache] = None
+) -> Image.Image:
+	"""Visualize the battlecontext.
+
+	Frames are built out of layers that only change when a different pokemon is sent out: the background with both pokemon on it, and the static parts of both info boxes. These are taken from `layer_cache`, which defaults to :data:`layers`, so that usually only the HP bars, HP text and status conditions are drawn.
+	"""
+	start_time = time.time()
+	if isinstance(ctx, BattleContext):
+		ctx = BattleSnapshot.from_context(ctx)
+	if layer_cache is None:
+		layer_cache = layers
+	im = layer_cache.get_or_load(
+		("scene", ctx.pokemon.natdex, ctx.opponent.natdex),
+		lambda: _render_scene(ctx.pokemon.natdex, ctx.opponent.natdex)
+	).copy()
 
-	info_box_scale = 2.75
-	info_box = render_info_box(ctx.pokemon, size=info_box_scale)
+	info_box = render_info_box(ctx.pokemon, size=info_box_scale, layer_cache=layer_cache)
 	pkmn_info_box_pos = (im.width - info_box.width, im.height - info_box.height)
 	im.paste(info_box, pkmn_info_box_pos, mask=info_box)
 
 	info_box_opponent = render_info_box(
-		ctx.opponents[0].pokemon, is_opponent=True, size=info_box_scale
-	)
-	pkmn_info_box_pos = (
-		im.width - info_box_opponent.width, im.height - info_box_opponent.height
+		ctx.opponent, is_opponent=True, size=info_box_scale, layer_cache=layer_cache
 	)
 	im.paste(info_box_opponent, (0, 0), mask=info_box_opponent)
 
 	duration = time.time() - start_time
-	log.info(f"Battle visualized in {duration} seconds.")
+	log.debug(f"Battle visualized in {duration} seconds.")
 	return im
 
 
+@dataclass(frozen=True)
+class OutputProfile:
+	"""How battle images are encoded to be sent.
+
+	:param format: The format that PIL encodes to.
+	:param extension: The file extension of that format.
+	:param scale: Resize images by this much before encoding them.
+	:param mode: Convert images to this mode before encoding them. Battle images are opaque, so the alpha channel can be dropped.
+	:param colors: Quantize images to a palette of this many colors. 0 keeps full color.
+	:param options: Passed to :meth:`PIL.Image.Image.save`.
+	"""
+
+	format: str
+	extension: str
+	scale: float = 1
+	mode: Optional[str] = None
+	colors: int = 0
+	options: tuple[tuple[str, Any], ...] = ()
+
+	def encode(self, im: Image.Image) -> bytes:
+		"""Encode an image with this profile."""
+		if self.scale != 1:
+			im = im.resize(scale(im.size, self.scale), Image.Resampling.BILINEAR)
+		if self.mode is not None:
+			im = im.convert(self.mode)
+		if self.colors > 0:
+			im = im.quantize(self.colors, method=Image.Quantize.FASTOCTREE)
+		with io.BytesIO() as data:
+			im.save(data, self.format, **dict(self.options))
+			return data.getvalue()
+
+
+output_profiles = {
+	# full color, lossless
+	"png":
+	OutputProfile("PNG", "png"),
+	# about a sixth of the size of "png", and a fifth of the encode time
+	"palette":
+	OutputProfile("PNG", "png", mode="RGB", colors=256),
+	"webp":
+	OutputProfile("WEBP", "webp", mode="RGB", options=(("quality", 80), )),
+	# half the resolution, for phones
+	"mobile":
+	OutputProfile("WEBP", "webp", scale=0.5, mode="RGB", options=(("quality", 75), )),
+}
+
+
+def encode_snapshot(snapshot: BattleSnapshot, profile: str = "png") -> bytes:
+	"""Visualize a battle snapshot, encoded with one of the :data:`output_profiles`."""
+	return output_profiles[profile].encode(visualize_battle(snapshot))
+
+
 def color_darken(color, amount):
 	"""Darken `color` by `amount`."""
 	return tuple(map(lambda x: min(max(x - amount, 0), 255), color))